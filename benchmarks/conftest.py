@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def fake_compose(monkeypatch: pytest.MonkeyPatch) -> str:
+    """Command running the fake `docker compose`, without latency unless
+    FAKE_COMPOSE_LATENCY is set."""
+
+    monkeypatch.setenv("FAKE_COMPOSE_LATENCY", os.environ.get("FAKE_COMPOSE_LATENCY", "0"))
+    monkeypatch.setenv("FAKE_COMPOSE_SERVICES", "1")
+    return '"{}" "{}"'.format(sys.executable, os.path.join(HERE, "fake_compose.py"))
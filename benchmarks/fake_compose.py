@@ -0,0 +1,37 @@
+"""Stand-in for the `docker compose` executable, used by the benchmarks.
+
+It answers the subcommands used by pytest-docker with canned output after
+sleeping for FAKE_COMPOSE_LATENCY seconds, and pretends that the project
+has FAKE_COMPOSE_SERVICES services named `service0`, `service1`, ...
+each publishing container port 80."""
+
+import json
+import os
+import sys
+import time
+from typing import List
+
+
+def main(argv: List[str]) -> int:
+    time.sleep(float(os.environ.get("FAKE_COMPOSE_LATENCY", "0")))
+    services = ["service{}".format(i) for i in range(int(os.environ.get("FAKE_COMPOSE_SERVICES", "1")))]
+
+    args = list(argv)
+    while args and args[0] in ("-f", "-p"):
+        del args[:2]
+    if not args:
+        return 1
+
+    if args[0] == "port":
+        print("0.0.0.0:{}".format(30000 + services.index(args[1])))
+    elif args[0] == "ps":
+        for port, service in enumerate(services, 30000):
+            publisher = {"URL": "0.0.0.0", "TargetPort": 80, "PublishedPort": port, "Protocol": "tcp"}
+            print(json.dumps({"Service": service, "State": "running", "Health": "", "Publishers": [publisher]}))
+    elif args[0] == "config":
+        print(json.dumps({"services": {service: {"image": "busybox"} for service in services}}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,67 @@
+"""Benchmarks of the plugin's own overhead, against a fake compose executable.
+
+Run them with `pytest -c setup.cfg benchmarks` (requires pytest-benchmark).
+Set FAKE_COMPOSE_LATENCY to simulate a slower Compose CLI."""
+
+from typing import Any
+
+import pytest
+from pytest_docker.plugin import (
+    DockerComposeExecutor,
+    Services,
+    get_cleanup_command,
+    get_docker_services,
+    get_setup_command,
+)
+
+pytest.importorskip("pytest_benchmark")
+
+
+def test_command_assembly(benchmark: Any) -> None:
+    files = ["docker-compose.{}.yml".format(i) for i in range(10)]
+    docker_compose = DockerComposeExecutor("docker compose", files, "pytest123")
+
+    benchmark(docker_compose.command, "up --build --wait")
+
+
+def test_port_for_cache_hit(benchmark: Any, fake_compose: str) -> None:
+    services = Services(DockerComposeExecutor(fake_compose, "docker-compose.yml", "pytest123"))
+    services.port_for("service0", 80)
+
+    assert benchmark(services.port_for, "service0", 80) == 30000
+
+
+def test_port_for_cache_miss(benchmark: Any, fake_compose: str) -> None:
+    docker_compose = DockerComposeExecutor(fake_compose, "docker-compose.yml", "pytest123")
+
+    assert benchmark(lambda: Services(docker_compose).port_for("service0", 80)) == 30000
+
+
+def test_wait_until_responsive_scheduling(benchmark: Any) -> None:
+    services = Services(DockerComposeExecutor("docker compose", "docker-compose.yml", "pytest123"))
+
+    def wait() -> None:
+        attempts = iter(range(100))
+        services.wait_until_responsive(check=lambda: next(attempts) == 99, timeout=60.0, pause=0.0)
+
+    benchmark(wait)
+
+
+@pytest.mark.parametrize("count", [1, 10, 100])
+def test_fixture_overhead(benchmark: Any, fake_compose: str, monkeypatch: pytest.MonkeyPatch, count: int) -> None:
+    """Setup, port lookup of every service and clean-up of a whole stack."""
+
+    monkeypatch.setenv("FAKE_COMPOSE_SERVICES", str(count))
+
+    def session() -> None:
+        with get_docker_services(
+            fake_compose,
+            "docker-compose.yml",
+            "pytest123",
+            get_setup_command(),
+            get_cleanup_command(),
+        ) as services:
+            for index in range(count):
+                services.port_for("service{}".format(index), 80)
+
+    benchmark.pedantic(session, rounds=5, iterations=1)
@@ -1,25 +1,69 @@
+import logging.handlers
+from typing import Any
+
+import attr
 import pytest
 
+from .compose import ComposeModel
+from .engine import DockerEngineClient, DockerEngineError
+from .admission import AdmissionController
+from .ports import PortBroker
+from .probes import HTTPProbe, KafkaProbe, PostgresProbe, Probe, RedisProbe, TCPProbe
+from .events import EventWatcher
+from .timing import RECORDER, Timing
 from .plugin import (
+    BACKGROUND_CLEANUPS,
+    WARMUP_RESULTS,
+    close_prestarted_services,
+    find_failed_cleanups,
+    prestart_services,
+    warmup_services,
     docker_cleanup,
     docker_compose_command,
     docker_compose_file,
     docker_compose_project_name,
+    docker_engine_client,
     docker_ip,
+    docker_reset,
     docker_services,
     docker_setup,
+    docker_stack_services,
+    docker_stacks,
+    docker_warmup,
+    teardown_reused_stacks,
+    ExponentialBackoff,
     Services,
+    WaitStats,
 )
 
 __all__ = [
     "docker_compose_command",
     "docker_compose_file",
     "docker_compose_project_name",
+    "docker_engine_client",
     "docker_ip",
     "docker_setup",
     "docker_cleanup",
+    "docker_reset",
     "docker_services",
+    "docker_stacks",
+    "docker_stack_services",
+    "docker_warmup",
     "Services",
+    "ExponentialBackoff",
+    "WaitStats",
+    "DockerEngineClient",
+    "DockerEngineError",
+    "EventWatcher",
+    "ComposeModel",
+    "PortBroker",
+    "AdmissionController",
+    "Probe",
+    "TCPProbe",
+    "HTTPProbe",
+    "PostgresProbe",
+    "RedisProbe",
+    "KafkaProbe",
 ]
 
 
@@ -34,3 +78,256 @@ def pytest_addoption(parser: pytest.Parser) -> None:
         " For available scopes and descriptions, "
         "   see https://docs.pytest.org/en/6.2.x/fixture.html#fixture-scopes",
     )
+    group.addoption(
+        "--docker-engine-api",
+        action="store_true",
+        default=False,
+        help="Query the Docker daemon directly through its API (DOCKER_HOST or the default"
+        " UNIX socket) for ports and container state instead of running the Compose CLI.",
+    )
+    group.addoption(
+        "--docker-reuse",
+        action="store_true",
+        default=False,
+        help="Keep the Docker Compose stack running after the session and reuse it in the next"
+        " sessions as long as the compose files and build contexts do not change.",
+    )
+    group.addoption(
+        "--docker-reuse-teardown",
+        action="store_true",
+        default=False,
+        help="At the end of the session, tear down all stacks kept running by --docker-reuse.",
+    )
+    group.addoption(
+        "--docker-xdist-shared",
+        action="store_true",
+        default=False,
+        help="Share one Docker Compose stack between all pytest-xdist workers instead of"
+        " starting one stack per worker.",
+    )
+    group.addoption(
+        "--docker-build-cache",
+        action="store_true",
+        default=False,
+        help="Only build the images whose build context or Dockerfile changed since they were"
+        " last built, instead of passing --build for all services.",
+    )
+    group.addoption(
+        "--docker-lazy",
+        action="store_true",
+        default=False,
+        help="Only start a service (and its dependencies) when a test first needs it, through"
+        " Services.port_for or Services.require.",
+    )
+    group.addoption(
+        "--docker-cleanup-background",
+        action="store_true",
+        default=False,
+        help="Run the clean-up commands in a detached background process, so that the session"
+        " does not wait for containers and volumes to be removed.",
+    )
+    group.addoption(
+        "--docker-cleanup-wait",
+        action="store_true",
+        default=False,
+        help="Wait for the clean-up commands to finish (the default), even if"
+        " --docker-cleanup-background is set, e.g. in addopts.",
+    )
+    group.addoption(
+        "--docker-pool-size",
+        type=int,
+        action="store",
+        default=0,
+        help="With a --container-scope narrower than session, keep this many replicas of the"
+        " stack running and lease one to each test, resetting it in the background afterwards.",
+    )
+    group.addoption(
+        "--docker-prestart",
+        action="store_true",
+        default=False,
+        help="Start the stack in a background thread as soon as the session starts, while the"
+        " tests are collected. Only applies to the default fixture values.",
+    )
+    group.addoption(
+        "--docker-durations",
+        type=int,
+        action="store",
+        default=None,
+        metavar="N",
+        help="Show the N slowest compose commands, port lookups and readiness waits (N=0 for all).",
+    )
+    group.addoption(
+        "--docker-trace",
+        action="store",
+        default=None,
+        metavar="PATH",
+        help="Write the timings of all compose commands, port lookups and readiness waits to PATH"
+        " as a JSON trace of spans.",
+    )
+    group.addoption(
+        "--docker-stream-output",
+        action="store_true",
+        default=False,
+        help="Log the output of the setup and clean-up commands line by line to the pytest_docker"
+        " logger while they run (see --log-cli-level), instead of buffering it.",
+    )
+    group.addoption(
+        "--docker-log-file",
+        action="store",
+        default=None,
+        metavar="PATH",
+        help="Stream the output of the setup and clean-up commands to a rotating log file.",
+    )
+    group.addoption(
+        "--docker-parallel-startup",
+        action="store_true",
+        default=False,
+        help="Start the services in waves following their dependencies, each service of a wave"
+        " with its own 'docker compose up --no-deps --wait', instead of a single 'up'.",
+    )
+    group.addoption(
+        "--docker-port-broker",
+        action="store_true",
+        default=False,
+        help="Publish the ports of the services on host ports allocated to the project from a"
+        " host-wide registry, so that several stacks can run on one host.",
+    )
+    group.addoption(
+        "--docker-admission",
+        action="store_true",
+        default=False,
+        help="Wait before starting the stack until the resource limits of its services fit in the memory"
+        " and CPUs left by the stacks started on the host by other sessions.",
+    )
+    group.addoption(
+        "--docker-admission-timeout",
+        type=float,
+        default=600.0,
+        metavar="SECONDS",
+        help="How long to wait for the stack to be admitted with --docker-admission (default: 600).",
+    )
+    group.addoption(
+        "--docker-tmpfs",
+        action="store_true",
+        default=False,
+        help="Mount tmpfs instead of the named volumes of the services, so their data stays in memory.",
+    )
+    group.addoption(
+        "--docker-tmpfs-volume",
+        action="append",
+        default=None,
+        metavar="NAME",
+        help="Mount tmpfs instead of this named volume only (may be repeated).",
+    )
+    group.addoption(
+        "--docker-tmpfs-size",
+        default="512m",
+        metavar="SIZE",
+        help="Size limit of each tmpfs mount with --docker-tmpfs (default: 512m).",
+    )
+    group.addoption(
+        "--docker-warmup",
+        action="store_true",
+        default=False,
+        help="Pull the images of the services concurrently before starting them.",
+    )
+    group.addoption(
+        "--docker-warmup-workers",
+        type=int,
+        default=4,
+        metavar="N",
+        help="Number of images pulled at a time by the warmup (default: 4).",
+    )
+    group.addoption(
+        "--docker-warmup-only",
+        action="store_true",
+        default=False,
+        help="Pull the images of the services and exit without running the tests, e.g. to prime a CI cache.",
+    )
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    path = config.getoption("--docker-log-file", None)
+    if path:
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=10 * 1024 * 1024, backupCount=3)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger = logging.getLogger("pytest_docker")
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+        def close() -> None:
+            logger.removeHandler(handler)
+            handler.close()
+
+        config.add_cleanup(close)
+
+
+def pytest_sessionstart(session: pytest.Session) -> None:
+    RECORDER.clear()
+    config = session.config
+    # The pytest-xdist controller does not run any test, its workers do.
+    controller = getattr(config.option, "dist", "no") != "no" and not hasattr(config, "workerinput")
+    if config.getoption("--docker-warmup-only") and not hasattr(config, "workerinput"):
+        results = warmup_services(config)
+        reporter = config.pluginmanager.get_plugin("terminalreporter")
+        if reporter is not None:
+            write_warmup_report(reporter)
+        failed = [result.image for result in results if result.error is not None]
+        if failed:
+            pytest.exit("Docker warmup failed for {}".format(", ".join(failed)), 1)
+        pytest.exit("Docker warmup done", 0)
+    if config.getoption("--docker-prestart") and not controller:
+        prestart_services(config)
+
+
+def pytest_sessionfinish(session: pytest.Session) -> None:
+    close_prestarted_services()
+    config = session.config
+    if hasattr(config, "workerinput"):
+        # pytest-xdist workers hand their timings over to the controller,
+        # which reports and exports them (see `pytest_testnodedown`).
+        workeroutput = getattr(config, "workeroutput")
+        workeroutput["docker_timings"] = [attr.asdict(timing) for timing in RECORDER.timings()]
+    else:
+        trace = config.getoption("--docker-trace")
+        if trace:
+            RECORDER.export(trace)
+    cache = getattr(session.config, "cache", None)
+    if cache is not None and session.config.getoption("--docker-reuse-teardown"):
+        teardown_reused_stacks(cache)
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node: Any, error: Any) -> None:  # pylint: disable=unused-argument
+    """Collect the timings of a pytest-xdist worker on the controller."""
+
+    timings = getattr(node, "workeroutput", {}).get("docker_timings", [])
+    RECORDER.extend([Timing(**timing) for timing in timings])
+
+
+def write_warmup_report(terminalreporter: Any) -> None:
+    if not WARMUP_RESULTS:
+        return
+    terminalreporter.write_sep("=", "docker warmup")
+    for result in WARMUP_RESULTS:
+        terminalreporter.write_line(result.describe(), red=result.error is not None)
+    size = sum(result.size or 0 for result in WARMUP_RESULTS)
+    terminalreporter.write_line("{} images, {:.1f} MB".format(len(WARMUP_RESULTS), size / 1e6))
+    del WARMUP_RESULTS[:]
+
+
+def pytest_terminal_summary(terminalreporter: Any) -> None:
+    write_warmup_report(terminalreporter)
+    durations = terminalreporter.config.getoption("--docker-durations")
+    if durations is not None:
+        terminalreporter.write_sep("=", "slowest docker durations")
+        for timing in RECORDER.slowest(durations):
+            terminalreporter.write_line("{:.2f}s {}".format(timing.duration, timing.describe()))
+
+    for log in find_failed_cleanups():
+        terminalreporter.write_line("Background Docker clean-up failed, see {}".format(log), yellow=True)
+    for project_name, pid, log in BACKGROUND_CLEANUPS:
+        terminalreporter.write_line(
+            "Cleaning up Docker Compose project {} in the background (PID {}), log: {}".format(project_name, pid, log)
+        )
+    del BACKGROUND_CLEANUPS[:]
@@ -0,0 +1,142 @@
+"""Host-wide admission of Compose projects, so that the stacks started at
+once by several processes fit in the memory and CPUs of the host."""
+
+import os
+import re
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import attr
+
+from .locking import locked_state, pid_alive, user_state_dir
+
+# Resources counted for a service which declares no limit.
+DEFAULT_MEMORY = 256 * 1024**2
+DEFAULT_CPUS = 0.5
+
+UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+
+
+def parse_bytes(value: Any) -> Optional[int]:
+    """Number of bytes of a compose size (536870912, "512m", "1gb"), or None."""
+
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([bkmgt]?)b?\s*$", str(value or ""), re.IGNORECASE)
+    if match is None:
+        return None
+    return int(float(match.group(1)) * UNITS[match.group(2).lower()])
+
+
+def stack_resources(config: Dict[str, Any]) -> Tuple[int, float]:
+    """Memory (in bytes) and CPUs the services of `config` (from `docker
+    compose config --format json`) may use, from their resource limits.
+    Services without a limit count for `DEFAULT_MEMORY` and `DEFAULT_CPUS`,
+    times their number of replicas."""
+
+    memory, cpus = 0, 0.0
+    for service in (config.get("services") or {}).values():
+        deploy = service.get("deploy") or {}
+        limits = (deploy.get("resources") or {}).get("limits") or {}
+        replicas = int(deploy.get("replicas") or service.get("scale") or 1)
+        service_memory = parse_bytes(limits.get("memory") or service.get("mem_limit"))
+        service_cpus = limits.get("cpus") or service.get("cpus")
+        memory += replicas * (service_memory or DEFAULT_MEMORY)
+        cpus += replicas * (float(service_cpus) if service_cpus else DEFAULT_CPUS)
+    return memory, cpus
+
+
+def host_memory() -> int:
+    if hasattr(os, "sysconf"):
+        try:
+            return int(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES"))
+        except (OSError, ValueError):
+            pass
+    return 8 * 1024**3
+
+
+def available_memory() -> Optional[int]:
+    """Memory available to new processes according to the kernel, or None
+    where it cannot be read."""
+
+    try:
+        with open("/proc/meminfo", encoding="ascii") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def default_registry() -> str:
+    return os.path.join(user_state_dir(), "admission.json")
+
+
+@attr.s(frozen=True)
+class AdmissionController:
+    """Admits projects to start as long as the resources of the admitted
+    ones (see `stack_resources`) fit in `memory` bytes and `cpus` (80% of
+    the memory and all the CPUs of the host by default).
+
+    Admissions are kept in a registry shared by the sessions of the user
+    on the host (see `user_state_dir`), protected by a lock, and projects
+    wait for their turn in `acquire`, checking every `interval` seconds. A
+    project is never admitted if the kernel reports less available memory
+    than it needs, but a project alone in the registry is always admitted,
+    whatever its size. The admissions of processes which are gone are
+    dropped."""
+
+    registry: str = attr.ib(factory=default_registry)
+    memory: int = attr.ib(factory=lambda: int(host_memory() * 0.8))
+    cpus: float = attr.ib(factory=lambda: float(os.cpu_count() or 1))
+    timeout: float = attr.ib(default=600.0)
+    interval: float = attr.ib(default=0.5)
+
+    def try_acquire(self, project: str, resources: Tuple[int, float]) -> bool:
+        """Admit `project` if its `(memory, cpus)` fit, without waiting."""
+
+        memory, cpus = resources
+        with locked_state(self.registry) as state:
+            admissions: Dict[str, Dict[str, Any]] = state.setdefault("admissions", {})
+            for name in [name for name, admission in admissions.items() if not pid_alive(admission["pid"])]:
+                del admissions[name]
+            others = [admission for name, admission in admissions.items() if name != project]
+            if others:
+                free = available_memory()
+                fits = [
+                    sum(admission["memory"] for admission in others) + memory <= self.memory,
+                    sum(admission["cpus"] for admission in others) + cpus <= self.cpus,
+                    free is None or memory <= free,
+                ]
+                if not all(fits):
+                    return False
+            admissions[project] = {"memory": memory, "cpus": cpus, "pid": os.getpid()}
+        return True
+
+    def acquire(self, project: str, resources: Tuple[int, float]) -> None:
+        """Wait until `project` is admitted (see `try_acquire`), for at
+        most `timeout` seconds."""
+
+        deadline = time.monotonic() + self.timeout
+        while not self.try_acquire(project, resources):
+            if time.monotonic() >= deadline:
+                raise RuntimeError(
+                    "Timeout reached while waiting for {:.0f} MB of memory and {:g} CPUs for {}.".format(
+                        resources[0] / 1024**2, resources[1], project
+                    )
+                )
+            time.sleep(self.interval)
+
+    def release(self, project: str) -> None:
+        with locked_state(self.registry) as state:
+            state.setdefault("admissions", {}).pop(project, None)
+
+    def hand_over(self, project: str, pid: int) -> None:
+        """Let the process `pid` hold the admission of `project` granted to
+        the current one, e.g. until a clean-up in the background is done."""
+
+        with locked_state(self.registry) as state:
+            admission = state.setdefault("admissions", {}).get(project)
+            if admission is not None and admission["pid"] == os.getpid():
+                admission["pid"] = pid
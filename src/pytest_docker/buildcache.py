@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
+import attr
+
+
+def _translate(pattern: str) -> Pattern[str]:
+    """Translate a `.dockerignore` pattern into a regular expression."""
+
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**", i):
+            # `**/` matches any number of directories, including none.
+            if pattern.startswith("**/", i):
+                regex += "(?:.*/)?"
+                i += 3
+            else:
+                regex += ".*"
+                i += 2
+            continue
+        if char == "*":
+            regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                regex += re.escape(char)
+            else:
+                regex += "[" + pattern[i + 1:end].replace("\\", "\\\\") + "]"
+                i = end
+        else:
+            regex += re.escape(char)
+        i += 1
+    return re.compile(regex + r"\Z")
+
+
+def read_dockerignore(context: str) -> List[Tuple[bool, Pattern[str]]]:
+    """Read the `.dockerignore` file of a build context as a list of
+    `(exception, pattern)` pairs."""
+
+    patterns: List[Tuple[bool, Pattern[str]]] = []
+    try:
+        with open(os.path.join(context, ".dockerignore"), encoding="utf-8") as dockerignore:
+            lines = dockerignore.read().splitlines()
+    except OSError:
+        return patterns
+
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        exception = line.startswith("!")
+        if exception:
+            line = line[1:].strip()
+        line = os.path.normpath(line).replace(os.sep, "/").lstrip("/")
+        patterns.append((exception, _translate(line)))
+    return patterns
+
+
+def is_ignored(path: str, patterns: List[Tuple[bool, Pattern[str]]]) -> bool:
+    """Check whether `path` (relative to the build context, with forward
+    slashes) is excluded from the build context. As with Docker, the last
+    matching pattern wins and a pattern matching a directory matches all
+    of its content."""
+
+    parts = path.split("/")
+    parents = ["/".join(parts[: i + 1]) for i in range(len(parts))]
+    ignored = False
+    for exception, pattern in patterns:
+        if any(pattern.match(parent) for parent in parents):
+            ignored = not exception
+    return ignored
+
+
+@attr.s
+class BuildContextHasher:
+    """Content hash of Docker build contexts.
+
+    File digests are remembered together with the size and modification
+    time of the file, so unchanged files are not read again. `files` can
+    be persisted between sessions for that purpose."""
+
+    files: Dict[str, List[Any]] = attr.ib(factory=dict)
+    _seen: Dict[str, List[Any]] = attr.ib(init=False, factory=dict)
+
+    def file_digest(self, path: str) -> str:
+        stat = os.stat(path)
+        known = self.files.get(path)
+        if known is not None and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            digest: str = known[2]
+        else:
+            sha = hashlib.sha256()
+            with open(path, "rb") as content:
+                for chunk in iter(lambda: content.read(1 << 20), b""):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+        self._seen[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def context_digest(self, context: str, dockerfile: Optional[str] = None, extra: Any = None) -> str:
+        """Hash of the files sent to the daemon for `context`, of the
+        Dockerfile (which may live outside of the context) and of `extra`
+        (e.g. build arguments)."""
+
+        patterns = read_dockerignore(context)
+        prune = not any(exception for exception, _ in patterns)
+        sha = hashlib.sha256()
+        sha.update(json.dumps(extra, sort_keys=True).encode("utf-8"))
+        for root, dirs, files in os.walk(context):
+            relroot = os.path.relpath(root, context).replace(os.sep, "/")
+            relroot = "" if relroot == "." else relroot + "/"
+            dirs.sort()
+            if prune:
+                # Without exceptions, nothing below an ignored directory is sent.
+                dirs[:] = [name for name in dirs if not is_ignored(relroot + name, patterns)]
+            for name in sorted(files):
+                if is_ignored(relroot + name, patterns):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    digest = self.file_digest(path)
+                except OSError:
+                    continue
+                sha.update("{}\0{}\n".format(relroot + name, digest).encode("utf-8"))
+
+        if dockerfile is not None:
+            path = dockerfile if os.path.isabs(dockerfile) else os.path.join(context, dockerfile)
+            if os.path.exists(path):
+                sha.update("Dockerfile\0{}\n".format(self.file_digest(path)).encode("utf-8"))
+        return sha.hexdigest()
+
+    def seen(self) -> Dict[str, List[Any]]:
+        """File digests used since the hasher was created, to be persisted."""
+
+        return dict(self._seen)
@@ -0,0 +1,148 @@
+"""Model of a Compose project, parsed from `docker compose config --format json`."""
+
+import os
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import attr
+
+
+def parse_published_port(port: Any) -> Optional[Tuple[int, int]]:
+    """Return `(container port, host port)` for a port entry of the
+    configuration, or None if the host port is not fixed (ephemeral, a
+    range, or not published at all)."""
+
+    if not isinstance(port, dict):
+        return None
+    target, published = port.get("target"), port.get("published")
+    if target is None or not published or not str(published).isdigit():
+        return None
+    if str(port.get("protocol") or "tcp") != "tcp":
+        return None
+    return int(target), int(published)
+
+
+@attr.s(frozen=True)
+class ComposeModel:
+    """Services of a project with their static published ports,
+    healthchecks, dependencies and build sections. `completions` are the
+    services other services wait on to complete successfully (e.g. a
+    database migration)."""
+
+    config: Dict[str, Any] = attr.ib()
+    names: List[str] = attr.ib()
+    ports: Dict[str, Dict[int, int]] = attr.ib()
+    healthchecks: Dict[str, Dict[str, Any]] = attr.ib()
+    depends_on: Dict[str, List[str]] = attr.ib()
+    builds: Dict[str, Dict[str, Any]] = attr.ib()
+    completions: Set[str] = attr.ib(factory=set)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "ComposeModel":
+        services: Dict[str, Dict[str, Any]] = config.get("services") or {}
+        ports: Dict[str, Dict[int, int]] = {}
+        healthchecks: Dict[str, Dict[str, Any]] = {}
+        depends_on: Dict[str, List[str]] = {}
+        builds: Dict[str, Dict[str, Any]] = {}
+        completions: Set[str] = set()
+        for name, service in services.items():
+            for port in service.get("ports") or []:
+                mapping = parse_published_port(port)
+                if mapping is not None:
+                    ports.setdefault(name, {}).setdefault(*mapping)
+            healthcheck = service.get("healthcheck")
+            if healthcheck and not healthcheck.get("disable"):
+                healthchecks[name] = healthcheck
+            # A list with the short syntax, a dictionary with the long one.
+            depends_on[name] = list(service.get("depends_on") or [])
+            if isinstance(service.get("depends_on"), dict):
+                completions.update(
+                    dependency
+                    for dependency, options in service["depends_on"].items()
+                    if (options or {}).get("condition") == "service_completed_successfully"
+                )
+            build = service.get("build")
+            if build:
+                builds[name] = build if isinstance(build, dict) else {"context": build}
+        return cls(config, list(services), ports, healthchecks, depends_on, builds, completions)
+
+    def dependencies(self, *services: str) -> Set[str]:
+        """Return `services` with all the services they depend on, directly or not."""
+
+        closure: Set[str] = set()
+        pending = list(services)
+        while pending:
+            service = pending.pop()
+            if service in closure:
+                continue
+            closure.add(service)
+            pending.extend(self.depends_on.get(service, []))
+        return closure
+
+    def waves(self, *services: str) -> List[List[str]]:
+        """Split `services` (all of them by default) and their dependencies
+        into waves: each service comes after the waves of all the services
+        it depends on, so the services of one wave can start concurrently."""
+
+        pending = self.dependencies(*(services or self.names))
+        waves: List[List[str]] = []
+        started: Set[str] = set()
+        while pending:
+            wave = sorted(service for service in pending if started.issuperset(self.depends_on.get(service, [])))
+            if not wave:
+                raise ValueError("Circular dependencies between services: {}".format(", ".join(sorted(pending))))
+            waves.append(wave)
+            started.update(wave)
+            pending.difference_update(wave)
+        return waves
+
+
+def files_signature(compose_files: List[str]) -> Optional[Tuple[Any, ...]]:
+    """Size and modification time of the compose files and of the `.env`
+    file next to the first one, or None if a compose file is missing."""
+
+    signature: List[Any] = []
+    try:
+        for compose_file in compose_files:
+            stat = os.stat(compose_file)
+            signature.append((os.path.abspath(compose_file), stat.st_size, stat.st_mtime_ns))
+    except OSError:
+        return None
+    if compose_files:
+        env_file = os.path.join(os.path.dirname(os.path.abspath(compose_files[0])), ".env")
+        try:
+            stat = os.stat(env_file)
+            signature.append((env_file, stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            pass
+    return tuple(signature)
+
+
+@attr.s
+class ComposeModelCache:
+    """Models by compose command line, valid as long as the compose files
+    are not modified."""
+
+    _models: Dict[Tuple[str, ...], Tuple[Tuple[Any, ...], ComposeModel]] = attr.ib(factory=dict)
+    _lock: threading.Lock = attr.ib(factory=threading.Lock, repr=False, eq=False)
+
+    def get(self, key: Tuple[str, ...], signature: Optional[Tuple[Any, ...]]) -> Optional[ComposeModel]:
+        with self._lock:
+            cached = self._models.get(key)
+        if cached is None or signature is None or cached[0] != signature:
+            return None
+        return cached[1]
+
+    def put(self, key: Tuple[str, ...], signature: Optional[Tuple[Any, ...]], model: ComposeModel) -> None:
+        if signature is None:
+            return
+        with self._lock:
+            self._models[key] = (signature, model)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+
+# Models loaded during the session.
+MODELS = ComposeModelCache()
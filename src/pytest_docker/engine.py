@@ -0,0 +1,186 @@
+import http.client
+import json
+import os
+import socket
+import ssl
+import threading
+from typing import Any, Dict, List, Optional, Set, Union
+from urllib.parse import quote, urlencode, urlsplit
+
+import attr
+
+PROJECT_LABEL = "com.docker.compose.project"
+SERVICE_LABEL = "com.docker.compose.service"
+
+
+class DockerEngineError(Exception):
+    """The Docker daemon answered a request with an error."""
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a UNIX domain socket."""
+
+    def __init__(self, socket_path: str, timeout: Optional[float] = None) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self._socket_path = socket_path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)  # type: ignore[attr-defined,unused-ignore]
+        sock.settimeout(self.timeout)
+        sock.connect(self._socket_path)
+        self.sock = sock
+
+
+def _tls_context() -> Optional[ssl.SSLContext]:
+    if not os.environ.get("DOCKER_TLS_VERIFY"):
+        return None
+    cert_path = os.environ.get("DOCKER_CERT_PATH", os.path.join(os.path.expanduser("~"), ".docker"))
+    context = ssl.create_default_context(cafile=os.path.join(cert_path, "ca.pem"))
+    context.load_cert_chain(os.path.join(cert_path, "cert.pem"), os.path.join(cert_path, "key.pem"))
+    return context
+
+
+@attr.s(frozen=True)
+class DockerEngineClient:
+    """Minimal client for the Docker Engine API.
+
+    Each thread keeps one persistent HTTP connection to the daemon, so
+    repeated queries do not pay for a new process or a new connection.
+    `close` closes the connections of all the threads."""
+
+    _base_url: str = attr.ib()
+    _timeout: float = attr.ib(default=30.0)
+    _local: threading.local = attr.ib(init=False, factory=threading.local, repr=False, eq=False)
+    _connections: Set[http.client.HTTPConnection] = attr.ib(init=False, factory=set, repr=False, eq=False)
+    _lock: threading.Lock = attr.ib(init=False, factory=threading.Lock, repr=False, eq=False)
+
+    @classmethod
+    def from_env(cls) -> "DockerEngineClient":
+        """Build a client for the daemon designated by ``DOCKER_HOST``."""
+
+        return cls(os.environ.get("DOCKER_HOST", "").strip() or "unix:///var/run/docker.sock")
+
+    def _connect(self) -> http.client.HTTPConnection:
+        url = urlsplit(self._base_url)
+        if url.scheme == "unix":
+            return UnixHTTPConnection(url.path, timeout=self._timeout)
+        if url.scheme in ("tcp", "http", "https"):
+            context = _tls_context()
+            if context is not None or url.scheme == "https":
+                return http.client.HTTPSConnection(url.netloc, timeout=self._timeout, context=context)
+            return http.client.HTTPConnection(url.netloc, timeout=self._timeout)
+        raise ValueError('Unsupported Docker host "{}".'.format(self._base_url))
+
+    def _connection(self) -> http.client.HTTPConnection:
+        connection: Optional[http.client.HTTPConnection] = getattr(self._local, "connection", None)
+        with self._lock:
+            # The connection of the thread is gone if `close` was called.
+            if connection is None or connection not in self._connections:
+                connection = self._connect()
+                self._connections.add(connection)
+        self._local.connection = connection
+        return connection
+
+    def _discard(self, connection: http.client.HTTPConnection) -> None:
+        with self._lock:
+            self._connections.discard(connection)
+        connection.close()
+
+    def close(self) -> None:
+        """Close the connections opened by every thread."""
+
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for connection in connections:
+            connection.close()
+
+    def request(self, method: str, path: str, query: Optional[Dict[str, Any]] = None) -> Any:
+        """Send a request and return the decoded JSON answer (or the plain
+        text for non-JSON answers)."""
+
+        if query:
+            path += "?" + urlencode(query)
+
+        # A kept-alive connection may have been closed by the daemon in the
+        # meantime, so retry once on a fresh connection.
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request(method, path, headers={"Host": "docker"})
+                response = connection.getresponse()
+                body = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                self._discard(connection)
+                if attempt:
+                    raise
+
+        if response.status >= 400:
+            raise DockerEngineError(
+                'Request {} {} returned {}: """{}""".'.format(method, path, response.status, body.decode("utf-8"))
+            )
+        if not response.getheader("Content-Type", "").startswith("application/json"):
+            return body.decode("utf-8")
+        return json.loads(body.decode("utf-8"))
+
+    def ping(self) -> bool:
+        try:
+            self.request("GET", "/_ping")
+        except (DockerEngineError, OSError, http.client.HTTPException):
+            return False
+        return True
+
+    def containers(
+        self, project: str, service: Optional[str] = None, include_stopped: bool = False
+    ) -> List[Dict[str, Any]]:
+        """List the containers of a compose project, optionally only of one service."""
+
+        labels = ["{}={}".format(PROJECT_LABEL, project)]
+        if service is not None:
+            labels.append("{}={}".format(SERVICE_LABEL, service))
+        query: Dict[str, Union[str, int]] = {"filters": json.dumps({"label": labels})}
+        if include_stopped:
+            query["all"] = 1
+        containers: List[Dict[str, Any]] = self.request("GET", "/containers/json", query)
+        return containers
+
+    def inspect(self, container_id: str) -> Dict[str, Any]:
+        details: Dict[str, Any] = self.request("GET", "/containers/{}/json".format(quote(container_id)))
+        return details
+
+    def published_ports(self, project: str) -> Dict[str, Dict[int, int]]:
+        """Return the published ports of every running service of a project,
+        as ``{service: {container_port: host_port}}``."""
+
+        ports: Dict[str, Dict[int, int]] = {}
+        for container in self.containers(project):
+            service = container.get("Labels", {}).get(SERVICE_LABEL)
+            if service is None:
+                continue
+            for port in container.get("Ports") or []:
+                if port.get("PublicPort") and port.get("Type", "tcp") == "tcp":
+                    ports.setdefault(service, {}).setdefault(port["PrivatePort"], port["PublicPort"])
+        return ports
+
+    def port_for(self, project: str, service: str, container_port: int) -> Optional[int]:
+        """Return the host port published for ``container_port`` of ``service``."""
+
+        for container in self.containers(project, service):
+            for port in container.get("Ports") or []:
+                if port.get("PrivatePort") == container_port and port.get("PublicPort"):
+                    return int(port["PublicPort"])
+        return None
+
+    def health(self, project: str, service: str) -> Optional[str]:
+        """Return the health status of the service container, or its state
+        when the container has no healthcheck. ``None`` if there is no container."""
+
+        containers = self.containers(project, service, include_stopped=True)
+        if not containers:
+            return None
+        state = self.inspect(containers[0]["Id"]).get("State", {})
+        health = state.get("Health")
+        if health:
+            return str(health.get("Status"))
+        return str(state.get("Status"))
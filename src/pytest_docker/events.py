@@ -0,0 +1,214 @@
+"""State of the containers of a Compose project, kept up to date from a
+single `docker events` stream instead of polling."""
+
+import json
+import subprocess
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+import attr
+
+from .engine import PROJECT_LABEL, SERVICE_LABEL
+
+# Container state after each event action, see `docker events`.
+ACTION_STATES = {
+    "create": "created",
+    "start": "running",
+    "unpause": "running",
+    "pause": "paused",
+    "die": "exited",
+    "destroy": "removed",
+}
+
+HEALTH_STATUSES = ("starting", "healthy", "unhealthy")
+
+
+def events_command(docker: str, project: str) -> List[str]:
+    """Arguments of a `docker events` stream limited to the containers of `project`."""
+
+    return [
+        docker,
+        "events",
+        "--format",
+        "{{json .}}",
+        "--filter",
+        "type=container",
+        "--filter",
+        "label={}={}".format(PROJECT_LABEL, project),
+    ]
+
+
+@attr.s(eq=False)
+class EventWatcher:
+    """Table of the state and health of each service of a project.
+
+    The table is fed by a `docker events` process started with `start` and
+    read in a background thread. Waiters are woken up on every event, and
+    so are the `threading.Event` triggers registered with `subscribe`. With
+    several containers per service, the last event wins.
+
+    Docker sends no event when a healthcheck starts, so the services with a
+    healthcheck must be known (see `expect_health`) for a freshly started
+    container not to be taken as ready."""
+
+    _args: List[str] = attr.ib()
+    _states: Dict[str, Dict[str, Optional[str]]] = attr.ib(init=False, factory=dict)
+    _condition: threading.Condition = attr.ib(init=False, factory=threading.Condition)
+    _triggers: List[threading.Event] = attr.ib(init=False, factory=list)
+    _healthchecks: Set[str] = attr.ib(init=False, factory=set)
+    _process: Optional["subprocess.Popen[bytes]"] = attr.ib(init=False, default=None)
+    _thread: Optional[threading.Thread] = attr.ib(init=False, default=None)
+    _stopped: bool = attr.ib(init=False, default=False)
+
+    @property
+    def started(self) -> bool:
+        return self._process is not None
+
+    @property
+    def running(self) -> bool:
+        """Whether the event stream is open."""
+        return self._process is not None and not self._stopped
+
+    def start(self) -> None:
+        """Open the event stream, unless it is already open."""
+
+        with self._condition:
+            if self._process is not None:
+                return
+            self._process = subprocess.Popen(  # pylint: disable=consider-using-with
+                self._args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL
+            )
+            self._thread = threading.Thread(target=self._read, args=(self._process,), daemon=True)
+            self._thread.start()
+
+    def _read(self, process: "subprocess.Popen[bytes]") -> None:
+        assert process.stdout is not None
+        try:
+            for line in process.stdout:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                self.apply(event)
+        finally:
+            with self._condition:
+                self._stopped = True
+            self._notify()
+
+    def apply(self, event: Dict[str, Any]) -> None:
+        """Update the table with an event as printed by `docker events --format "{{json .}}"`."""
+
+        attributes = event.get("Actor", {}).get("Attributes", {})
+        service = attributes.get(SERVICE_LABEL)
+        action = event.get("Action") or event.get("status") or ""
+        if not service:
+            return
+
+        with self._condition:
+            state = self._states.setdefault(service, {"state": None, "health": None})
+            if action.startswith("health_status:"):
+                self._healthchecks.add(service)
+                state["state"] = "running"
+                state["health"] = action.split(":", 1)[1].strip()
+            elif action in ACTION_STATES:
+                state["state"] = ACTION_STATES[action]
+                if action == "start" and service in self._healthchecks:
+                    state["health"] = "starting"
+                elif action in ("start", "die", "destroy"):
+                    state["health"] = None
+            else:
+                return
+        self._notify()
+
+    def seed(self, service: str, status: Optional[str]) -> None:
+        """Record the status of `service` found by a query (see
+        `Services.health_status`), unless an event was received already."""
+
+        if status is None:
+            return
+        with self._condition:
+            if service in self._states:
+                return
+            if status in HEALTH_STATUSES:
+                self._healthchecks.add(service)
+                self._states[service] = {"state": "running", "health": status}
+            else:
+                self._states[service] = {"state": status, "health": None}
+        self._notify()
+
+    def expect_health(self, service: str) -> None:
+        """Declare that `service` has a healthcheck."""
+
+        with self._condition:
+            self._healthchecks.add(service)
+
+    def forget(self, service: str) -> None:
+        """Drop the state of `service`, e.g. after restarting it, so that it
+        is queried again instead of trusting events not received yet."""
+
+        with self._condition:
+            self._states.pop(service, None)
+
+    def state(self, service: str) -> Optional[Dict[str, Optional[str]]]:
+        with self._condition:
+            state = self._states.get(service)
+            return dict(state) if state is not None else None
+
+    def known(self, service: str) -> bool:
+        with self._condition:
+            return service in self._states
+
+    def is_healthy(self, service: str) -> bool:
+        """Whether `service` is healthy, or running if it has no healthcheck."""
+
+        with self._condition:
+            state = self._states.get(service)
+            if state is None:
+                return False
+            if state["health"] is not None:
+                return state["health"] == "healthy"
+            return state["state"] == "running"
+
+    def wait_healthy(self, service: str, timeout: float) -> bool:
+        """Block until `service` is healthy. Returns False on timeout or when
+        the event stream is closed before that."""
+
+        with self._condition:
+            self._condition.wait_for(lambda: self.is_healthy(service) or not self.running, timeout)
+            return self.is_healthy(service)
+
+    def subscribe(self, trigger: threading.Event) -> None:
+        """Set `trigger` on every event, e.g. to cut short the pause of
+        `Services.wait_until_responsive`."""
+
+        with self._condition:
+            self._triggers.append(trigger)
+
+    def unsubscribe(self, trigger: threading.Event) -> None:
+        with self._condition:
+            if trigger in self._triggers:
+                self._triggers.remove(trigger)
+
+    def _notify(self) -> None:
+        with self._condition:
+            self._condition.notify_all()
+            for trigger in self._triggers:
+                trigger.set()
+
+    def close(self) -> None:
+        """Stop the event stream."""
+
+        with self._condition:
+            process, thread = self._process, self._thread
+        if process is None:
+            return
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        if thread is not None:
+            thread.join(timeout=5)
+        if process.stdout is not None:
+            process.stdout.close()
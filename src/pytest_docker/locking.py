@@ -0,0 +1,105 @@
+import contextlib
+import getpass
+import json
+import os
+import stat
+import sys
+import tempfile
+import time
+from typing import Any, Dict, IO, Iterator
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+
+def _lock(handle: IO[str]) -> None:
+    if sys.platform == "win32":
+        while True:
+            try:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after 10 attempts, keep waiting.
+                time.sleep(0.1)
+    else:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock(handle: IO[str]) -> None:
+    if sys.platform == "win32":
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def locked_state(path: str) -> Iterator[Dict[str, Any]]:
+    """Hold an exclusive, host-wide lock on the JSON file at `path` and
+    yield its content as a dictionary, which is written back on exit.
+
+    The lock is released by the operating system if the process dies, so
+    a crashed process never blocks the others."""
+
+    flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0)
+    with os.fdopen(os.open(path, flags, 0o600), "r+", encoding="utf-8") as handle:
+        _lock(handle)
+        try:
+            handle.seek(0)
+            content = handle.read()
+            state: Dict[str, Any] = json.loads(content) if content.strip() else {}
+            yield state
+            handle.seek(0)
+            handle.truncate()
+            handle.write(json.dumps(state))
+            handle.flush()
+        finally:
+            _unlock(handle)
+
+
+def pid_alive(pid: int) -> bool:
+    """Check whether a process with the given PID is still running."""
+
+    if sys.platform == "win32":
+        import ctypes  # pylint: disable=import-outside-toplevel
+
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        exit_code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        kernel32.CloseHandle(handle)
+        return exit_code.value == 259  # STILL_ACTIVE
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def user_state_dir() -> str:
+    """Directory of the state files shared by the sessions of the current
+    user on this host: `$XDG_RUNTIME_DIR/pytest-docker` if set, otherwise a
+    directory of the user in the temporary directory. It is only accessible
+    to the user, so other users cannot tamper with its files."""
+
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        path = os.path.join(runtime_dir, "pytest-docker")
+    else:
+        user = str(os.getuid()) if hasattr(os, "getuid") else getpass.getuser()
+        path = os.path.join(tempfile.gettempdir(), "pytest-docker-{}".format(user))
+    os.makedirs(path, mode=0o700, exist_ok=True)
+
+    if hasattr(os, "getuid"):
+        info = os.lstat(path)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+            raise RuntimeError("{} must be a directory only accessible to the current user.".format(path))
+    return path
@@ -1,17 +1,70 @@
+import asyncio
+import collections
+from concurrent.futures import ThreadPoolExecutor, wait
 import contextlib
+import functools
+import glob
+import hashlib
+import inspect
+import json
+import logging
+import math
 import os
 from pathlib import Path
+import queue
+import random
 import re
+import shlex
+import shutil
 import subprocess
+import sys
+import threading
 import time
 import timeit
-from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import warnings
+from typing import (
+    Any,
+    Callable,
+    ContextManager,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+from urllib.parse import quote
 
 import attr
 import pytest
 from _pytest.config import Config
 from _pytest.fixtures import FixtureRequest
 
+from .admission import AdmissionController, stack_resources
+from .buildcache import BuildContextHasher
+from .compose import MODELS, ComposeModel, files_signature
+from .engine import DockerEngineClient, DockerEngineError
+from .events import EventWatcher, events_command
+from .locking import locked_state, pid_alive, user_state_dir
+from .ports import PortBroker, count_published_ports, override_ports
+from .probes import Probe, TCPProbe
+from .timing import RECORDER
+from .volumes import (
+    checkpoint_volume,
+    copy_volume_command,
+    mounting_services,
+    override_tmpfs,
+    project_volumes,
+)
+from .warmup import WarmupResult, warmup_images
+
+logger = logging.getLogger("pytest_docker")
+
 
 @pytest.fixture
 def container_scope_fixture(request: FixtureRequest) -> Any:
@@ -22,11 +75,22 @@ def containers_scope(fixture_name: str, config: Config) -> Any:  # pylint: disab
     return config.getoption("--container-scope", "session")
 
 
-def execute(command: str, success_codes: Iterable[int] = (0,), ignore_stderr: bool = False) -> Union[bytes, Any]:
-    """Run a shell command."""
+def format_command(command: Union[str, Sequence[str]]) -> str:
+    if isinstance(command, str):
+        return command
+    return shlex.join(command)
+
+
+def execute(
+    command: Union[str, Sequence[str]], success_codes: Iterable[int] = (0,), ignore_stderr: bool = False
+) -> Union[bytes, Any]:
+    """Run a command, given as a list of arguments or as a shell command."""
     try:
         stderr_pipe = subprocess.DEVNULL if ignore_stderr else subprocess.STDOUT
-        output = subprocess.check_output(command, stderr=stderr_pipe, shell=True)
+        if isinstance(command, str):
+            output = subprocess.check_output(command, stderr=stderr_pipe, shell=True)
+        else:
+            output = subprocess.check_output(list(command), stderr=stderr_pipe)
         status = 0
     except subprocess.CalledProcessError as error:
         output = error.output or b""
@@ -35,7 +99,35 @@ def execute(command: str, success_codes: Iterable[int] = (0,), ignore_stderr: bo
 
     if status not in success_codes:
         raise Exception(
-            'Command {} returned {}: """{}""".'.format(command, status, output.decode("utf-8"))
+            'Command {} returned {}: """{}""".'.format(format_command(command), status, output.decode("utf-8"))
+        )
+    return output
+
+
+def execute_streaming(
+    command: Union[str, Sequence[str]], success_codes: Iterable[int] = (0,), tail_lines: int = 100
+) -> bytes:
+    """Run a command, logging its output line by line as it comes instead
+    of buffering all of it. Only the last `tail_lines` lines are kept, for
+    the error message and the return value."""
+
+    tail: Deque[bytes] = collections.deque(maxlen=tail_lines)
+    args: Union[str, List[str]] = command if isinstance(command, str) else list(command)
+    with subprocess.Popen(
+        args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=isinstance(command, str)
+    ) as process:
+        assert process.stdout is not None
+        for line in process.stdout:
+            tail.append(line)
+            logger.info("%s", line.decode("utf-8", "replace").rstrip())
+        status = process.wait()
+
+    output = b"".join(tail)
+    if status not in success_codes:
+        raise Exception(
+            'Command {} returned {}: """{}""".'.format(
+                format_command(command), status, output.decode("utf-8", "replace")
+            )
         )
     return output
 
@@ -62,6 +154,156 @@ def docker_ip() -> Union[str, Any]:
 class Services:
     _docker_compose: Any = attr.ib()
     _services: Dict[Any, Dict[Any, Any]] = attr.ib(init=False, default=attr.Factory(dict))
+    _lazy_commands: List[str] = attr.ib(default=attr.Factory(list), kw_only=True)
+    _started: Set[str] = attr.ib(init=False, default=attr.Factory(set))
+    _model: List[ComposeModel] = attr.ib(init=False, default=attr.Factory(list), eq=False, repr=False)
+    _lock: Any = attr.ib(init=False, default=attr.Factory(threading.RLock), eq=False, repr=False)
+    _events: EventWatcher = attr.ib(init=False, eq=False, repr=False)
+    _checkpoints: Set[str] = attr.ib(factory=set, kw_only=True, eq=False, repr=False)
+
+    @_events.default
+    def _events_default(self) -> EventWatcher:
+        return EventWatcher(events_command(get_docker_command(self._docker_compose), self._docker_compose.project_name))
+
+    @property
+    def docker_compose(self) -> Any:
+        """The `DockerComposeExecutor` of the project."""
+        return self._docker_compose
+
+    @property
+    def events(self) -> EventWatcher:
+        """Container state of the project, kept up to date from a single
+        `docker events` stream opened on first use."""
+
+        if not self._events.started:
+            self._events.start()
+            try:
+                for name in self.model.healthchecks:
+                    self._events.expect_health(name)
+            except Exception:  # pylint: disable=broad-except
+                # No JSON config (Docker Compose V1), rely on the queried status.
+                pass
+        return self._events
+
+    def close(self) -> None:
+        """Stop the event stream, if it was opened, and remove the volumes
+        of the checkpoints."""
+
+        self._events.close()
+        if self._checkpoints:
+            volumes = project_volumes(self.model.config).values()
+            checkpoints = [checkpoint_volume(volume, name) for name in sorted(self._checkpoints) for volume in volumes]
+            docker = get_docker_command(self._docker_compose)
+            execute([docker, "volume", "rm", "--force"] + checkpoints, ignore_stderr=True)
+            self._checkpoints.clear()
+
+    def renew(self) -> "Services":
+        """Return a new handle on the project, without cached ports nor
+        event stream, e.g. once its containers were reset, and stop the
+        event stream of this one. The deferred commands are kept, and so
+        are the checkpoints, which are shared by both handles and removed
+        when either is closed."""
+
+        self._events.close()
+        return Services(self._docker_compose, lazy_commands=self._lazy_commands, checkpoints=self._checkpoints)
+
+    def checkpoint(self, name: str) -> None:
+        """Save the content of the named volumes of the project as
+        checkpoint `name`, e.g. once the databases are seeded, to go back
+        to it with `restore`. The services mounting the volumes are stopped
+        during the copy, so that their files are consistent."""
+
+        self._copy_volumes(name, restore=False)
+        self._checkpoints.add(name)
+
+    def restore(self, name: str) -> None:
+        """Put back the content of the named volumes saved by `checkpoint`
+        and wait for the restarted services to be healthy."""
+
+        if name not in self._checkpoints:
+            raise ValueError('Unknown checkpoint "{}".'.format(name))
+        self._copy_volumes(name, restore=True)
+
+    def _copy_volumes(self, name: str, restore: bool) -> None:
+        volumes = project_volumes(self.model.config)
+        if not volumes:
+            raise ValueError("No named volumes to checkpoint in project {}.".format(self._docker_compose.project_name))
+        services = mounting_services(self.model.config, volumes)
+        docker = get_docker_command(self._docker_compose)
+
+        def copy(volume: str) -> None:
+            checkpoint = checkpoint_volume(volume, name)
+            if restore:
+                execute(copy_volume_command(docker, checkpoint, volume))
+            else:
+                execute([docker, "volume", "create", checkpoint])
+                execute(copy_volume_command(docker, volume, checkpoint))
+
+        with self._lock:
+            self._docker_compose.execute(["stop"] + services)
+            try:
+                with ThreadPoolExecutor(max_workers=len(volumes)) as pool:
+                    for future in [pool.submit(copy, volume) for volume in volumes.values()]:
+                        future.result()
+            finally:
+                self._docker_compose.execute(["start"] + services)
+                # Ephemeral host ports are allocated again on start.
+                for service in services:
+                    self._services.pop(service, None)
+        for service in services:
+            if service in self.model.healthchecks:
+                self._events.forget(service)
+                self.wait_healthy(service)
+
+    def require(self, *services: str) -> None:
+        """Make sure that `services` and the services they depend on are
+        started. Services are started on demand only if the setup was
+        deferred (`--docker-lazy`), otherwise they are already running."""
+
+        if not self._lazy_commands:
+            return
+
+        with self._lock:
+            required = self.dependencies(*services)
+            missing = sorted(required - self._started)
+            if not missing:
+                return
+            for command in self._lazy_commands:
+                self._docker_compose.run_command(shlex.split(command) + missing)
+            self._started.update(required)
+            self.load_ports()
+
+    @property
+    def model(self) -> ComposeModel:
+        """The services of the project as configured in the compose file(s),
+        loaded on first use (see `get_compose_model`)."""
+
+        if not self._model:
+            self._model.append(get_compose_model(self._docker_compose))
+        return self._model[0]
+
+    @property
+    def names(self) -> List[str]:
+        """Names of the services of the project."""
+        return self.model.names
+
+    def config(self) -> Dict[str, Any]:
+        """The compose configuration of the project, as given by `docker compose config`."""
+        return self.model.config
+
+    def ports(self, service: str) -> Dict[int, int]:
+        """Known host ports of `service` by container port: the fixed ones
+        from the compose file(s) and the ones looked up so far."""
+
+        ports = dict(self.model.ports.get(service, {}))
+        ports.update(self._services.get(service, {}))
+        return ports
+
+    def dependencies(self, *services: str) -> Set[str]:
+        """Return `services` with all the services they depend on, directly
+        or not, according to `depends_on` in the compose file(s)."""
+
+        return self.model.dependencies(*services)
 
     def port_for(self, service: str, container_port: int) -> int:
         """Return the "host" port for `service` and `container_port`.
@@ -78,12 +320,39 @@ class Services:
         this method will return 8000 for container_port=80.
         """
 
+        self.require(service)
+
         # Lookup in the cache.
         cache: Optional[int] = self._services.get(service, {}).get(container_port, None)
         if cache is not None:
             return cache
 
-        output = self._docker_compose.execute("port %s %d" % (service, container_port))
+        # Fixed mappings like "8000:80" need no lookup once the model is loaded.
+        model = self._model[0] if self._model else get_loaded_compose_model(self._docker_compose)
+        if model is not None and container_port in model.ports.get(service, {}):
+            match: int = model.ports[service][container_port]
+            self._services.setdefault(service, {})[container_port] = match
+            return match
+
+        with RECORDER.measure(
+            "port", "%s:%d" % (service, container_port), self._docker_compose.project_name, service
+        ):
+            match = self._lookup_port(service, container_port)
+
+        # Store it in cache in case we request it multiple times.
+        self._services.setdefault(service, {})[container_port] = match
+
+        return match
+
+    def _lookup_port(self, service: str, container_port: int) -> int:
+        engine = self._docker_compose.engine
+        if engine is not None:
+            port: Optional[int] = engine.port_for(self._docker_compose.project_name, service, container_port)
+            if port is None:
+                raise ValueError('Could not detect port for "%s:%d".' % (service, container_port))
+            return port
+
+        output = self._docker_compose.execute(["port", service, str(container_port)])
         endpoint = output.strip().decode("utf-8")
         if not endpoint:
             raise ValueError('Could not detect port for "%s:%d".' % (service, container_port))
@@ -93,31 +362,277 @@ class Services:
             endpoint = endpoint.split("\n")[-1]
 
         # Usually, the IP address here is 0.0.0.0, so we don't use it.
-        match = int(endpoint.split(":", 1)[-1])
+        return int(endpoint.split(":", 1)[-1])
 
-        # Store it in cache in case we request it multiple times.
-        self._services.setdefault(service, {})[container_port] = match
+    def load_ports(self) -> None:
+        """Fill the port cache for every service of the project at once.
 
-        return match
+        This needs a single `docker compose ps` call (or one Engine API
+        request) instead of one `docker compose port` call per port. Ports
+        that cannot be resolved this way are still looked up on demand by
+        `port_for`."""
+
+        engine = self._docker_compose.engine
+        if engine is not None:
+            ports = engine.published_ports(self._docker_compose.project_name)
+        else:
+            try:
+                output = self._docker_compose.execute(["ps", "--format", "json"], ignore_stderr=True)
+                ports = parse_published_ports(parse_ps_output(output))
+            except Exception:  # pylint: disable=broad-except
+                # Docker Compose V1 has no JSON output, keep resolving ports lazily.
+                return
+
+        self.cache_ports(ports)
+
+    def cache_ports(self, ports: Dict[str, Dict[int, int]]) -> None:
+        """Add known host ports, as `{service: {container port: host port}}`,
+        to the port cache."""
+
+        for service, mapping in ports.items():
+            cache = self._services.setdefault(service, {})
+            for container_port, host_port in mapping.items():
+                cache.setdefault(container_port, host_port)
+
+    def health_status(self, service: str) -> Optional[str]:
+        """Return the health status of `service` ("starting", "healthy",
+        "unhealthy") or its state ("running", "exited", ...) when it has no
+        healthcheck. Returns None when the service has no container."""
+
+        engine = self._docker_compose.engine
+        if engine is not None:
+            return engine.health(self._docker_compose.project_name, service)
+
+        output = self._docker_compose.execute(["ps", "--all", "--format", "json", service], ignore_stderr=True)
+        containers = parse_ps_output(output)
+        if not containers:
+            return None
+        return str(containers[0].get("Health") or containers[0].get("State"))
+
+    def wait_healthy(self, service: str, timeout: float = 60.0) -> None:
+        """Wait until `service` is healthy, or running if it has no
+        healthcheck. The wait wakes up on container events instead of
+        polling; if the event stream stops, the status is polled instead."""
+
+        self.require(service)
+        events = self.events
+        with RECORDER.measure("wait", service, self._docker_compose.project_name, service):
+            ref = timeit.default_timer()
+            if not events.known(service):
+                events.seed(service, self.health_status(service))
+            if events.wait_healthy(service, timeout):
+                return
+            remaining = timeout - (timeit.default_timer() - ref)
+            if events.running or remaining <= 0:
+                raise Exception("Timeout reached while waiting on service {}!".format(service))
+
+        self.wait_until_responsive(
+            lambda: self.health_status(service) in ("healthy", "running"),
+            timeout=remaining,
+            pause=ExponentialBackoff(),
+            service=service,
+        )
+
+    async def async_wait_healthy(self, service: str, timeout: float = 60.0) -> None:
+        """Same as `wait_healthy`, for use in coroutines."""
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.wait_healthy, service, timeout)
 
     def wait_until_responsive(
         self,
         check: Any,
         timeout: float,
-        pause: float,
+        pause: Union[float, Callable[[int], float]],
         clock: Any = timeit.default_timer,
+        trigger: Optional[threading.Event] = None,
+        service: Optional[str] = None,
+    ) -> "WaitStats":
+        """Wait until a service is responsive.
+
+        `pause` is either a fixed number of seconds between two checks or a
+        polling strategy such as `ExponentialBackoff`, called with the
+        number of failed attempts so far. When a `trigger` event is given,
+        the pause is cut short as soon as the event is set. If the event
+        stream of `events` is open, it is used as the trigger by default, so
+        the check runs again on every container state change. The wait is
+        timed under the `service` name."""
+
+        if trigger is None and self._events.running:
+            trigger = threading.Event()
+            self._events.subscribe(trigger)
+            try:
+                return self.wait_until_responsive(check, timeout, pause, clock, trigger, service)
+            finally:
+                self._events.unsubscribe(trigger)
+
+        with RECORDER.measure("wait", service or "check", self._docker_compose.project_name, service):
+            attempts = 0
+            ref = clock()
+            now = ref
+            while (now - ref) < timeout:
+                attempts += 1
+                if check():
+                    return WaitStats(attempts=attempts, elapsed=clock() - ref)
+                delay = min(pause_for(pause, attempts), timeout - (now - ref))
+                if trigger is None:
+                    time.sleep(delay)
+                elif trigger.wait(delay):
+                    trigger.clear()
+                now = clock()
+
+            raise Exception("Timeout reached while waiting on service!")
+
+    def probe(
+        self, docker_ip: str, service: str, container_port: int, kind: Callable[..., Probe] = TCPProbe, **options: Any
+    ) -> Probe:
+        """Return a probe of `kind` (e.g. `HTTPProbe`, `PostgresProbe`) for
+        `service`, at the host port published for `container_port`.
+        `options` are passed to the probe, e.g. `path` for `HTTPProbe`."""
+
+        return kind(docker_ip, self.port_for(service, container_port), **options)
+
+    def wait_for_probes(
+        self,
+        probes: Dict[str, Probe],
+        timeout: float = 30.0,
+        pause: Union[float, Callable[[int], float]] = 0.1,
     ) -> None:
-        """Wait until a service is responsive."""
+        """Wait until all the `probes`, by service name, succeed, running
+        them concurrently (see `wait_until_responsive`), and close them."""
 
-        ref = clock()
-        now = ref
-        while (now - ref) < timeout:
-            if check():
-                return
-            time.sleep(pause)
-            now = clock()
+        def wait(name: str) -> bool:
+            try:
+                self.wait_until_responsive(probes[name], timeout, pause, service=name)
+            except Exception:  # pylint: disable=broad-except
+                return False
+            return True
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, len(probes))) as pool:
+                responsive = list(pool.map(wait, probes))
+        finally:
+            for probe in probes.values():
+                probe.close()
+        pending = [name for name, ready in zip(probes, responsive) if not ready]
+        if pending:
+            raise Exception("Timeout reached while waiting on services: {}!".format(", ".join(pending)))
+
+    async def wait_until_all_responsive(
+        self,
+        checks: Dict[str, Any],
+        timeout: Union[float, Dict[str, float]],
+        pause: Union[float, Callable[[int], float]],
+    ) -> None:
+        """Wait until all services are responsive, polling them concurrently.
+
+        `checks` maps a service name to its check. A check is either a plain
+        callable, which runs in the default executor, or a coroutine
+        function. `timeout` applies to each check, including a check which
+        hangs, and may be given per service as a dictionary."""
+
+        async def wait(name: str) -> bool:
+            limit = timeout[name] if isinstance(timeout, dict) else timeout
+            loop = asyncio.get_running_loop()
+            with RECORDER.measure("wait", name, self._docker_compose.project_name, name):
+                ref = loop.time()
+                attempts = 0
+                while (loop.time() - ref) < limit:
+                    attempts += 1
+                    try:
+                        # A hanging check must not outlast the timeout.
+                        ready = await asyncio.wait_for(run_check(checks[name]), limit - (loop.time() - ref))
+                    except asyncio.TimeoutError:
+                        return False
+                    if ready:
+                        return True
+                    await asyncio.sleep(max(0.0, min(pause_for(pause, attempts), limit - (loop.time() - ref))))
+            return False
+
+        responsive = await asyncio.gather(*(wait(name) for name in checks))
+        pending = [name for name, ready in zip(checks, responsive) if not ready]
+        if pending:
+            raise Exception("Timeout reached while waiting on services: {}!".format(", ".join(pending)))
+
+
+@attr.s(frozen=True)
+class WaitStats:
+    """How long `Services.wait_until_responsive` waited for a service."""
+
+    attempts: int = attr.ib()
+    elapsed: float = attr.ib()
+
+
+@attr.s(frozen=True)
+class ExponentialBackoff:
+    """Polling strategy whose pause grows after every failed attempt.
+
+    The pause starts at `initial` seconds, is multiplied by `factor` after
+    each attempt up to `maximum` and is randomized by +/- `jitter` (a
+    fraction of the pause) so that many waiters do not poll in lockstep."""
+
+    initial: float = attr.ib(default=0.05)
+    factor: float = attr.ib(default=2.0)
+    maximum: float = attr.ib(default=2.0)
+    jitter: float = attr.ib(default=0.1)
+
+    def __call__(self, attempt: int) -> float:
+        exponent = attempt - 1
+        if self.factor > 1:
+            # Once the maximum is reached, a larger exponent would only overflow.
+            steps = math.log(self.maximum / self.initial, self.factor) if self.maximum > self.initial > 0 else 0
+            exponent = min(exponent, math.ceil(steps))
+        delay = min(self.maximum, self.initial * self.factor**exponent)
+        if self.jitter:
+            delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        return min(self.maximum, delay)
+
+
+def pause_for(pause: Union[float, Callable[[int], float]], attempt: int) -> float:
+    if callable(pause):
+        return pause(attempt)
+    return pause
+
+
+async def run_check(check: Any) -> bool:
+    """Run a readiness check, awaiting it if it is a coroutine function."""
 
-        raise Exception("Timeout reached while waiting on service!")
+    if asyncio.iscoroutinefunction(check):
+        return bool(await check())
+    result = await asyncio.get_running_loop().run_in_executor(None, check)
+    if inspect.isawaitable(result):
+        result = await result
+    return bool(result)
+
+
+def parse_ps_output(output: bytes) -> List[Dict[str, Any]]:
+    """Parse the output of `docker compose ps --format json`.
+
+    Older Compose V2 releases print a single JSON array, newer ones print
+    one JSON object per line."""
+
+    text = output.decode("utf-8").strip()
+    if not text:
+        return []
+    if text.startswith("["):
+        containers: List[Dict[str, Any]] = json.loads(text)
+        return containers
+    return [json.loads(line) for line in text.splitlines() if line.startswith("{")]
+
+
+def parse_published_ports(containers: List[Dict[str, Any]]) -> Dict[str, Dict[int, int]]:
+    """Extract `{service: {container_port: host_port}}` from parsed
+    `docker compose ps` output."""
+
+    ports: Dict[str, Dict[int, int]] = {}
+    for container in containers:
+        service = container.get("Service")
+        if not service:
+            continue
+        for publisher in container.get("Publishers") or []:
+            if publisher.get("PublishedPort") and publisher.get("Protocol", "tcp") == "tcp":
+                ports.setdefault(service, {}).setdefault(publisher["TargetPort"], publisher["PublishedPort"])
+    return ports
 
 
 def str_to_list(arg: Union[str, Path, List[Any], Tuple[Any]]) -> Union[List[Any], Tuple[Any]]:
@@ -126,18 +641,98 @@ def str_to_list(arg: Union[str, Path, List[Any], Tuple[Any]]) -> Union[List[Any]
     return [arg]
 
 
+@functools.lru_cache(maxsize=None)
+def resolve_command(command: str) -> Tuple[str, ...]:
+    """Split a command like "docker compose" into arguments, with the full
+    path of the executable. Resolved once per command and session."""
+
+    args = shlex.split(command)
+    if not args:
+        raise ValueError("Empty command")
+    return (shutil.which(args[0]) or args[0],) + tuple(args[1:])
+
+
+def get_docker_command(docker_compose: "DockerComposeExecutor") -> str:
+    """Path of the `docker` executable going with the compose command."""
+
+    docker = docker_compose.argv([])[0]
+    if os.path.basename(docker).startswith("docker-compose"):
+        docker = resolve_command("docker")[0]
+    return docker
+
+
+def get_compose_model(docker_compose: "DockerComposeExecutor") -> ComposeModel:
+    """Return the model of the project from `docker compose config`. It is
+    parsed once and reused until a compose file changes."""
+
+    key = tuple(docker_compose.argv([]))
+    signature = files_signature(docker_compose.compose_files)
+    model = MODELS.get(key, signature)
+    if model is None:
+        output = docker_compose.execute(["config", "--format", "json"], ignore_stderr=True)
+        model = ComposeModel.from_config(json.loads(output))
+        MODELS.put(key, signature, model)
+    return model
+
+
+def get_loaded_compose_model(docker_compose: "DockerComposeExecutor") -> Optional[ComposeModel]:
+    """Return the model of the project if it was loaded already."""
+
+    return MODELS.get(tuple(docker_compose.argv([])), files_signature(docker_compose.compose_files))
+
+
 @attr.s(frozen=True)
 class DockerComposeExecutor:
     _compose_command: str = attr.ib()
     _compose_files: Any = attr.ib(converter=str_to_list)
     _compose_project_name: str = attr.ib()
+    _engine: Optional[DockerEngineClient] = attr.ib(default=None, kw_only=True)
+    _stream_output: bool = attr.ib(default=False, kw_only=True)
+
+    @property
+    def compose_command(self) -> str:
+        return self._compose_command
+
+    @property
+    def compose_files(self) -> List[str]:
+        return [str(compose_file) for compose_file in self._compose_files]
+
+    @property
+    def project_name(self) -> str:
+        return self._compose_project_name
+
+    @property
+    def engine(self) -> Optional[DockerEngineClient]:
+        """Docker Engine API client used for queries instead of the CLI, if any."""
+        return self._engine
+
+    def argv(self, subcommand: Union[str, Sequence[str]]) -> List[str]:
+        """Return the arguments running `subcommand` for the project. A string
+        `subcommand` is split like a shell would."""
 
-    def execute(self, subcommand: str, **kwargs: Any) -> Union[bytes, Any]:
-        command = self._compose_command
+        args = list(resolve_command(self._compose_command))
         for compose_file in self._compose_files:
-            command += ' -f "{}"'.format(compose_file)
-        command += ' -p "{}" {}'.format(self._compose_project_name, subcommand)
-        return execute(command, **kwargs)
+            args += ["-f", str(compose_file)]
+        args += ["-p", self._compose_project_name]
+        return args + (shlex.split(subcommand) if isinstance(subcommand, str) else list(subcommand))
+
+    def command(self, subcommand: Union[str, Sequence[str]]) -> str:
+        """Return the full command running `subcommand` for the project, quoted for display."""
+
+        return shlex.join(self.argv(subcommand))
+
+    def execute(self, subcommand: Union[str, Sequence[str]], **kwargs: Any) -> Union[bytes, Any]:
+        with RECORDER.measure("command", format_command(subcommand), self._compose_project_name):
+            return execute(self.argv(subcommand), **kwargs)
+
+    def run_command(self, subcommand: Union[str, Sequence[str]]) -> Union[bytes, Any]:
+        """Run a setup or clean-up command. Its output is streamed to the
+        `pytest_docker` logger if enabled, otherwise it is buffered."""
+
+        if not self._stream_output:
+            return self.execute(subcommand)
+        with RECORDER.measure("command", format_command(subcommand), self._compose_project_name):
+            return execute_streaming(self.argv(subcommand))
 
 
 @pytest.fixture(scope=containers_scope)
@@ -149,20 +744,55 @@ def docker_compose_command() -> str:
     return "docker compose"
 
 
+@pytest.fixture(scope=containers_scope)
+def docker_engine_client(pytestconfig: Any) -> Iterator[Optional[DockerEngineClient]]:
+    """Docker Engine API client used for port lookups and container
+    inspection instead of spawning the Compose CLI. Disabled unless
+    `--docker-engine-api` is given; `up` and `down` always use the CLI."""
+
+    if not pytestconfig.getoption("--docker-engine-api", False):
+        yield None
+        return
+
+    client = DockerEngineClient.from_env()
+    try:
+        yield client
+    finally:
+        client.close()
+
+
+def get_compose_file(config: Any) -> Union[List[str], str]:
+    return os.path.join(str(config.rootdir), "tests", "docker-compose.yml")
+
+
 @pytest.fixture(scope=containers_scope)
 def docker_compose_file(pytestconfig: Any) -> Union[List[str], str]:
     """Get an absolute path to the  `docker-compose.yml` file. Override this
     fixture in your tests if you need a custom location."""
 
-    return os.path.join(str(pytestconfig.rootdir), "tests", "docker-compose.yml")
+    return get_compose_file(pytestconfig)
+
+
+def get_compose_project_name(config: Any) -> str:
+    if config.getoption("--docker-reuse", False):
+        return "pytest{}".format(hashlib.sha1(str(config.rootdir).encode("utf-8")).hexdigest()[:8])
+    # All pytest-xdist workers of a test run share the same run id.
+    testrunuid = os.environ.get("PYTEST_XDIST_TESTRUNUID")
+    if testrunuid and config.getoption("--docker-xdist-shared", False):
+        return "pytest{}".format(testrunuid[:12])
+    return "pytest{}".format(os.getpid())
 
 
 @pytest.fixture(scope=containers_scope)
-def docker_compose_project_name() -> str:
+def docker_compose_project_name(pytestconfig: Any) -> str:
     """Generate a project name using the current process PID. Override this
-    fixture in your tests if you need a particular project name."""
+    fixture in your tests if you need a particular project name.
 
-    return "pytest{}".format(os.getpid())
+    With `--docker-reuse`, the name is derived from the root directory
+    instead, so that the next session finds the same stack. With
+    `--docker-xdist-shared`, all pytest-xdist workers get the same name."""
+
+    return get_compose_project_name(pytestconfig)
 
 
 def get_cleanup_command() -> Union[List[str], str]:
@@ -191,6 +821,514 @@ def docker_setup() -> Union[List[str], str]:
     return get_setup_command()
 
 
+REUSE_CACHE_KEY = "docker/reuse"
+# File digests of the build contexts, so unchanged files are not read again.
+REUSE_FILES_CACHE_KEY = "docker/reuse-files"
+
+
+def get_stack_key(docker_compose: DockerComposeExecutor, hasher: Optional[BuildContextHasher] = None) -> str:
+    """Hash identifying a stack: its project name, its compose files and
+    the build contexts of its services (see `BuildContextHasher`)."""
+
+    hasher = hasher or BuildContextHasher()
+    digest = hashlib.sha256()
+    digest.update(docker_compose.project_name.encode("utf-8"))
+    for compose_file in docker_compose.compose_files:
+        digest.update(compose_file.encode("utf-8"))
+        with open(compose_file, "rb") as compose:
+            digest.update(compose.read())
+
+    builds: List[Tuple[str, str, Any]]
+    try:
+        builds = [
+            (build["context"], build.get("dockerfile", "Dockerfile"), build)
+            for build in get_compose_model(docker_compose).builds.values()
+        ]
+    except Exception:  # pylint: disable=broad-except
+        # Without a JSON config (Docker Compose V1), the directories of the
+        # compose files are the best guess for the build contexts.
+        directories = {os.path.dirname(os.path.abspath(compose_file)) for compose_file in docker_compose.compose_files}
+        builds = [(directory, "Dockerfile", None) for directory in directories]
+
+    for context, dockerfile, extra in sorted(builds, key=lambda build: build[0]):
+        if os.path.isdir(context):
+            digest.update(hasher.context_digest(context, dockerfile, extra=extra).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def is_stack_running(docker_compose: DockerComposeExecutor) -> bool:
+    """Check that every container of the project is up (and healthy, if it
+    has a healthcheck) or has exited successfully."""
+
+    try:
+        containers = parse_ps_output(docker_compose.execute(["ps", "--all", "--format", "json"], ignore_stderr=True))
+    except Exception:  # pylint: disable=broad-except
+        return False
+
+    for container in containers:
+        if container.get("State") == "exited" and container.get("ExitCode") == 0:
+            continue
+        if container.get("State") != "running" or container.get("Health") not in (None, "", "healthy"):
+            return False
+    return bool(containers)
+
+
+def teardown_reused_stacks(cache: Any) -> None:
+    """Run the clean-up commands of all stacks left running by `--docker-reuse`."""
+
+    stacks: Dict[str, Dict[str, Any]] = cache.get(REUSE_CACHE_KEY, {})
+    for project_name, stack in list(stacks.items()):
+        docker_compose = DockerComposeExecutor(stack["compose_command"], stack["compose_files"], project_name)
+        for command in stack["cleanup"]:
+            docker_compose.execute(command)
+        del stacks[project_name]
+        cache.set(REUSE_CACHE_KEY, stacks)
+
+
+def commands_list(commands: Union[List[str], str]) -> List[str]:
+    """Maintain backwards compatibility with the string format."""
+
+    if not commands:
+        return []
+    if isinstance(commands, str):
+        return [commands]
+    return list(commands)
+
+
+BUILD_CACHE_KEY = "docker/build"
+
+
+def image_id(docker_compose: DockerComposeExecutor, image: str) -> Optional[str]:
+    """ID of `image` (a name or an ID), or None if there is no such image."""
+
+    engine = docker_compose.engine
+    if engine is not None:
+        try:
+            found: str = engine.request("GET", "/images/{}/json".format(quote(image, safe="")))["Id"]
+        except DockerEngineError:
+            return None
+        return found
+
+    docker = get_docker_command(docker_compose)
+    output = execute(
+        [docker, "image", "inspect", "--format", "{{.Id}}", image], success_codes=(0, 1), ignore_stderr=True
+    )
+    return output.decode("utf-8").strip() or None
+
+
+def tag_image(docker_compose: DockerComposeExecutor, source: str, image: str) -> None:
+    """Tag the image `source` (e.g. an ID) as `image`."""
+
+    engine = docker_compose.engine
+    if engine is not None:
+        repository, _, tag = image.rpartition(":")
+        if not repository or "/" in tag:
+            repository, tag = image, "latest"
+        engine.request("POST", "/images/{}/tag".format(quote(source, safe="")), {"repo": repository, "tag": tag})
+        return
+
+    execute([get_docker_command(docker_compose), "tag", source, image])
+
+
+def get_build_digests(
+    docker_compose: DockerComposeExecutor, hasher: BuildContextHasher
+) -> Dict[str, Tuple[str, str, str]]:
+    """Return `{service: (image, key, digest)}` for every service with a
+    build section. The key identifies the service and its build section,
+    whatever the project name, so builds are cached across sessions."""
+
+    model = get_compose_model(docker_compose)
+    digests: Dict[str, Tuple[str, str, str]] = {}
+    for name, build in model.builds.items():
+        image = model.config["services"][name].get("image") or "{}-{}".format(docker_compose.project_name, name)
+        key = hashlib.sha256(json.dumps({"service": name, "build": build}, sort_keys=True).encode("utf-8")).hexdigest()
+        digest = hasher.context_digest(build["context"], build.get("dockerfile", "Dockerfile"), extra=build)
+        digests[name] = (image, key, digest)
+    return digests
+
+
+def build_outdated_images(docker_compose: DockerComposeExecutor, build_cache: Any) -> bool:
+    """Build the images whose build context changed since they were built.
+    Images built by an earlier session, e.g. under another project name,
+    are tagged for this project instead. Returns False if the build
+    contexts are unknown, to let compose decide."""
+
+    state = build_cache.get(BUILD_CACHE_KEY, {})
+    hasher = BuildContextHasher(state.get("files", {}))
+    try:
+        digests = get_build_digests(docker_compose, hasher)
+    except Exception:  # pylint: disable=broad-except
+        # No JSON config (Docker Compose V1).
+        return False
+
+    # Forget the images which were removed since they were built.
+    images: Dict[str, Dict[str, str]] = {
+        key: entry
+        for key, entry in state.get("images", {}).items()
+        if isinstance(entry, dict) and image_id(docker_compose, entry["id"]) == entry["id"]
+    }
+
+    outdated = []
+    for name, (image, key, digest) in sorted(digests.items()):
+        entry = images.get(key)
+        if entry is None or entry["digest"] != digest:
+            outdated.append(name)
+        elif image_id(docker_compose, image) != entry["id"]:
+            tag_image(docker_compose, entry["id"], image)
+    if outdated:
+        docker_compose.run_command(["build"] + outdated)
+
+    for name in outdated:
+        image, key, digest = digests[name]
+        built = image_id(docker_compose, image)
+        if built is not None:
+            images[key] = {"digest": digest, "id": built}
+    build_cache.set(BUILD_CACHE_KEY, {"files": hasher.seen(), "images": images})
+    return True
+
+
+# Options of `docker compose up` followed by a value.
+UP_OPTIONS_WITH_VALUE = (
+    "--attach",
+    "--exit-code-from",
+    "--no-attach",
+    "--pull",
+    "--scale",
+    "-t",
+    "--timeout",
+    "--wait-timeout",
+)
+
+# Options of `docker compose up` only passed to the command creating the containers.
+UP_CREATE_OPTIONS = ("--always-recreate-deps", "--force-recreate", "--renew-anon-volumes", "-V")
+
+
+def split_up_arguments(arguments: List[str]) -> Tuple[List[str], List[str]]:
+    """Split the arguments of `docker compose up` into options and services."""
+
+    options: List[str] = []
+    services: List[str] = []
+    index = 0
+    while index < len(arguments):
+        argument = arguments[index]
+        if not argument.startswith("-"):
+            services.append(argument)
+        elif argument in UP_OPTIONS_WITH_VALUE and index + 1 < len(arguments):
+            options += arguments[index:index + 2]
+            index += 1
+        else:
+            options.append(argument)
+        index += 1
+    return options, services
+
+
+def start_in_waves(
+    docker_compose: DockerComposeExecutor, model: ComposeModel, arguments: List[str], max_workers: Optional[int] = None
+) -> None:
+    """Start services like `docker compose up <arguments>`, but wave by wave
+    (see `ComposeModel.waves`).
+
+    The containers are created first. Then, for each wave, one
+    `up --no-deps --wait <service>` runs concurrently per service, so every
+    wave waits for its own services only. Services that other services wait
+    on to complete (e.g. migrations) are run until they exit instead."""
+
+    options, services = split_up_arguments(arguments)
+    options = [option for option in options if option not in ("-d", "--detach", "--wait")]
+    docker_compose.run_command(["up", "--no-start"] + options + services)
+
+    options = [option for option in options if option not in UP_CREATE_OPTIONS]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for wave in model.waves(*services):
+            futures = []
+            for service in wave:
+                if service in model.completions:
+                    command = ["up", "--no-deps"] + options + ["--exit-code-from", service, service]
+                else:
+                    command = ["up", "--no-deps", "--wait"] + options + [service]
+                futures.append(pool.submit(docker_compose.run_command, command))
+            wait(futures)
+            for future in futures:
+                future.result()
+
+
+def run_setup_command(
+    docker_compose: DockerComposeExecutor,
+    command: str,
+    build_cache: Optional[Any] = None,
+    parallel_startup: bool = False,
+) -> None:
+    """Run a setup command. With a `build_cache`, an `up --build` command only
+    builds the services whose build context changed since their image was
+    built. With `parallel_startup`, an `up` command starts the services in
+    waves following their dependencies (see `start_in_waves`)."""
+
+    tokens = shlex.split(command)
+    if tokens[:1] != ["up"]:
+        docker_compose.run_command(tokens)
+        return
+
+    if "--build" in tokens and build_cache is not None and build_outdated_images(docker_compose, build_cache):
+        tokens.remove("--build")
+
+    if parallel_startup:
+        try:
+            model = get_compose_model(docker_compose)
+        except Exception:  # pylint: disable=broad-except
+            # No JSON config (Docker Compose V1), start everything at once.
+            docker_compose.run_command(tokens)
+            return
+        if "--build" in tokens:
+            tokens.remove("--build")
+            docker_compose.run_command(["build"] + split_up_arguments(tokens[1:])[1])
+        start_in_waves(docker_compose, model, tokens[1:])
+        return
+
+    docker_compose.run_command(tokens)
+
+
+def start_stack(
+    docker_compose: DockerComposeExecutor,
+    docker_setup: Union[List[str], str],
+    docker_cleanup: Union[List[str], str],
+    reuse_cache: Optional[Any] = None,
+    build_cache: Optional[Any] = None,
+    parallel_startup: bool = False,
+) -> None:
+    """Run the setup commands, or attach to a stack kept by `--docker-reuse`."""
+
+    if reuse_cache is None:
+        for command in commands_list(docker_setup):
+            run_setup_command(docker_compose, command, build_cache, parallel_startup)
+        return
+
+    project_name = docker_compose.project_name
+    hasher = BuildContextHasher(reuse_cache.get(REUSE_FILES_CACHE_KEY, {}))
+    key = get_stack_key(docker_compose, hasher)
+    reuse_cache.set(REUSE_FILES_CACHE_KEY, hasher.seen())
+    stacks = reuse_cache.get(REUSE_CACHE_KEY, {})
+    stack = stacks.get(project_name)
+    if stack is not None and stack["key"] == key and is_stack_running(docker_compose):
+        return
+
+    if stack is not None:
+        # Outdated or broken stack, start from scratch.
+        for command in stack["cleanup"]:
+            docker_compose.run_command(command)
+    # Register the stack before starting it, so `--docker-reuse-teardown`
+    # can remove it even if the setup fails half-way.
+    stacks[project_name] = {
+        "key": None,
+        "compose_command": docker_compose.compose_command,
+        "compose_files": docker_compose.compose_files,
+        "cleanup": commands_list(docker_cleanup),
+    }
+    reuse_cache.set(REUSE_CACHE_KEY, stacks)
+
+    for command in commands_list(docker_setup):
+        run_setup_command(docker_compose, command, build_cache, parallel_startup)
+    stacks[project_name]["key"] = key
+    reuse_cache.set(REUSE_CACHE_KEY, stacks)
+
+
+# Clean-ups running in the background, as (project name, PID, log path).
+BACKGROUND_CLEANUPS: List[Tuple[str, int, str]] = []
+
+
+def get_cleanup_log(docker_compose_project_name: str) -> str:
+    return os.path.join(user_state_dir(), "{}-cleanup.log".format(docker_compose_project_name))
+
+
+def spawn_cleanup(
+    docker_compose: DockerComposeExecutor,
+    commands: List[str],
+    port_broker: Optional[PortBroker] = None,
+    admission: Optional[AdmissionController] = None,
+) -> Tuple[int, str]:
+    """Run the clean-up `commands` in a detached process which outlives the
+    pytest session, and which releases the ports allocated to the project
+    by `port_broker` and its admission by `admission`, and removes its
+    override compose files, once done. Returns the PID of that process and
+    the path of its log."""
+
+    log = get_cleanup_log(docker_compose.project_name)
+    pidfile = log[: -len(".log")] + ".pid"
+    args = [sys.executable, "-m", "pytest_docker.reaper", "--pidfile", pidfile, "--log", log]
+    args += ["--project", docker_compose.project_name]
+    if port_broker is not None:
+        args += ["--port-registry", port_broker.registry]
+    if admission is not None:
+        args += ["--admission-registry", admission.registry]
+    for path in get_overrides(docker_compose):
+        args += ["--remove", path]
+    args.append("--")
+    args += [json.dumps(docker_compose.argv(command)) for command in commands]
+
+    if sys.platform == "win32":
+        flags = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+        process = subprocess.Popen(  # pylint: disable=consider-using-with
+            args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, creationflags=flags
+        )
+    else:
+        process = subprocess.Popen(  # pylint: disable=consider-using-with
+            args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    # The session may end before the clean-up: the process doing it holds
+    # the ports and the admission of the project until then.
+    if port_broker is not None:
+        port_broker.hand_over(docker_compose.project_name, process.pid)
+    if admission is not None:
+        admission.hand_over(docker_compose.project_name, process.pid)
+    return process.pid, log
+
+
+def find_failed_cleanups() -> List[str]:
+    """Return the logs of finished background clean-ups that failed, and
+    remove the logs of the ones that succeeded. A clean-up succeeded when
+    the last line of its log is "DONE": the output of the commands may
+    contain anything.
+
+    Only the clean-ups of the current user are looked at (see
+    `user_state_dir`). Logs removed in the meantime by another session are
+    skipped. A clean-up whose process is gone without removing its PID file
+    (e.g. killed) is finished, and failed unless its log says otherwise."""
+
+    failed = []
+    for log in sorted(glob.glob(os.path.join(user_state_dir(), "*-cleanup.log"))):
+        pidfile = log[: -len(".log")] + ".pid"
+        pid: Optional[int]
+        try:
+            with open(pidfile, encoding="utf-8") as pid_content:
+                pid = int(pid_content.read())
+        except OSError:
+            pid = None
+        except ValueError:
+            # Being written by a starting clean-up.
+            continue
+        if pid is not None and pid_alive(pid):
+            # Still running.
+            continue
+        try:
+            if pid is not None:
+                os.remove(pidfile)
+            with open(log, "rb") as content:
+                if content.read().splitlines()[-1:] != [b"DONE"]:
+                    failed.append(log)
+                    continue
+            os.remove(log)
+        except OSError:
+            continue
+    return failed
+
+
+def stop_stack(
+    docker_compose: DockerComposeExecutor,
+    docker_cleanup: Union[List[str], str],
+    reuse_cache: Optional[Any] = None,
+    cleanup_in_background: bool = False,
+    port_broker: Optional[PortBroker] = None,
+    admission: Optional[AdmissionController] = None,
+) -> None:
+    """Run the clean-up commands, unless the stack is kept for the next
+    session. Once the clean-up is done, the ports allocated to the project
+    by `port_broker` and its admission by `admission` are released, and
+    the override compose files of the project are removed; by the detached
+    process running it, if `cleanup_in_background` is true."""
+
+    if reuse_cache is not None:
+        return
+
+    commands = commands_list(docker_cleanup)
+    if cleanup_in_background and commands:
+        pid, log = spawn_cleanup(docker_compose, commands, port_broker, admission)
+        BACKGROUND_CLEANUPS.append((docker_compose.project_name, pid, log))
+        return
+
+    try:
+        for command in commands:
+            docker_compose.run_command(command)
+    finally:
+        for path in get_overrides(docker_compose):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    if port_broker is not None:
+        port_broker.release(docker_compose.project_name)
+    if admission is not None:
+        admission.release(docker_compose.project_name)
+
+
+def get_ports_override(docker_compose_project_name: str) -> str:
+    return os.path.join(user_state_dir(), "{}-ports.yml".format(docker_compose_project_name))
+
+
+def write_override(path: str, override: str) -> None:
+    """Write an override compose file, without following a symbolic link."""
+
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_NOFOLLOW", 0)
+    with os.fdopen(os.open(path, flags, 0o600), "w", encoding="utf-8") as compose_file:
+        compose_file.write(override)
+
+
+def get_overrides(docker_compose: DockerComposeExecutor) -> List[str]:
+    """Override compose files written for the project (see `broker_ports`
+    and `mount_tmpfs`), to remove once the project is cleaned up."""
+
+    written = [get_ports_override(docker_compose.project_name), get_tmpfs_override(docker_compose.project_name)]
+    return [path for path in str_to_list(docker_compose.compose_files) if path in written]
+
+
+def broker_ports(
+    docker_compose: DockerComposeExecutor, port_broker: PortBroker
+) -> Tuple[DockerComposeExecutor, Dict[str, Dict[int, int]]]:
+    """Allocate host ports for all the published ports of the project and
+    publish them through an override compose file.
+
+    Returns the executor using that file too, and the allocated ports as
+    `{service: {container port: host port}}`."""
+
+    config = get_compose_model(docker_compose).config
+    count = count_published_ports(config)
+    if not count:
+        return docker_compose, {}
+
+    ports = port_broker.allocate(docker_compose.project_name, count)
+    override, assigned = override_ports(config, ports)
+    path = get_ports_override(docker_compose.project_name)
+    write_override(path, override)
+    return attr.evolve(docker_compose, compose_files=docker_compose.compose_files + [path]), assigned
+
+
+def get_tmpfs_override(docker_compose_project_name: str) -> str:
+    return os.path.join(user_state_dir(), "{}-tmpfs.yml".format(docker_compose_project_name))
+
+
+def mount_tmpfs(
+    docker_compose: DockerComposeExecutor, volumes: Optional[Sequence[str]] = None, size: str = "512m"
+) -> DockerComposeExecutor:
+    """Mount tmpfs instead of the named `volumes` (all of them if None)
+    through an override compose file, and return the executor using it."""
+
+    override = override_tmpfs(get_compose_model(docker_compose).config, volumes, size)
+    if override is None:
+        return docker_compose
+
+    path = get_tmpfs_override(docker_compose.project_name)
+    write_override(path, override)
+    return attr.evolve(docker_compose, compose_files=docker_compose.compose_files + [path])
+
+
+def get_shared_lock(docker_compose_project_name: str) -> str:
+    """Path of the lock file coordinating the processes sharing a stack."""
+
+    return os.path.join(user_state_dir(), "{}.lock".format(docker_compose_project_name))
+
+
 @contextlib.contextmanager
 def get_docker_services(
     docker_compose_command: str,
@@ -198,30 +1336,409 @@ def get_docker_services(
     docker_compose_project_name: str,
     docker_setup: Union[List[str], str],
     docker_cleanup: Union[List[str], str],
+    docker_engine_client: Optional[DockerEngineClient] = None,
+    reuse_cache: Optional[Any] = None,
+    shared_lock: Optional[str] = None,
+    build_cache: Optional[Any] = None,
+    lazy: bool = False,
+    cleanup_in_background: bool = False,
+    stream_output: bool = False,
+    parallel_startup: bool = False,
+    port_broker: Optional[PortBroker] = None,
+    tmpfs_volumes: Union[bool, Sequence[str]] = False,
+    tmpfs_size: str = "512m",
+    admission: Optional[AdmissionController] = None,
 ) -> Iterator[Services]:
+    """Set up the services, yield a `Services` handle and clean them up.
+
+    When `reuse_cache` (a pytest cache) is given, a running stack left over
+    by a previous session is reused if its key still matches, and the
+    stack is left running at the end.
+
+    When `shared_lock` (a lock file path) is given, the stack is shared by
+    all processes using the same lock file: the first one starts it and
+    the last one to leave cleans it up. The PIDs of the processes using
+    the stack are kept in the lock file, so crashed processes are not
+    waited for.
+
+    When `build_cache` (a pytest cache) is given, images whose build
+    context did not change since they were built are not built again.
+
+    When `lazy` is true, the `up` setup commands are deferred: a service
+    is started the first time it is required, with the services it
+    depends on (see `Services.require`).
+
+    When `cleanup_in_background` is true, the clean-up commands run in a
+    detached process, so the session does not wait for them.
+
+    When `stream_output` is true, the output of the setup and clean-up
+    commands is logged line by line to the `pytest_docker` logger.
+
+    When `parallel_startup` is true, `up` setup commands start the services
+    in waves following `depends_on`, each service of a wave on its own.
+
+    With a `port_broker`, the published ports of the services are replaced
+    by host ports allocated to the project (see `broker_ports`), so no
+    command is needed to look them up.
+
+    When `tmpfs_volumes` is true, or a list of volume names, the named
+    volumes (those listed) are replaced by tmpfs mounts of at most
+    `tmpfs_size`, so their data stays in memory (see `mount_tmpfs`).
+
+    With an `admission` controller, the stack is only started once the
+    resource limits of its services fit in what the stacks admitted on the
+    host leave, and it is admitted until it is cleaned up."""
+
     docker_compose = DockerComposeExecutor(
-        docker_compose_command, docker_compose_file, docker_compose_project_name
+        docker_compose_command,
+        docker_compose_file,
+        docker_compose_project_name,
+        engine=docker_engine_client,
+        stream_output=stream_output,
     )
+    if tmpfs_volumes:
+        volumes = None if isinstance(tmpfs_volumes, bool) else list(tmpfs_volumes)
+        docker_compose = mount_tmpfs(docker_compose, volumes, tmpfs_size)
+    brokered_ports: Dict[str, Dict[int, int]] = {}
+    if port_broker is not None:
+        docker_compose, brokered_ports = broker_ports(docker_compose, port_broker)
+
+    lazy_commands: List[str] = []
+    if lazy:
+        lazy_commands = [command for command in commands_list(docker_setup) if command.split()[:1] == ["up"]]
+        docker_setup = [command for command in commands_list(docker_setup) if command not in lazy_commands]
+
+    def start() -> None:
+        if admission is not None:
+            admission.acquire(docker_compose.project_name, stack_resources(get_compose_model(docker_compose).config))
+        try:
+            start_stack(docker_compose, docker_setup, docker_cleanup, reuse_cache, build_cache, parallel_startup)
+        except BaseException:
+            if admission is not None:
+                admission.release(docker_compose.project_name)
+            raise
 
     # setup containers.
-    if docker_setup:
-        # Maintain backwards compatibility with the string format.
-        if isinstance(docker_setup, str):
-            docker_setup = [docker_setup]
-        for command in docker_setup:
-            docker_compose.execute(command)
+    if shared_lock is None:
+        start()
+    else:
+        with locked_state(shared_lock) as state:
+            users = [pid for pid in state.get("users", []) if pid_alive(pid)]
+            if not users:
+                start()
+            state["users"] = users + [os.getpid()]
 
+    services: Optional[Services] = None
     try:
+        services = Services(docker_compose, lazy_commands=lazy_commands)
+        services.cache_ports(brokered_ports)
+        if not lazy_commands and port_broker is None:
+            services.load_ports()
+
         # Let test(s) run.
-        yield Services(docker_compose)
+        yield services
     finally:
         # Clean up.
-        if docker_cleanup:
-            # Maintain backwards compatibility with the string format.
-            if isinstance(docker_cleanup, str):
-                docker_cleanup = [docker_cleanup]
-            for command in docker_cleanup:
-                docker_compose.execute(command)
+        if services is not None:
+            services.close()
+        if shared_lock is None:
+            stop_stack(docker_compose, docker_cleanup, reuse_cache, cleanup_in_background, port_broker, admission)
+        else:
+            with locked_state(shared_lock) as state:
+                users = [pid for pid in state.get("users", []) if pid != os.getpid() and pid_alive(pid)]
+                state["users"] = users
+                if not users:
+                    stop_stack(
+                        docker_compose, docker_cleanup, reuse_cache, cleanup_in_background, port_broker, admission
+                    )
+
+
+def get_services_options(config: Any, docker_compose_project_name: str) -> Dict[str, Any]:
+    """Keyword arguments of `get_docker_services` set by command line options."""
+
+    options: Dict[str, Any] = {}
+    for option, argument in (("--docker-reuse", "reuse_cache"), ("--docker-build-cache", "build_cache")):
+        if config.getoption(option, False):
+            cache = getattr(config, "cache", None)
+            if cache is None:
+                raise pytest.UsageError("{} requires the cacheprovider plugin.".format(option))
+            options[argument] = cache
+
+    if config.getoption("--docker-xdist-shared", False):
+        options["shared_lock"] = get_shared_lock(docker_compose_project_name)
+    if config.getoption("--docker-lazy", False):
+        options["lazy"] = True
+    if config.getoption("--docker-cleanup-background", False) and not config.getoption("--docker-cleanup-wait", False):
+        options["cleanup_in_background"] = True
+    if config.getoption("--docker-stream-output", False) or config.getoption("--docker-log-file", None):
+        options["stream_output"] = True
+    if config.getoption("--docker-parallel-startup", False):
+        options["parallel_startup"] = True
+    if config.getoption("--docker-port-broker", False):
+        options["port_broker"] = PortBroker()
+    tmpfs_volumes = config.getoption("--docker-tmpfs-volume", None)
+    if tmpfs_volumes or config.getoption("--docker-tmpfs", False):
+        options["tmpfs_volumes"] = tmpfs_volumes or True
+        options["tmpfs_size"] = config.getoption("--docker-tmpfs-size", "512m")
+    if config.getoption("--docker-admission", False):
+        options["admission"] = AdmissionController(timeout=config.getoption("--docker-admission-timeout", 600.0))
+    return options
+
+
+@pytest.fixture(scope="session")
+def docker_reset() -> Any:
+    """How a pooled stack (`--docker-pool-size`) is reset after each use:
+    a list of docker compose commands, a callable taking the `Services`
+    handle, or None to run the clean-up and setup commands again. Override
+    this fixture with a cheaper reset if your services allow it."""
+
+    return None
+
+
+@attr.s
+class ServicesPool:
+    """Replicas of a stack kept running and leased to one user at a time.
+
+    After each lease, the replica is reset in the background and becomes
+    available again, so users get an isolated stack without waiting for a
+    full start."""
+
+    _managers: Sequence[ContextManager[Services]] = attr.ib()
+    _docker_setup: Union[List[str], str] = attr.ib()
+    _docker_cleanup: Union[List[str], str] = attr.ib()
+    _reset: Any = attr.ib(default=None)
+    _ready: "queue.Queue[Union[Services, BaseException]]" = attr.ib(init=False, factory=queue.Queue)
+    _pool: ThreadPoolExecutor = attr.ib(init=False)
+
+    @_pool.default
+    def _pool_default(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=max(len(self._managers), 1))
+
+    def start(self) -> None:
+        """Start all replicas concurrently."""
+
+        for services in enter_all(self._pool, dict(enumerate(self._managers))).values():
+            self._ready.put(services)
+
+    @contextlib.contextmanager
+    def lease(self) -> Iterator[Services]:
+        """Wait for a ready replica and hand it out for the duration of the block."""
+
+        services = self._ready.get()
+        if isinstance(services, BaseException):
+            # Keep the error for the other users.
+            self._ready.put(services)
+            raise services
+        try:
+            yield services
+        finally:
+            self._pool.submit(self._refill, services)
+
+    def _refill(self, services: Services) -> None:
+        try:
+            # The reset may restore a checkpoint of the replica (see
+            # `Services.restore`), so the handle is renewed afterwards.
+            if callable(self._reset):
+                self._reset(services)
+            else:
+                commands = self._reset or commands_list(self._docker_cleanup) + commands_list(self._docker_setup)
+                for command in commands_list(commands):
+                    services.docker_compose.run_command(command)
+            refilled = services.renew()
+            refilled.load_ports()
+            self._ready.put(refilled)
+        except Exception as error:  # pylint: disable=broad-except
+            services.close()
+            self._ready.put(error)
+
+    def close(self) -> None:
+        """Wait for pending resets and clean up all replicas concurrently."""
+
+        self._pool.shutdown(wait=True)
+        with ThreadPoolExecutor(max_workers=max(len(self._managers), 1)) as pool:
+            exit_all(pool, self._managers)
+
+
+# Pools of the running session, by project name.
+POOLS: Dict[str, ServicesPool] = {}
+
+
+def get_services_pool(
+    size: int,
+    docker_compose_command: str,
+    docker_compose_file: Union[List[str], str],
+    docker_compose_project_name: str,
+    docker_setup: Union[List[str], str],
+    docker_cleanup: Union[List[str], str],
+    docker_reset: Any = None,
+    **kwargs: Any,
+) -> ServicesPool:
+    """Create and start a pool of `size` replicas of the stack, named after
+    `docker_compose_project_name` with a `-pool<N>` suffix. Other keyword
+    arguments are passed to `get_docker_services`."""
+
+    managers = [
+        get_docker_services(
+            docker_compose_command,
+            docker_compose_file,
+            "{}-pool{}".format(docker_compose_project_name, index),
+            docker_setup,
+            docker_cleanup,
+            **kwargs,
+        )
+        for index in range(size)
+    ]
+    pool = ServicesPool(managers, docker_setup, docker_cleanup, docker_reset)
+    pool.start()
+    return pool
+
+
+@attr.s
+class PrestartedServices:
+    """Services started in a background thread, e.g. while the tests are
+    being collected. `arguments` are the ones given to `get_docker_services`."""
+
+    arguments: Tuple[Any, ...] = attr.ib()
+    _manager: ContextManager[Services] = attr.ib()
+    _engine: Optional[DockerEngineClient] = attr.ib(default=None, kw_only=True)
+    _services: Optional[Services] = attr.ib(init=False, default=None)
+    _error: Optional[BaseException] = attr.ib(init=False, default=None)
+    _thread: threading.Thread = attr.ib(init=False)
+
+    @_thread.default
+    def _thread_default(self) -> threading.Thread:
+        return threading.Thread(target=self._start, name="pytest-docker-prestart", daemon=True)
+
+    def _start(self) -> None:
+        try:
+            self._services = self._manager.__enter__()
+        except BaseException as error:  # pylint: disable=broad-except
+            self._error = error
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def result(self) -> Services:
+        """Wait for the services to be started. Raises the error of the
+        setup, if any."""
+
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        assert self._services is not None
+        return self._services
+
+    def close(self) -> None:
+        """Wait for the setup to finish, then clean up and close the Docker
+        Engine client, if any."""
+
+        self._thread.join()
+        try:
+            if self._services is not None:
+                self._services = None
+                self._manager.__exit__(None, None, None)
+        finally:
+            if self._engine is not None:
+                self._engine.close()
+
+
+# Services started at the beginning of the session, by project name.
+PRESTARTED: Dict[str, PrestartedServices] = {}
+
+
+def prestart_arguments(
+    docker_compose_command: str,
+    docker_compose_file: Union[List[str], str],
+    docker_compose_project_name: str,
+    docker_setup: Union[List[str], str],
+    docker_cleanup: Union[List[str], str],
+) -> Tuple[Any, ...]:
+    return (
+        docker_compose_command,
+        [str(compose_file) for compose_file in str_to_list(docker_compose_file)],
+        docker_compose_project_name,
+        commands_list(docker_setup),
+        commands_list(docker_cleanup),
+    )
+
+
+def prestart_services(config: Any) -> PrestartedServices:
+    """Start the services with the default fixture values in the background.
+
+    The fixtures are not available before the tests are collected, so
+    `docker_services` only adopts these services if its own arguments are
+    the same; otherwise they are cleaned up."""
+
+    project_name = get_compose_project_name(config)
+    arguments = prestart_arguments(
+        "docker compose", get_compose_file(config), project_name, get_setup_command(), get_cleanup_command()
+    )
+    options = get_services_options(config, project_name)
+    engine = DockerEngineClient.from_env() if config.getoption("--docker-engine-api", False) else None
+    options["docker_engine_client"] = engine
+    prestarted = PrestartedServices(arguments, get_docker_services(*arguments, **options), engine=engine)
+    PRESTARTED[project_name] = prestarted
+    prestarted.start()
+    return prestarted
+
+
+def close_prestarted_services() -> None:
+    """Clean up the services started in the background but never used."""
+
+    while PRESTARTED:
+        _, prestarted = PRESTARTED.popitem()
+        prestarted.close()
+
+
+# Results of the image warmups of the session.
+WARMUP_RESULTS: List[WarmupResult] = []
+
+
+def warmup(docker_compose: DockerComposeExecutor, max_workers: int = 4) -> List[WarmupResult]:
+    """Pull the images of the project (see `warmup_images`) with up to
+    `max_workers` pulls at a time. Failed pulls are reported, not raised:
+    compose gets another chance to pull or build the image."""
+
+    images = warmup_images(get_compose_model(docker_compose))
+    docker = get_docker_command(docker_compose)
+
+    def pull(image: str) -> WarmupResult:
+        ref = time.perf_counter()
+        try:
+            with RECORDER.measure("pull", image, docker_compose.project_name):
+                execute([docker, "pull", "--quiet", image])
+            size = execute([docker, "image", "inspect", "--format", "{{.Size}}", image], ignore_stderr=True)
+        except Exception as error:  # pylint: disable=broad-except
+            return WarmupResult(image, time.perf_counter() - ref, error=" ".join(str(error).split()))
+        return WarmupResult(image, time.perf_counter() - ref, int(size.strip()) if size.strip().isdigit() else None)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        results = list(pool.map(pull, images))
+    WARMUP_RESULTS.extend(results)
+    return results
+
+
+def warmup_services(config: Any) -> List[WarmupResult]:
+    """Pull the images of the services with the default fixture values,
+    for `--docker-warmup-only`."""
+
+    docker_compose = DockerComposeExecutor("docker compose", get_compose_file(config), get_compose_project_name(config))
+    return warmup(docker_compose, config.getoption("--docker-warmup-workers", 4))
+
+
+@pytest.fixture(scope=containers_scope)
+def docker_warmup(
+    docker_compose_command: str,
+    docker_compose_file: Union[List[str], str],
+    docker_compose_project_name: str,
+    pytestconfig: Any,
+) -> List[WarmupResult]:
+    """Pull the images of the services, and the base images of the ones
+    which are built, concurrently (see `--docker-warmup-workers`). Request
+    it before `docker_services`, or use `--docker-warmup`."""
+
+    docker_compose = DockerComposeExecutor(docker_compose_command, docker_compose_file, docker_compose_project_name)
+    return warmup(docker_compose, pytestconfig.getoption("--docker-warmup-workers", 4))
 
 
 @pytest.fixture(scope=containers_scope)
@@ -231,9 +1748,63 @@ def docker_services(
     docker_compose_project_name: str,
     docker_setup: str,
     docker_cleanup: str,
+    docker_engine_client: Optional[DockerEngineClient],
+    pytestconfig: Any,
+    request: FixtureRequest,
 ) -> Iterator[Services]:
     """Start all services from a docker compose file (`docker-compose up`).
-    After test are finished, shutdown all services (`docker-compose down`)."""
+    After test are finished, shutdown all services (`docker-compose down`).
+
+    With `--docker-pool-size` and a scope narrower than the session, the
+    services are leased from a pool of stacks started once per session.
+    With `--docker-prestart`, the stack started at the beginning of the
+    session is used if it matches the fixtures."""
+
+    prestarted = PRESTARTED.pop(docker_compose_project_name, None)
+    if prestarted is not None:
+        arguments = prestart_arguments(
+            docker_compose_command, docker_compose_file, docker_compose_project_name, docker_setup, docker_cleanup
+        )
+        if prestarted.arguments == arguments:
+            try:
+                yield prestarted.result()
+            finally:
+                prestarted.close()
+            return
+        warnings.warn(
+            pytest.PytestWarning(
+                "--docker-prestart started the default stack, but docker_services uses other settings."
+            )
+        )
+        prestarted.close()
+
+    if pytestconfig.getoption("--docker-warmup", False):
+        request.getfixturevalue("docker_warmup")
+
+    options = get_services_options(pytestconfig, docker_compose_project_name)
+
+    pool_size = pytestconfig.getoption("--docker-pool-size", 0)
+    if pool_size and request.scope != "session":
+        pool = POOLS.get(docker_compose_project_name)
+        if pool is None:
+            options.pop("reuse_cache", None)
+            options.pop("shared_lock", None)
+            pool = get_services_pool(
+                pool_size,
+                docker_compose_command,
+                docker_compose_file,
+                docker_compose_project_name,
+                docker_setup,
+                docker_cleanup,
+                request.getfixturevalue("docker_reset"),
+                docker_engine_client=docker_engine_client,
+                **options,
+            )
+            POOLS[docker_compose_project_name] = pool
+            pytestconfig.add_cleanup(lambda: POOLS.pop(docker_compose_project_name).close())
+        with pool.lease() as docker_service:
+            yield docker_service
+        return
 
     with get_docker_services(
         docker_compose_command,
@@ -241,5 +1812,106 @@ def docker_services(
         docker_compose_project_name,
         docker_setup,
         docker_cleanup,
+        docker_engine_client=docker_engine_client,
+        **options,
     ) as docker_service:
         yield docker_service
+
+
+@contextlib.contextmanager
+def get_docker_stacks(
+    docker_compose_command: str,
+    docker_stacks: Dict[str, Union[List[str], str]],
+    docker_compose_project_name: str,
+    docker_setup: Union[List[str], str],
+    docker_cleanup: Union[List[str], str],
+    max_workers: Optional[int] = None,
+    **kwargs: Any,
+) -> Iterator[Dict[str, Services]]:
+    """Start independent stacks concurrently and yield a `Services` handle
+    for each of them. `docker_stacks` maps a stack name to its compose
+    file(s); each stack is a separate project named after
+    `docker_compose_project_name` and the stack name. Other keyword
+    arguments are passed to `get_docker_services`, except for
+    `shared_lock`, which is derived from each project name."""
+
+    shared = kwargs.pop("shared_lock", None) is not None
+    managers = {}
+    for name, compose_files in docker_stacks.items():
+        project_name = "{}-{}".format(docker_compose_project_name, name.lower())
+        if shared:
+            kwargs["shared_lock"] = get_shared_lock(project_name)
+        managers[name] = get_docker_services(
+            docker_compose_command, compose_files, project_name, docker_setup, docker_cleanup, **kwargs
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(managers), 1)) as pool:
+        started = enter_all(pool, managers)
+        try:
+            yield started
+        finally:
+            exit_all(pool, managers.values())
+
+
+def enter_all(pool: ThreadPoolExecutor, managers: Mapping[Any, ContextManager[Services]]) -> Dict[Any, Services]:
+    """Enter the `get_docker_services` context managers concurrently. If any
+    of them fails, the ones that started are exited and the error is raised."""
+
+    starting = {key: pool.submit(manager.__enter__) for key, manager in managers.items()}
+    wait(starting.values())
+    started = {}
+    errors = []
+    for key, future in starting.items():
+        error = future.exception()
+        if error is None:
+            started[key] = future.result()
+        else:
+            errors.append(error)
+    if errors:
+        # Do not leave the stacks that did start running.
+        exit_all(pool, [managers[key] for key in started])
+        raise errors[0]
+    return started
+
+
+def exit_all(pool: ThreadPoolExecutor, managers: Iterable[ContextManager[Services]]) -> None:
+    """Exit `get_docker_services` context managers concurrently."""
+
+    stopping = [pool.submit(manager.__exit__, None, None, None) for manager in managers]
+    for future in stopping:
+        future.result()
+
+
+@pytest.fixture(scope=containers_scope)
+def docker_stacks() -> Dict[str, Union[List[str], str]]:
+    """Independent stacks to start with `docker_stack_services`, as a
+    mapping of stack names to compose file(s). Override this fixture in your
+    tests to declare them; there are none by default."""
+
+    return {}
+
+
+@pytest.fixture(scope=containers_scope)
+def docker_stack_services(
+    docker_compose_command: str,
+    docker_stacks: Dict[str, Union[List[str], str]],
+    docker_compose_project_name: str,
+    docker_setup: str,
+    docker_cleanup: str,
+    docker_engine_client: Optional[DockerEngineClient],
+    pytestconfig: Any,
+) -> Iterator[Dict[str, Services]]:
+    """Start all stacks declared by `docker_stacks` concurrently and return
+    a `Services` handle per stack. The stacks are cleaned up concurrently
+    too."""
+
+    with get_docker_stacks(
+        docker_compose_command,
+        docker_stacks,
+        docker_compose_project_name,
+        docker_setup,
+        docker_cleanup,
+        docker_engine_client=docker_engine_client,
+        **get_services_options(pytestconfig, docker_compose_project_name),
+    ) as services:
+        yield services
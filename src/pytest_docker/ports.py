@@ -0,0 +1,130 @@
+"""Host ports allocated to Compose projects, so that several stacks can
+publish ports on one host without colliding."""
+
+import json
+import os
+import socket
+from typing import Any, Dict, List, Tuple
+
+import attr
+
+from .locking import locked_state, pid_alive, user_state_dir
+
+
+def port_is_free(port: int) -> bool:
+    """Check whether a TCP port can be bound on all interfaces."""
+
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind(("", port))
+        except OSError:
+            return False
+    return True
+
+
+def default_registry() -> str:
+    return os.path.join(user_state_dir(), "ports.json")
+
+
+@attr.s(frozen=True)
+class PortBroker:
+    """Allocates ranges of host ports between `first` and `last` to projects.
+
+    Allocations are kept in a registry shared by the sessions of the user
+    on the host (see `user_state_dir`), protected by a lock, so concurrent
+    sessions never get the same ports, and ports which are in use are
+    skipped. A project gets its previous range again as long as it is
+    allocated, e.g. for a stack kept by `--docker-reuse`. The ranges of
+    processes which are gone are reclaimed when no other range is left."""
+
+    registry: str = attr.ib(factory=default_registry)
+    first: int = attr.ib(default=20000)
+    last: int = attr.ib(default=40000)
+
+    def allocate(self, project: str, count: int) -> List[int]:
+        """Return `count` consecutive free host ports for `project`."""
+
+        with locked_state(self.registry) as state:
+            allocations: Dict[str, Dict[str, Any]] = state.setdefault("allocations", {})
+            previous = allocations.get(project)
+            if previous is not None and previous["last"] - previous["first"] + 1 == count:
+                if not pid_alive(previous["pid"]):
+                    previous["pid"] = os.getpid()
+                return list(range(previous["first"], previous["last"] + 1))
+
+            taken = [
+                (allocation["first"], allocation["last"])
+                for name, allocation in allocations.items()
+                if name != project
+            ]
+            start = self.first
+            while start + count - 1 <= self.last:
+                end = start + count - 1
+                overlap = [last for first, last in taken if first <= end and start <= last]
+                if overlap:
+                    start = max(overlap) + 1
+                    continue
+                busy = [port for port in range(start, end + 1) if not port_is_free(port)]
+                if busy:
+                    start = busy[-1] + 1
+                    continue
+                allocations[project] = {"first": start, "last": end, "pid": os.getpid()}
+                return list(range(start, end + 1))
+
+            # Make room by dropping the ranges of processes which are gone.
+            stale = [name for name, allocation in allocations.items() if not pid_alive(allocation["pid"])]
+            if not stale:
+                raise RuntimeError("No {} free ports left between {} and {}.".format(count, self.first, self.last))
+            for name in stale:
+                del allocations[name]
+        return self.allocate(project, count)
+
+    def release(self, project: str) -> None:
+        with locked_state(self.registry) as state:
+            state.setdefault("allocations", {}).pop(project, None)
+
+    def hand_over(self, project: str, pid: int) -> None:
+        """Let the process `pid` hold the range of `project` allocated by
+        the current one, e.g. until a clean-up in the background is done."""
+
+        with locked_state(self.registry) as state:
+            allocation = state.setdefault("allocations", {}).get(project)
+            if allocation is not None and allocation["pid"] == os.getpid():
+                allocation["pid"] = pid
+
+
+def override_ports(config: Dict[str, Any], ports: List[int]) -> Tuple[str, Dict[str, Dict[int, int]]]:
+    """Assign `ports` to the published ports of the services of `config`
+    (from `docker compose config --format json`), in order.
+
+    Returns a compose file replacing the `ports` of those services and the
+    assigned TCP ports as `{service: {container port: host port}}`."""
+
+    lines = ["services:"]
+    assigned: Dict[str, Dict[int, int]] = {}
+    available = iter(ports)
+    for name, service in (config.get("services") or {}).items():
+        entries = [entry for entry in service.get("ports") or [] if isinstance(entry, dict) and entry.get("target")]
+        if not entries:
+            continue
+        lines += ["  {}:".format(json.dumps(name)), "    ports: !override"]
+        for entry in entries:
+            host_port = next(available)
+            protocol = entry.get("protocol") or "tcp"
+            spec = "{}:{}/{}".format(host_port, entry["target"], protocol)
+            host_ip = entry.get("host_ip")
+            if host_ip:
+                spec = "{}:{}".format("[{}]".format(host_ip) if ":" in host_ip else host_ip, spec)
+            lines.append("      - {}".format(json.dumps(spec)))
+            if protocol == "tcp":
+                assigned.setdefault(name, {}).setdefault(int(entry["target"]), host_port)
+    return "\n".join(lines) + "\n", assigned
+
+
+def count_published_ports(config: Dict[str, Any]) -> int:
+    return sum(
+        1
+        for service in (config.get("services") or {}).values()
+        for entry in service.get("ports") or []
+        if isinstance(entry, dict) and entry.get("target")
+    )
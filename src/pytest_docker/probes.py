@@ -0,0 +1,164 @@
+"""Readiness probes speaking just enough of a protocol to tell whether a
+service answers, over a connection kept between two checks."""
+
+import http.client
+import socket
+import struct
+from typing import Iterable, Optional
+
+import attr
+
+
+def read_exactly(sock: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed by the service.")
+        data += chunk
+    return data
+
+
+def read_line(sock: socket.socket, limit: int = 1024) -> bytes:
+    line = b""
+    while not line.endswith(b"\r\n"):
+        if len(line) >= limit:
+            raise ConnectionError("Line too long.")
+        line += read_exactly(sock, 1)
+    return line[:-2]
+
+
+@attr.s(eq=False)
+class Probe:
+    """Check of a service listening on `host`:`port`, callable like the
+    `check` of `Services.wait_until_responsive`.
+
+    The connection is opened by the first call and kept as long as the
+    service keeps it, so polling a service which is starting does not
+    open a connection every time. Call `close` once done."""
+
+    host: str = attr.ib()
+    port: int = attr.ib()
+    timeout: float = attr.ib(default=1.0, kw_only=True)
+    _sock: Optional[socket.socket] = attr.ib(init=False, default=None, repr=False)
+
+    def __call__(self) -> bool:
+        try:
+            if self._sock is None:
+                self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            return self.handshake(self._sock)
+        except (OSError, ValueError, struct.error, http.client.HTTPException):
+            self.close()
+            return False
+
+    def handshake(self, sock: socket.socket) -> bool:
+        """Whether the service answering on `sock` is ready. Errors close
+        the connection; a new one is opened by the next check."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+@attr.s(eq=False)
+class TCPProbe(Probe):
+    """Ready when the port accepts connections and does not close them
+    within `grace` seconds. The ports published by Docker are served by
+    `docker-proxy`, which accepts connections even before the container
+    listens, then closes (or resets) them: a connection which is kept open,
+    or on which the service speaks first, is the only sign of a listener."""
+
+    grace: float = attr.ib(default=0.2, kw_only=True)
+
+    def handshake(self, sock: socket.socket) -> bool:
+        try:
+            sock.settimeout(self.grace)
+            return sock.recv(1) != b""
+        except socket.timeout:
+            return True
+        finally:
+            self.close()
+
+
+@attr.s(eq=False)
+class HTTPProbe(Probe):
+    """Ready when `GET path` answers with one of `statuses` (2xx and 3xx by
+    default), using keep-alive between two checks."""
+
+    path: str = attr.ib(default="/", kw_only=True)
+    statuses: Iterable[int] = attr.ib(default=range(200, 400), kw_only=True)
+
+    def handshake(self, sock: socket.socket) -> bool:
+        request = "GET {} HTTP/1.1\r\nHost: {}:{}\r\nConnection: keep-alive\r\n\r\n".format(
+            self.path, self.host, self.port
+        )
+        sock.sendall(request.encode("ascii"))
+        response = http.client.HTTPResponse(sock, method="GET")
+        try:
+            response.begin()
+            response.read()
+        finally:
+            response.close()
+        if response.will_close:
+            self.close()
+        return response.status in self.statuses
+
+
+@attr.s(eq=False)
+class PostgresProbe(Probe):
+    """Ready when the server goes on with the authentication of a startup
+    message instead of answering that it is starting up (or shutting down,
+    or in recovery). The server does not keep a connection which does not
+    authenticate, so every check opens a new one."""
+
+    user: str = attr.ib(default="postgres", kw_only=True)
+    database: Optional[str] = attr.ib(default=None, kw_only=True)
+
+    def handshake(self, sock: socket.socket) -> bool:
+        try:
+            parameters = b"user\0" + self.user.encode() + b"\0"
+            parameters += b"database\0" + (self.database or self.user).encode() + b"\0\0"
+            sock.sendall(struct.pack("!ii", 8 + len(parameters), 196608) + parameters)
+            kind, length = struct.unpack("!ci", read_exactly(sock, 5))
+            if kind == b"R":
+                return True
+            if kind != b"E":
+                return False
+            fields = read_exactly(sock, length - 4).split(b"\0")
+            # SQLSTATE 57P03: cannot_connect_now.
+            return b"C57P03" not in fields
+        finally:
+            self.close()
+
+
+@attr.s(eq=False)
+class RedisProbe(Probe):
+    """Ready when `PING` is answered, or refused for lack of authentication,
+    rather than with an error such as `LOADING`."""
+
+    def handshake(self, sock: socket.socket) -> bool:
+        sock.sendall(b"PING\r\n")
+        reply = read_line(sock)
+        return reply.startswith(b"+") or reply.startswith(b"-NOAUTH")
+
+
+@attr.s(eq=False)
+class KafkaProbe(Probe):
+    """Ready when the broker answers an `ApiVersions` request without error."""
+
+    _correlation_id: int = attr.ib(init=False, default=0, repr=False)
+
+    def handshake(self, sock: socket.socket) -> bool:
+        self._correlation_id += 1
+        client_id = b"pytest-docker"
+        # ApiVersions (18) version 0, with the header of requests v1.
+        request = struct.pack("!hhih", 18, 0, self._correlation_id, len(client_id)) + client_id
+        sock.sendall(struct.pack("!i", len(request)) + request)
+        (size,) = struct.unpack("!i", read_exactly(sock, 4))
+        response = read_exactly(sock, size)
+        correlation_id, error_code = struct.unpack("!ih", response[:6])
+        if correlation_id != self._correlation_id:
+            raise ConnectionError("Unexpected response from the broker.")
+        return error_code == 0
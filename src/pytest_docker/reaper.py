@@ -0,0 +1,81 @@
+"""Run clean-up commands in a process detached from the pytest session.
+
+Usage: python -m pytest_docker.reaper --pidfile PATH --log PATH
+       [--project NAME [--port-registry PATH] [--admission-registry PATH]]
+       [--remove PATH]... -- COMMAND...
+
+Each COMMAND is a JSON-encoded list of arguments, run without a shell.
+Once they are done, whether they succeeded or not, the ports and the
+admission of the project NAME are released from the given registries, and
+the files to --remove (e.g. override compose files) are removed.
+
+The PID file exists while the commands run. The log is rewritten by every
+run with the output of the commands, and its last line is "DONE" when all
+of them succeeded. Each command which failed adds a "FAILED" line."""
+
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+from typing import List, Optional
+
+from .admission import AdmissionController
+from .ports import PortBroker
+
+
+def create(path: str) -> int:
+    """Open `path` for writing, truncated, without following a symbolic link."""
+
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_NOFOLLOW", 0)
+    return os.open(path, flags, 0o600)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m pytest_docker.reaper")
+    parser.add_argument("--pidfile", required=True)
+    parser.add_argument("--log", required=True)
+    parser.add_argument("--project")
+    parser.add_argument("--port-registry")
+    parser.add_argument("--admission-registry")
+    parser.add_argument("--remove", action="append", default=[])
+    parser.add_argument("commands", nargs="+")
+    args = parser.parse_args(argv)
+
+    with os.fdopen(create(args.pidfile), "w", encoding="utf-8") as pidfile:
+        pidfile.write(str(os.getpid()))
+
+    status = 0
+    try:
+        with os.fdopen(create(args.log), "wb") as log:
+            for command in args.commands:
+                argv = json.loads(command)
+                log.write("$ {}\n".format(shlex.join(argv)).encode("utf-8"))
+                log.flush()
+                try:
+                    returncode = subprocess.call(argv, stdout=log, stderr=subprocess.STDOUT)
+                except OSError as error:
+                    log.write("{}\n".format(error).encode("utf-8"))
+                    returncode = 127
+                if returncode:
+                    log.write("FAILED: {} returned {}\n".format(shlex.join(argv), returncode).encode("utf-8"))
+                    status = returncode
+            if not status:
+                log.write(b"DONE\n")
+    finally:
+        if args.project and args.port_registry:
+            PortBroker(args.port_registry).release(args.project)
+        if args.project and args.admission_registry:
+            AdmissionController(args.admission_registry).release(args.project)
+        for path in args.remove:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        os.remove(args.pidfile)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import attr
+
+
+@attr.s(frozen=True)
+class Timing:
+    """Duration of one compose command, port lookup or readiness wait."""
+
+    kind: str = attr.ib()
+    name: str = attr.ib()
+    start: float = attr.ib()
+    duration: float = attr.ib()
+    project: Optional[str] = attr.ib(default=None)
+    service: Optional[str] = attr.ib(default=None)
+    failed: bool = attr.ib(default=False)
+
+    def describe(self) -> str:
+        details = [value for value in (self.project, self.service) if value]
+        text = "{} {}".format(self.kind, self.name)
+        if details:
+            text += " [{}]".format(", ".join(details))
+        if self.failed:
+            text += " (failed)"
+        return text
+
+    def span(self) -> Dict[str, Any]:
+        """Represent the timing as an OpenTelemetry-like span."""
+
+        attributes = {"docker.kind": self.kind}
+        if self.project:
+            attributes["docker.compose.project"] = self.project
+        if self.service:
+            attributes["docker.compose.service"] = self.service
+        return {
+            "name": "{} {}".format(self.kind, self.name),
+            "start_time_unix_nano": int(self.start * 1e9),
+            "end_time_unix_nano": int((self.start + self.duration) * 1e9),
+            "status": {"code": "ERROR" if self.failed else "OK"},
+            "attributes": attributes,
+        }
+
+
+@attr.s
+class TimingRecorder:
+    """Collects the timings of a session; safe to use from several threads."""
+
+    _timings: List[Timing] = attr.ib(factory=list)
+    _lock: threading.Lock = attr.ib(factory=threading.Lock, repr=False, eq=False)
+
+    @contextlib.contextmanager
+    def measure(
+        self, kind: str, name: str, project: Optional[str] = None, service: Optional[str] = None
+    ) -> Iterator[None]:
+        start = time.time()
+        ref = time.perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            timing = Timing(kind, name, start, time.perf_counter() - ref, project, service, failed)
+            with self._lock:
+                self._timings.append(timing)
+
+    def timings(self) -> List[Timing]:
+        with self._lock:
+            return list(self._timings)
+
+    def extend(self, timings: List[Timing]) -> None:
+        """Add timings recorded elsewhere, e.g. by pytest-xdist workers."""
+
+        with self._lock:
+            self._timings.extend(timings)
+
+    def clear(self) -> None:
+        with self._lock:
+            del self._timings[:]
+
+    def slowest(self, count: int = 0) -> List[Timing]:
+        """Return the `count` slowest timings (all of them for 0)."""
+
+        timings = sorted(self.timings(), key=lambda timing: timing.duration, reverse=True)
+        return timings[:count] if count else timings
+
+    def export(self, path: str) -> None:
+        """Write all timings as a JSON trace of spans."""
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as trace:
+            json.dump(
+                {"resource": {"service.name": "pytest-docker"}, "spans": [t.span() for t in self.timings()]},
+                trace,
+                indent=2,
+            )
+
+
+# Timings of the running session.
+RECORDER = TimingRecorder()
@@ -0,0 +1,92 @@
+"""Named volumes of a Compose project, kept in memory instead of on disk
+or copied to checkpoints."""
+
+import json
+import re
+from typing import Any, Collection, Dict, List, Optional
+
+
+def named_mounts(service: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Mounts of named volumes of a service from `docker compose config --format json`."""
+
+    return [
+        mount
+        for mount in service.get("volumes") or []
+        if isinstance(mount, dict) and mount.get("type") == "volume" and mount.get("source")
+    ]
+
+
+def named_volumes(config: Dict[str, Any]) -> List[str]:
+    """Named volumes mounted by the services of `config`, each listed once."""
+
+    volumes: List[str] = []
+    for service in (config.get("services") or {}).values():
+        volumes.extend(mount["source"] for mount in named_mounts(service) if mount["source"] not in volumes)
+    return volumes
+
+
+def override_tmpfs(config: Dict[str, Any], volumes: Optional[Collection[str]], size: str) -> Optional[str]:
+    """Return a compose file mounting tmpfs of at most `size` bytes (e.g.
+    "512m") instead of the named `volumes` (all of them if None) in the
+    services of `config`, or None if no service mounts one of them.
+
+    The other mounts of those services are kept as they are. A tmpfs is
+    not shared between containers: each service gets its own, empty one."""
+
+    lines = ["services:"]
+    for name, service in (config.get("services") or {}).items():
+        mounts = service.get("volumes") or []
+        converted = [mount for mount in named_mounts(service) if volumes is None or mount["source"] in volumes]
+        if not converted:
+            continue
+        lines += ["  {}:".format(json.dumps(name)), "    volumes: !override"]
+        for mount in mounts:
+            if any(mount is candidate for candidate in converted):
+                mount = {"type": "tmpfs", "target": mount["target"], "tmpfs": {"size": size}}
+            lines.append("      - {}".format(json.dumps(mount)))
+    if len(lines) == 1:
+        return None
+    return "\n".join(lines) + "\n"
+
+
+# Image of the containers copying the content of a volume to another.
+COPY_IMAGE = "busybox"
+
+
+def project_volumes(config: Dict[str, Any]) -> Dict[str, str]:
+    """Docker names of the named volumes mounted by the services of
+    `config`, by their name in the compose file(s). External volumes are
+    left out: they do not belong to the project."""
+
+    declared: Dict[str, Any] = config.get("volumes") or {}
+    volumes: Dict[str, str] = {}
+    for volume in named_volumes(config):
+        options = declared.get(volume) or {}
+        if not options.get("external"):
+            volumes[volume] = options.get("name") or volume
+    return volumes
+
+
+def mounting_services(config: Dict[str, Any], volumes: Collection[str]) -> List[str]:
+    """Services of `config` mounting one of the named `volumes`."""
+
+    return [
+        name
+        for name, service in (config.get("services") or {}).items()
+        if any(mount["source"] in volumes for mount in named_mounts(service))
+    ]
+
+
+def checkpoint_volume(volume: str, checkpoint: str) -> str:
+    """Name of the volume keeping the content of `volume` for `checkpoint`."""
+
+    return "{}.checkpoint-{}".format(volume, re.sub(r"[^a-zA-Z0-9_.-]", "-", checkpoint))
+
+
+def copy_volume_command(docker: str, source: str, destination: str) -> List[str]:
+    """Command replacing the content of the `destination` volume by the
+    content of the `source` volume, ownership and modes included."""
+
+    script = "rm -rf /to/* /to/.[!.]* /to/..?* && cp -a /from/. /to/"
+    volumes = ["-v", source + ":/from:ro", "-v", destination + ":/to"]
+    return [docker, "run", "--rm"] + volumes + [COPY_IMAGE, "sh", "-c", script]
@@ -0,0 +1,77 @@
+"""Images to pull before starting a Compose project, so that cold hosts
+download them concurrently instead of in the order compose chooses."""
+
+import os
+import re
+import shlex
+from typing import List, Optional
+
+import attr
+
+from .compose import ComposeModel
+
+FROM = re.compile(r"^\s*FROM\s+(.+)$", re.IGNORECASE)
+
+
+def base_images(dockerfile: str) -> List[str]:
+    """Images a Dockerfile builds from, without its own build stages and
+    images depending on build arguments."""
+
+    try:
+        with open(dockerfile, encoding="utf-8") as content:
+            lines = content.read().splitlines()
+    except OSError:
+        return []
+
+    images: List[str] = []
+    stages = set()
+    for line in lines:
+        match = FROM.match(line)
+        if match is None:
+            continue
+        words = [word for word in shlex.split(match.group(1), comments=True) if not word.startswith("--")]
+        if not words:
+            continue
+        image = words[0]
+        if len(words) >= 3 and words[1].lower() == "as":
+            stages.add(words[2].lower())
+        if "$" in image or image.lower() == "scratch" or image.lower() in stages or image in images:
+            continue
+        images.append(image)
+    return images
+
+
+def warmup_images(model: ComposeModel) -> List[str]:
+    """Images used by the services of `model`, and base images of the
+    services it builds, each listed once."""
+
+    images: List[str] = []
+    for name in model.names:
+        build = model.builds.get(name)
+        if build is None:
+            image = model.config["services"][name].get("image")
+            candidates = [image] if image else []
+        else:
+            context = build.get("context", ".")
+            dockerfile = build.get("dockerfile") or "Dockerfile"
+            candidates = base_images(dockerfile if os.path.isabs(dockerfile) else os.path.join(context, dockerfile))
+        images.extend(image for image in candidates if image not in images)
+    return images
+
+
+@attr.s(frozen=True)
+class WarmupResult:
+    """Outcome of pulling one image."""
+
+    image: str = attr.ib()
+    duration: float = attr.ib()
+    size: Optional[int] = attr.ib(default=None)
+    error: Optional[str] = attr.ib(default=None)
+
+    def describe(self) -> str:
+        if self.error is not None:
+            return "{:.2f}s {} (failed: {})".format(self.duration, self.image, self.error)
+        if self.size is None:
+            return "{:.2f}s {}".format(self.duration, self.image)
+        return "{:.2f}s {} ({:.1f} MB)".format(self.duration, self.image, self.size / 1e6)
+
@@ -0,0 +1,86 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, List
+from unittest import mock
+
+import pytest
+from pytest_docker.admission import DEFAULT_CPUS, DEFAULT_MEMORY, AdmissionController, parse_bytes, stack_resources
+from pytest_docker.plugin import get_cleanup_command, get_docker_services, get_setup_command
+
+CONFIG = {
+    "services": {
+        "db": {"deploy": {"resources": {"limits": {"memory": "1073741824", "cpus": "2"}}}},
+        "worker": {"mem_limit": "512m", "cpus": 0.5, "scale": 2},
+        "web": {},
+    }
+}
+GB = 1024**3
+
+
+def test_stack_resources() -> None:
+    assert parse_bytes("1.5g") == 3 * 512 * 1024**2
+    assert parse_bytes("64MB") == 64 * 1024**2
+    assert parse_bytes(None) is None
+
+    assert stack_resources(CONFIG) == (GB + GB + DEFAULT_MEMORY, 2 + 1 + DEFAULT_CPUS)
+
+
+@mock.patch("pytest_docker.admission.available_memory", return_value=None)
+def test_try_acquire(_: Any, tmp_path: Path) -> None:
+    controller = AdmissionController(str(tmp_path / "admission.json"), memory=4 * GB, cpus=4)
+
+    # Alone on the host, even a stack too large is admitted.
+    assert controller.try_acquire("big", (8 * GB, 1))
+    assert not controller.try_acquire("small", (GB, 1))
+    controller.release("big")
+
+    assert controller.try_acquire("one", (2 * GB, 2))
+    assert controller.try_acquire("two", (2 * GB, 2))
+    assert not controller.try_acquire("three", (GB, 0.5))
+    assert controller.try_acquire("one", (2 * GB, 2))
+
+    # The admissions of finished processes are dropped.
+    finished = subprocess.Popen([sys.executable, "-c", "pass"])
+    finished.wait()
+    registry = json.loads((tmp_path / "admission.json").read_text())
+    registry["admissions"]["two"]["pid"] = finished.pid
+    (tmp_path / "admission.json").write_text(json.dumps(registry))
+    assert controller.try_acquire("three", (GB, 0.5))
+
+
+@mock.patch("pytest_docker.admission.available_memory", return_value=None)
+def test_acquire_timeout(_: Any, tmp_path: Path) -> None:
+    controller = AdmissionController(str(tmp_path / "admission.json"), memory=GB, cpus=1, timeout=0.2, interval=0.05)
+    controller.acquire("one", (GB, 1))
+    with pytest.raises(RuntimeError):
+        controller.acquire("two", (GB, 1))
+
+
+def test_docker_services_admission(tmp_path: Path) -> None:
+    commands: List[List[str]] = []
+
+    def run(args: List[str], **kwargs: Any) -> bytes:  # pylint: disable=unused-argument
+        commands.append(args)
+        if "config" in args:
+            return json.dumps(CONFIG).encode()
+        if "up" in args:
+            registry = json.loads((tmp_path / "admission.json").read_text())
+            assert registry["admissions"]["pytest123"]["memory"] == stack_resources(CONFIG)[0]
+        return b""
+
+    controller = AdmissionController(str(tmp_path / "admission.json"))
+    with mock.patch("subprocess.check_output", side_effect=run):
+        with get_docker_services(
+            "docker compose",
+            "docker-compose.yml",
+            docker_compose_project_name="pytest123",
+            docker_setup=get_setup_command(),
+            docker_cleanup=get_cleanup_command(),
+            admission=controller,
+        ):
+            pass
+
+    assert any("up" in command for command in commands)
+    assert json.loads((tmp_path / "admission.json").read_text()) == {"admissions": {}}
@@ -0,0 +1,67 @@
+import os
+from pathlib import Path
+
+import pytest
+from pytest_docker.buildcache import BuildContextHasher, is_ignored, read_dockerignore
+
+
+@pytest.mark.parametrize(
+    "path,ignored",
+    [
+        ("README.md", True),
+        ("docs/README.md", False),
+        ("IMPORTANT.md", False),
+        ("node_modules/left-pad/index.js", True),
+        ("src/app.py", False),
+        ("src/app.pyc", True),
+        ("src/deep/cache/__pycache__/app.cpython-311.pyc", True),
+        ("build", True),
+        ("build/keep.txt", False),
+    ],
+)
+def test_dockerignore(tmp_path: Path, path: str, ignored: bool) -> None:
+    (tmp_path / ".dockerignore").write_text(
+        "# comment\n*.md\n!IMPORTANT.md\n/node_modules\n**/*.pyc\n**/__pycache__\nbuild\n!build/keep.txt\n"
+    )
+    assert is_ignored(path, read_dockerignore(str(tmp_path))) == ignored
+
+
+def _context(tmp_path: Path) -> Path:
+    context = tmp_path / "context"
+    (context / "src").mkdir(parents=True)
+    (context / "Dockerfile").write_text("FROM python\n")
+    (context / "src" / "app.py").write_text("print('hello')\n")
+    (context / "notes.txt").write_text("not sent\n")
+    (context / ".dockerignore").write_text("*.txt\n")
+    return context
+
+
+def test_context_digest(tmp_path: Path) -> None:
+    context = _context(tmp_path)
+    digest = BuildContextHasher().context_digest(str(context), "Dockerfile")
+
+    # Ignored files do not matter.
+    (context / "notes.txt").write_text("changed\n")
+    assert BuildContextHasher().context_digest(str(context), "Dockerfile") == digest
+
+    # Build arguments do.
+    assert BuildContextHasher().context_digest(str(context), "Dockerfile", extra={"args": {"A": "1"}}) != digest
+
+    (context / "src" / "app.py").write_text("print('bye')\n")
+    assert BuildContextHasher().context_digest(str(context), "Dockerfile") != digest
+
+
+def test_unchanged_files_are_not_read(tmp_path: Path) -> None:
+    context = _context(tmp_path)
+    hasher = BuildContextHasher()
+    digest = hasher.context_digest(str(context), "Dockerfile")
+
+    # Same size and modification time: the remembered digest is used.
+    app = context / "src" / "app.py"
+    stat = app.stat()
+    app.write_text("print('HELLO')\n")
+    os.utime(str(app), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert BuildContextHasher(hasher.seen()).context_digest(str(context), "Dockerfile") == digest
+
+    # Without the remembered digests, the file is read again.
+    assert BuildContextHasher().context_digest(str(context), "Dockerfile") != digest
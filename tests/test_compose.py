@@ -0,0 +1,90 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, List
+from unittest import mock
+
+import pytest
+from pytest_docker.compose import ComposeModel
+from pytest_docker.plugin import DockerComposeExecutor, Services, get_compose_model
+
+CONFIG = {
+    "name": "pytest123",
+    "services": {
+        "web": {
+            "build": {"context": "/src/web", "dockerfile": "Dockerfile"},
+            "depends_on": {"db": {"condition": "service_healthy"}},
+            "ports": [
+                {"mode": "ingress", "target": 80, "published": "8000", "protocol": "tcp"},
+                {"mode": "ingress", "target": 443, "protocol": "tcp"},
+                {"mode": "ingress", "target": 9000, "published": "9000-9005", "protocol": "tcp"},
+                {"mode": "ingress", "target": 53, "published": "5353", "protocol": "udp"},
+            ],
+        },
+        "db": {
+            "image": "postgres",
+            "healthcheck": {"test": ["CMD", "pg_isready"], "interval": "1s"},
+            "depends_on": ["cache"],
+        },
+        "cache": {"image": "redis", "healthcheck": {"disable": True}},
+    },
+}
+
+
+def test_model_from_config() -> None:
+    model = ComposeModel.from_config(CONFIG)
+
+    assert model.names == ["web", "db", "cache"]
+    assert model.ports == {"web": {80: 8000}}
+    assert list(model.healthchecks) == ["db"]
+    assert model.builds == {"web": {"context": "/src/web", "dockerfile": "Dockerfile"}}
+    assert model.dependencies("web") == {"web", "db", "cache"}
+    assert model.dependencies("cache") == {"cache"}
+
+
+def test_model_cached_until_compose_file_changes(tmp_path: Path) -> None:
+    compose_file = tmp_path / "docker-compose.yml"
+    compose_file.write_text("services: {}\n")
+    docker_compose = DockerComposeExecutor("docker compose", str(compose_file), "pytest123")
+
+    with mock.patch("subprocess.check_output", return_value=json.dumps(CONFIG).encode()) as check_output:
+        first = get_compose_model(docker_compose)
+        assert get_compose_model(docker_compose) is first
+        assert check_output.call_count == 1
+
+        stat = compose_file.stat()
+        os.utime(compose_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        assert get_compose_model(docker_compose) is not first
+        assert check_output.call_count == 2
+
+
+def test_static_ports_without_lookup() -> None:
+    calls: List[List[str]] = []
+
+    def run(args: List[str], **kwargs: Any) -> bytes:  # pylint: disable=unused-argument
+        calls.append(args)
+        return json.dumps(CONFIG).encode() if "config" in args else b"0.0.0.0:32770"
+
+    services = Services(DockerComposeExecutor("docker compose", "docker-compose.yml", "pytest123"))
+    with mock.patch("subprocess.check_output", side_effect=run):
+        assert services.names == ["web", "db", "cache"]
+        assert services.ports("web") == {80: 8000}
+        assert services.port_for("web", 80) == 8000
+        assert len(calls) == 1
+
+        # Ephemeral ports are still looked up.
+        assert services.port_for("web", 443) == 32770
+        assert calls[-1][-3:] == ["port", "web", "443"]
+        assert services.ports("web") == {80: 8000, 443: 32770}
+
+
+def test_waves() -> None:
+    model = ComposeModel.from_config(CONFIG)
+
+    assert model.completions == set()
+    assert model.waves() == [["cache"], ["db"], ["web"]]
+    assert model.waves("db") == [["cache"], ["db"]]
+
+    looping = ComposeModel.from_config({"services": {"a": {"depends_on": ["b"]}, "b": {"depends_on": ["a"]}}})
+    with pytest.raises(ValueError):
+        looping.waves()
@@ -1,21 +1,45 @@
+import asyncio
+import json
+import os
+import shutil
 import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
 from unittest import mock
 
 import pytest
+from pytest_docker.locking import locked_state, user_state_dir
 from pytest_docker.plugin import (
     DockerComposeExecutor,
+    ExponentialBackoff,
     Services,
+    WaitStats,
     get_cleanup_command,
     get_docker_services,
+    get_docker_stacks,
+    get_services_pool,
     get_setup_command,
+    get_shared_lock,
+    get_stack_key,
+    teardown_reused_stacks,
 )
 
+DOCKER = shutil.which("docker") or "docker"
+
+
+def subcommand(args: List[str]) -> str:
+    """The part of a compose command line after the project name."""
+    return " ".join(args[args.index("-p") + 2:])
+
 
 def test_docker_services() -> None:
     """Automatic teardown of all services."""
 
     with mock.patch("subprocess.check_output") as check_output:
-        check_output.side_effect = [b"", b"0.0.0.0:32770", b""]
+        check_output.side_effect = [b"", b"", b"0.0.0.0:32770", b""]
         check_output.returncode = 0
 
         assert check_output.call_count == 0
@@ -30,38 +54,39 @@ def test_docker_services() -> None:
         ) as services:
             assert isinstance(services, Services)
 
-            assert check_output.call_count == 1
+            assert check_output.call_count == 2
 
             # Can request port for services.
             port = services.port_for("abc", 123)
             assert port == 32770
 
-            assert check_output.call_count == 2
+            assert check_output.call_count == 3
 
             # 2nd request for same service should hit the cache.
             port = services.port_for("abc", 123)
             assert port == 32770
 
-            assert check_output.call_count == 2
+            assert check_output.call_count == 3
 
-        assert check_output.call_count == 3
+        assert check_output.call_count == 4
 
     # Both should have been called.
     assert check_output.call_args_list == [
         mock.call(
-            'docker compose -f "docker-compose.yml" -p "pytest123" up --build --wait',
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "up", "--build", "--wait"],
             stderr=subprocess.STDOUT,
-            shell=True,
         ),
         mock.call(
-            'docker compose -f "docker-compose.yml" -p "pytest123" port abc 123',
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "ps", "--format", "json"],
+            stderr=subprocess.DEVNULL,
+        ),
+        mock.call(
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "port", "abc", "123"],
             stderr=subprocess.STDOUT,
-            shell=True,
         ),
         mock.call(
-            'docker compose -f "docker-compose.yml" -p "pytest123" down -v',
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "down", "-v"],
             stderr=subprocess.STDOUT,
-            shell=True,
         ),
     ]
 
@@ -70,7 +95,7 @@ def test_docker_services_unused_port() -> None:
     """Complain loudly when the requested port is not used by the service."""
 
     with mock.patch("subprocess.check_output") as check_output:
-        check_output.side_effect = [b"", b"", b""]
+        check_output.side_effect = [b"", b"", b"", b""]
         check_output.returncode = 0
 
         assert check_output.call_count == 0
@@ -85,34 +110,33 @@ def test_docker_services_unused_port() -> None:
         ) as services:
             assert isinstance(services, Services)
 
-            assert check_output.call_count == 1
+            assert check_output.call_count == 2
 
             # Can request port for services.
             with pytest.raises(ValueError) as exc:
                 print(services.port_for("abc", 123))
             assert str(exc.value) == ('Could not detect port for "%s:%d".' % ("abc", 123))
 
-            assert check_output.call_count == 2
+            assert check_output.call_count == 3
 
-        assert check_output.call_count == 3
+        assert check_output.call_count == 4
 
     # Both should have been called.
     assert check_output.call_args_list == [
         mock.call(
-            'docker compose -f "docker-compose.yml" -p "pytest123" '
-            'up --build --wait',  # pylint: disable:=implicit-str-concat
-            shell=True,
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "up", "--build", "--wait"],
             stderr=subprocess.STDOUT,
         ),
         mock.call(
-            'docker compose -f "docker-compose.yml" -p "pytest123" '
-            "port abc 123",  # pylint: disable:=implicit-str-concat
-            shell=True,
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "ps", "--format", "json"],
+            stderr=subprocess.DEVNULL,
+        ),
+        mock.call(
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "port", "abc", "123"],
             stderr=subprocess.STDOUT,
         ),
         mock.call(
-            'docker compose -f "docker-compose.yml" -p "pytest123" down -v',  # pylint: disable:=implicit-str-concat
-            shell=True,
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "down", "-v"],
             stderr=subprocess.STDOUT,
         ),
     ]
@@ -146,9 +170,7 @@ def test_docker_services_failure() -> None:
     # Tear down code should not be called.
     assert check_output.call_args_list == [
         mock.call(
-            'docker compose -f "docker-compose.yml" -p "pytest123" '
-            "up --build --wait",  # pylint: disable:=implicit-str-concat
-            shell=True,
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "up", "--build", "--wait"],
             stderr=subprocess.STDOUT,
         )
     ]
@@ -167,7 +189,7 @@ def test_wait_until_responsive_timeout() -> None:
         services = Services(docker_compose)
         with pytest.raises(Exception) as exc:
             print(
-                services.wait_until_responsive(  # type: ignore
+                services.wait_until_responsive(
                     check=lambda: False, timeout=3.0, pause=1.0, clock=clock
                 )
             )
@@ -193,38 +215,39 @@ def test_single_commands() -> None:
         ) as services:
             assert isinstance(services, Services)
 
-            assert check_output.call_count == 1
+            assert check_output.call_count == 2
 
             # Can request port for services.
             port = services.port_for("hello", 80)
             assert port == 1
 
-            assert check_output.call_count == 2
+            assert check_output.call_count == 3
 
             # 2nd request for same service should hit the cache.
             port = services.port_for("hello", 80)
             assert port == 1
 
-            assert check_output.call_count == 2
+            assert check_output.call_count == 3
 
-        assert check_output.call_count == 3
+        assert check_output.call_count == 4
 
     # Both should have been called.
     assert check_output.call_args_list == [
         mock.call(
-            'docker compose -f "docker-compose.yml" -p "pytest123" up --build --wait',
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "up", "--build", "--wait"],
             stderr=subprocess.STDOUT,
-            shell=True,
         ),
         mock.call(
-            'docker compose -f "docker-compose.yml" -p "pytest123" port hello 80',
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "ps", "--format", "json"],
+            stderr=subprocess.DEVNULL,
+        ),
+        mock.call(
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "port", "hello", "80"],
             stderr=subprocess.STDOUT,
-            shell=True,
         ),
         mock.call(
-            'docker compose -f "docker-compose.yml" -p "pytest123" down -v',
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "down", "-v"],
             stderr=subprocess.STDOUT,
-            shell=True,
         ),
     ]
 
@@ -247,47 +270,651 @@ def test_multiple_commands() -> None:
         ) as services:
             assert isinstance(services, Services)
 
-            assert check_output.call_count == 2
+            assert check_output.call_count == 3
 
             # Can request port for services.
             port = services.port_for("hello", 80)
             assert port == 1
 
-            assert check_output.call_count == 3
+            assert check_output.call_count == 4
 
             # 2nd request for same service should hit the cache.
             port = services.port_for("hello", 80)
             assert port == 1
 
-            assert check_output.call_count == 3
+            assert check_output.call_count == 4
 
-        assert check_output.call_count == 5
+        assert check_output.call_count == 6
 
     # Both should have been called.
     assert check_output.call_args_list == [
         mock.call(
-            'docker compose -f "docker-compose.yml" -p "pytest123" ps',
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "ps"],
             stderr=subprocess.STDOUT,
-            shell=True,
         ),
         mock.call(
-            'docker compose -f "docker-compose.yml" -p "pytest123" up --build --wait',
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "up", "--build", "--wait"],
             stderr=subprocess.STDOUT,
-            shell=True,
         ),
         mock.call(
-            'docker compose -f "docker-compose.yml" -p "pytest123" port hello 80',
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "ps", "--format", "json"],
+            stderr=subprocess.DEVNULL,
+        ),
+        mock.call(
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "port", "hello", "80"],
             stderr=subprocess.STDOUT,
-            shell=True,
         ),
         mock.call(
-            'docker compose -f "docker-compose.yml" -p "pytest123" down -v',
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "down", "-v"],
             stderr=subprocess.STDOUT,
-            shell=True,
         ),
         mock.call(
-            'docker compose -f "docker-compose.yml" -p "pytest123" ps',
+            [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "ps"],
             stderr=subprocess.STDOUT,
-            shell=True,
         ),
     ]
+
+
+def test_docker_services_batch_ports() -> None:
+    """Published ports of all services are resolved with a single call."""
+
+    ps_output = (
+        b'{"Service": "hello", "Publishers": [{"URL": "0.0.0.0", "TargetPort": 80,'
+        b' "PublishedPort": 32770, "Protocol": "tcp"}, {"URL": "::", "TargetPort": 80,'
+        b' "PublishedPort": 32770, "Protocol": "tcp"}]}\n'
+        b'{"Service": "db", "Publishers": [{"URL": "", "TargetPort": 5432,'
+        b' "PublishedPort": 0, "Protocol": "tcp"}, {"URL": "0.0.0.0", "TargetPort": 6379,'
+        b' "PublishedPort": 32771, "Protocol": "tcp"}]}\n'
+    )
+
+    with mock.patch("subprocess.check_output") as check_output:
+        check_output.side_effect = [b"", ps_output, b""]
+
+        with get_docker_services(
+            "docker compose",
+            "docker-compose.yml",
+            docker_compose_project_name="pytest123",
+            docker_setup=get_setup_command(),
+            docker_cleanup=get_cleanup_command(),
+        ) as services:
+            assert check_output.call_count == 2
+
+            assert services.port_for("hello", 80) == 32770
+            assert services.port_for("db", 6379) == 32771
+
+            assert check_output.call_count == 2
+
+        assert check_output.call_count == 3
+
+
+def test_docker_services_batch_ports_unsupported() -> None:
+    """Fall back to lazy port lookups when `ps` has no JSON output."""
+
+    with mock.patch("subprocess.check_output") as check_output:
+        check_output.side_effect = [
+            b"",
+            subprocess.CalledProcessError(1, "the command", b"no such option: --format"),
+            b"0.0.0.0:32770",
+            b"",
+        ]
+
+        with get_docker_services(
+            "docker compose",
+            "docker-compose.yml",
+            docker_compose_project_name="pytest123",
+            docker_setup=get_setup_command(),
+            docker_cleanup=get_cleanup_command(),
+        ) as services:
+            assert services.port_for("hello", 80) == 32770
+
+        assert check_output.call_count == 4
+
+
+def test_wait_until_all_responsive() -> None:
+    calls: List[str] = []
+
+    def sync_check() -> bool:
+        calls.append("sync")
+        return len(calls) > 2
+
+    async def async_check() -> bool:
+        calls.append("async")
+        return True
+
+    services = Services(DockerComposeExecutor("docker compose", "docker-compose.yml", "pytest123"))
+    asyncio.run(
+        services.wait_until_all_responsive(
+            {"sync": sync_check, "async": async_check}, timeout=10.0, pause=0.01
+        )
+    )
+    assert calls.count("async") == 1
+    assert calls.count("sync") >= 2
+
+
+def test_wait_until_all_responsive_timeout() -> None:
+    async def never() -> bool:
+        return False
+
+    services = Services(DockerComposeExecutor("docker compose", "docker-compose.yml", "pytest123"))
+    with pytest.raises(Exception) as exc:
+        asyncio.run(
+            services.wait_until_all_responsive(
+                {"ok": lambda: True, "slow": never, "stuck": never},
+                timeout={"ok": 1.0, "slow": 0.05, "stuck": 0.05},
+                pause=0.01,
+            )
+        )
+    assert str(exc.value) == "Timeout reached while waiting on services: slow, stuck!"
+
+
+def test_wait_until_all_responsive_hanging_check() -> None:
+    async def hangs() -> bool:
+        await asyncio.sleep(60)
+        return True
+
+    services = Services(DockerComposeExecutor("docker compose", "docker-compose.yml", "pytest123"))
+    start = time.monotonic()
+    with pytest.raises(Exception, match="services: stuck!"):
+        asyncio.run(services.wait_until_all_responsive({"stuck": hangs}, timeout=0.2, pause=10.0))
+    assert time.monotonic() - start < 2
+
+
+def test_wait_until_responsive_stats() -> None:
+    clock = mock.MagicMock()
+    clock.side_effect = [0.0, 1.0, 2.0, 2.5]
+    results = iter([False, False, True])
+
+    with mock.patch("time.sleep") as sleep:
+        services = Services(DockerComposeExecutor("docker compose", "docker-compose.yml", "pytest123"))
+        stats = services.wait_until_responsive(
+            check=lambda: next(results),
+            timeout=10.0,
+            pause=ExponentialBackoff(initial=0.5, factor=2.0, maximum=5.0, jitter=0.0),
+            clock=clock,
+        )
+    assert sleep.call_args_list == [mock.call(0.5), mock.call(1.0)]
+    assert stats == WaitStats(attempts=3, elapsed=2.5)
+
+
+def test_wait_until_responsive_trigger() -> None:
+    trigger = threading.Event()
+    results = iter([False, True])
+
+    def check() -> bool:
+        # Simulate a state change right after the first failed check.
+        trigger.set()
+        return next(results)
+
+    services = Services(DockerComposeExecutor("docker compose", "docker-compose.yml", "pytest123"))
+    stats = services.wait_until_responsive(check=check, timeout=60.0, pause=30.0, trigger=trigger)
+    assert stats.attempts == 2
+    assert stats.elapsed < 30.0
+
+
+def test_exponential_backoff() -> None:
+    backoff = ExponentialBackoff(initial=0.1, factor=3.0, maximum=1.0, jitter=0.0)
+    assert [backoff(attempt) for attempt in range(1, 5)] == pytest.approx([0.1, 0.3, 0.9, 1.0])
+    # Long waits do not overflow.
+    assert backoff(5000) == 1.0
+    assert ExponentialBackoff()(1100) <= 2.0
+
+    jittered = ExponentialBackoff(initial=1.0, factor=1.0, maximum=10.0, jitter=0.5)
+    assert all(0.5 <= jittered(1) <= 1.5 for _ in range(100))
+
+
+class FakeCache:
+    def __init__(self) -> None:
+        self.values: Dict[str, Any] = {}
+
+    def get(self, key: str, default: Any) -> Any:
+        return json.loads(json.dumps(self.values.get(key, default)))
+
+    def set(self, key: str, value: Any) -> None:
+        self.values[key] = json.loads(json.dumps(value))
+
+
+def test_docker_services_reuse(tmp_path: Path) -> None:
+    """A stack is kept running and reused as long as its key does not change."""
+
+    compose_file = tmp_path / "docker-compose.yml"
+    compose_file.write_text("services: {}\n")
+    cache = FakeCache()
+    running = b'{"Service": "hello", "State": "running", "Health": "healthy", "Publishers": []}\n'
+
+    def run(args: List[str], **kwargs: Any) -> bytes:  # pylint: disable=unused-argument
+        commands.append(subcommand(args))
+        return running if "--all" in args else b""
+
+    for _ in range(2):
+        commands: List[str] = []
+        with mock.patch("subprocess.check_output", side_effect=run):
+            with get_docker_services(
+                "docker compose",
+                str(compose_file),
+                docker_compose_project_name="pytest123",
+                docker_setup=get_setup_command(),
+                docker_cleanup=get_cleanup_command(),
+                reuse_cache=cache,
+            ):
+                pass
+        stack = cache.values["docker/reuse"]["pytest123"]
+        assert stack["key"] is not None
+        assert stack["cleanup"] == ["down -v"]
+        assert "down -v" not in commands
+
+    # The second session only checked the stack state.
+    assert commands == ["config --format json", "ps --all --format json", "ps --format json"]
+
+    # Changing the compose file invalidates the stack.
+    compose_file.write_text("services: {hello: {image: hello}}\n")
+    commands = []
+    with mock.patch("subprocess.check_output", side_effect=run):
+        with get_docker_services(
+            "docker compose",
+            str(compose_file),
+            docker_compose_project_name="pytest123",
+            docker_setup=get_setup_command(),
+            docker_cleanup=get_cleanup_command(),
+            reuse_cache=cache,
+        ):
+            pass
+    assert commands == ["config --format json", "down -v", "up --build --wait", "ps --format json"]
+
+    commands = []
+    with mock.patch("subprocess.check_output", side_effect=run):
+        teardown_reused_stacks(cache)
+    assert commands == ["down -v"]
+    assert cache.values["docker/reuse"] == {}
+
+
+def test_stack_key(tmp_path: Path) -> None:
+    """The key follows the compose files and the build contexts, not the
+    other files next to the compose files."""
+
+    compose_file = tmp_path / "docker-compose.yml"
+    compose_file.write_text("services: {}\n")
+    (tmp_path / "test_a.py").write_text("")
+    context = tmp_path / "web"
+    context.mkdir()
+    (context / ".dockerignore").write_text("*.log\n")
+    (context / "app.py").write_text("")
+    config = {"services": {"db": {"image": "postgres"}, "web": {"build": {"context": str(context)}}}}
+    docker_compose = DockerComposeExecutor("docker compose", str(compose_file), "pytest123")
+
+    with mock.patch("subprocess.check_output", return_value=json.dumps(config).encode()):
+        key = get_stack_key(docker_compose)
+        (tmp_path / "test_a.py").write_text("def test_a(): pass\n")
+        (context / "debug.log").write_text("ignored")
+        assert get_stack_key(docker_compose) == key
+        (context / "app.py").write_text("print()\n")
+        assert get_stack_key(docker_compose) != key
+
+
+def test_docker_services_shared(tmp_path: Path) -> None:
+    """Only the first process sharing a stack starts it and only the last one cleans it up."""
+
+    lock = str(tmp_path / "stack.lock")
+    finished = subprocess.Popen([sys.executable, "-c", "pass"])
+    finished.wait()
+
+    def run_session() -> List[str]:
+        commands: List[str] = []
+
+        def run(args: List[str], **kwargs: Any) -> bytes:  # pylint: disable=unused-argument
+            commands.append(subcommand(args))
+            return b""
+
+        with mock.patch("subprocess.check_output", side_effect=run):
+            with get_docker_services(
+                "docker compose",
+                "docker-compose.yml",
+                docker_compose_project_name="pytest123",
+                docker_setup=get_setup_command(),
+                docker_cleanup=get_cleanup_command(),
+                shared_lock=lock,
+            ):
+                pass
+        return commands
+
+    # Another worker is still using the stack.
+    with locked_state(lock) as state:
+        state["users"] = [os.getppid()]
+    assert run_session() == ["ps --format json"]
+    with locked_state(lock) as state:
+        assert state["users"] == [os.getppid()]
+
+    # The only other worker crashed.
+    with locked_state(lock) as state:
+        state["users"] = [finished.pid]
+    assert run_session() == ["up --build --wait", "ps --format json", "down -v"]
+    with locked_state(lock) as state:
+        assert state["users"] == []
+
+    assert get_shared_lock("pytest123") == os.path.join(user_state_dir(), "pytest123.lock")
+
+
+def test_docker_services_build_cache(tmp_path: Path) -> None:
+    """Images are only built when their build context changed."""
+
+    context = tmp_path / "hello"
+    context.mkdir()
+    (context / "Dockerfile").write_text("FROM python\n")
+    config = json.dumps(
+        {
+            "services": {
+                "hello": {"build": {"context": str(context), "dockerfile": "Dockerfile"}},
+                "redis": {"image": "redis"},
+            }
+        }
+    ).encode()
+    cache = FakeCache()
+
+    def run_session(project_name: str = "pytest123") -> List[str]:
+        commands: List[str] = []
+
+        def run(args: List[str], **kwargs: Any) -> bytes:  # pylint: disable=unused-argument
+            if args[1] in ("image", "tag"):
+                commands.append(" ".join(args[1:]))
+                return b"sha256:1234" if args[-1] in ("sha256:1234", "pytest123-hello") else b""
+            commands.append(subcommand(args))
+            return config if "config" in args else b""
+
+        with mock.patch("subprocess.check_output", side_effect=run):
+            with get_docker_services(
+                "docker compose",
+                "docker-compose.yml",
+                docker_compose_project_name=project_name,
+                docker_setup=get_setup_command(),
+                docker_cleanup=get_cleanup_command(),
+                build_cache=cache,
+            ):
+                pass
+        return commands
+
+    assert run_session() == [
+        "config --format json",
+        "build hello",
+        "image inspect --format {{.Id}} pytest123-hello",
+        "up --wait",
+        "ps --format json",
+        "down -v",
+    ]
+    assert run_session() == [
+        "config --format json",
+        "image inspect --format {{.Id}} sha256:1234",
+        "image inspect --format {{.Id}} pytest123-hello",
+        "up --wait",
+        "ps --format json",
+        "down -v",
+    ]
+    # Another project name reuses the image.
+    assert run_session("pytest456")[:4] == [
+        "config --format json",
+        "image inspect --format {{.Id}} sha256:1234",
+        "image inspect --format {{.Id}} pytest456-hello",
+        "tag sha256:1234 pytest456-hello",
+    ]
+    assert list(cache.values["docker/build"]["images"].values()) == [{"digest": mock.ANY, "id": "sha256:1234"}]
+
+    (context / "Dockerfile").write_text("FROM python:3\n")
+    assert run_session()[:4] == [
+        "config --format json",
+        "image inspect --format {{.Id}} sha256:1234",
+        "build hello",
+        "image inspect --format {{.Id}} pytest123-hello",
+    ]
+
+    # Removed images are forgotten.
+    cache.values["docker/build"]["images"]["other"] = {"digest": "0", "id": "sha256:5678"}
+    run_session()
+    assert "other" not in cache.values["docker/build"]["images"]
+
+
+def test_docker_stacks() -> None:
+    """Independent stacks are started and cleaned up concurrently."""
+
+    barrier = threading.Barrier(3, timeout=5)
+    commands: List[str] = []
+
+    def run(args: List[str], **kwargs: Any) -> bytes:  # pylint: disable=unused-argument
+        commands.append(" ".join(args[1:]))
+        if subcommand(args) in ("up --build --wait", "down -v"):
+            # Only returns if all three stacks run the command at the same time.
+            barrier.wait()
+        return b""
+
+    with mock.patch("subprocess.check_output", side_effect=run):
+        with get_docker_stacks(
+            "docker compose",
+            {"db": "db.yml", "queue": ["queue.yml", "queue.override.yml"], "Cache": "cache.yml"},
+            docker_compose_project_name="pytest123",
+            docker_setup=get_setup_command(),
+            docker_cleanup=get_cleanup_command(),
+        ) as stacks:
+            assert sorted(stacks) == ["Cache", "db", "queue"]
+            assert all(isinstance(services, Services) for services in stacks.values())
+            assert len(commands) == 6
+
+    assert len(commands) == 9
+    assert "compose -f db.yml -p pytest123-db up --build --wait" in commands
+    assert "compose -f queue.yml -f queue.override.yml -p pytest123-queue down -v" in commands
+    assert "compose -f cache.yml -p pytest123-cache down -v" in commands
+
+
+def test_docker_stacks_failure() -> None:
+    """Stacks that started are cleaned up when another one fails to start."""
+
+    commands: List[str] = []
+
+    def run(args: List[str], **kwargs: Any) -> bytes:  # pylint: disable=unused-argument
+        commands.append(" ".join(args[1:]))
+        if commands[-1] == "compose -f queue.yml -p pytest123-queue up --build --wait":
+            raise subprocess.CalledProcessError(1, args, b"boom")
+        return b""
+
+    with mock.patch("subprocess.check_output", side_effect=run):
+        with pytest.raises(Exception) as exc:
+            with get_docker_stacks(
+                "docker compose",
+                {"db": "db.yml", "queue": "queue.yml"},
+                docker_compose_project_name="pytest123",
+                docker_setup=get_setup_command(),
+                docker_cleanup=get_cleanup_command(),
+            ):
+                pass
+
+    assert "boom" in str(exc.value)
+    assert "compose -f db.yml -p pytest123-db down -v" in commands
+    assert "compose -f queue.yml -p pytest123-queue down -v" not in commands
+
+
+def test_docker_services_lazy() -> None:
+    """Services are started with their dependencies the first time they are needed."""
+
+    config = json.dumps(
+        {
+            "services": {
+                "app": {"depends_on": {"db": {"condition": "service_healthy"}, "cache": {}}},
+                "db": {},
+                "cache": {},
+                "worker": {"depends_on": ["db"]},
+            }
+        }
+    ).encode()
+    ps_output = b'{"Service": "app", "Publishers": [{"TargetPort": 80, "PublishedPort": 32770, "Protocol": "tcp"}]}'
+    commands: List[str] = []
+
+    def run(args: List[str], **kwargs: Any) -> bytes:  # pylint: disable=unused-argument
+        commands.append(subcommand(args))
+        if "config" in args:
+            return config
+        return ps_output if "ps" in args else b""
+
+    with mock.patch("subprocess.check_output", side_effect=run):
+        with get_docker_services(
+            "docker compose",
+            "docker-compose.yml",
+            docker_compose_project_name="pytest123",
+            docker_setup=["down -v", "up --build --wait"],
+            docker_cleanup=get_cleanup_command(),
+            lazy=True,
+        ) as services:
+            assert commands == ["down -v"]
+
+            assert services.port_for("app", 80) == 32770
+            assert commands[1:] == ["config --format json", "up --build --wait app cache db", "ps --format json"]
+
+            del commands[:]
+            services.require("db", "cache")
+            services.require("worker")
+            assert commands == ["up --build --wait worker", "ps --format json"]
+
+            del commands[:]
+    assert commands == ["down -v"]
+
+
+def test_docker_services_parallel_startup() -> None:
+    """Services start in waves following their dependencies, concurrently within a wave."""
+
+    config = json.dumps(
+        {
+            "services": {
+                "web": {
+                    "build": {"context": "."},
+                    "depends_on": {
+                        "migrate": {"condition": "service_completed_successfully"},
+                        "cache": {"condition": "service_started"},
+                    },
+                },
+                "migrate": {"depends_on": {"db": {"condition": "service_healthy"}}},
+                "db": {},
+                "cache": {},
+            }
+        }
+    ).encode()
+    barrier = threading.Barrier(2, timeout=5)
+    commands: List[str] = []
+
+    def run(args: List[str], **kwargs: Any) -> bytes:  # pylint: disable=unused-argument
+        command = subcommand(args)
+        if command in ("up --no-deps --wait cache", "up --no-deps --wait db"):
+            # Only returns if both services of the first wave start at the same time.
+            barrier.wait()
+        commands.append(command)
+        return config if "config" in args else b""
+
+    with mock.patch("subprocess.check_output", side_effect=run):
+        with get_docker_services(
+            "docker compose",
+            "docker-compose.yml",
+            docker_compose_project_name="pytest123",
+            docker_setup=get_setup_command(),
+            docker_cleanup=get_cleanup_command(),
+            parallel_startup=True,
+        ):
+            pass
+
+    assert commands[:3] == ["config --format json", "build", "up --no-start"]
+    assert sorted(commands[3:5]) == ["up --no-deps --wait cache", "up --no-deps --wait db"]
+    assert commands[5:] == [
+        "up --no-deps --exit-code-from migrate migrate",
+        "up --no-deps --wait web",
+        "ps --format json",
+        "down -v",
+    ]
+
+
+def test_services_pool() -> None:
+    """Replicas are leased one at a time and reset in the background."""
+
+    commands: List[str] = []
+
+    def run(args: List[str], **kwargs: Any) -> bytes:  # pylint: disable=unused-argument
+        commands.append(" ".join(args[args.index("-p") + 1:]))
+        return b""
+
+    with mock.patch("subprocess.check_output", side_effect=run):
+        pool = get_services_pool(
+            2,
+            "docker compose",
+            "docker-compose.yml",
+            "pytest123",
+            get_setup_command(),
+            get_cleanup_command(),
+            docker_reset=["restart"],
+        )
+        assert sorted(commands) == [
+            'pytest123-pool0 ps --format json',
+            'pytest123-pool0 up --build --wait',
+            'pytest123-pool1 ps --format json',
+            'pytest123-pool1 up --build --wait',
+        ]
+
+        with pool.lease() as first:
+            with pool.lease() as second:
+                assert first.docker_compose.project_name != second.docker_compose.project_name
+        with pool.lease() as third:
+            assert third.docker_compose.project_name in ("pytest123-pool0", "pytest123-pool1")
+
+        pool.close()
+
+    assert commands.count('pytest123-pool0 restart') + commands.count('pytest123-pool1 restart') == 3
+    assert 'pytest123-pool0 down -v' in commands
+    assert 'pytest123-pool1 down -v' in commands
+
+
+def test_services_pool_restore() -> None:
+    """A reset can restore a checkpoint saved during a lease."""
+
+    commands: List[str] = []
+    config = {"services": {"db": {"volumes": [{"type": "volume", "source": "data", "target": "/data"}]}}}
+
+    def run(args: List[str], **kwargs: Any) -> bytes:  # pylint: disable=unused-argument
+        commands.append(" ".join(args))
+        return json.dumps(config).encode() if "config" in args else b""
+
+    with mock.patch("subprocess.check_output", side_effect=run):
+        pool = get_services_pool(
+            1,
+            "docker compose",
+            "docker-compose.yml",
+            "pytest123",
+            get_setup_command(),
+            get_cleanup_command(),
+            docker_reset=lambda services: services.restore("seeded"),
+        )
+        with pool.lease() as services:
+            services.checkpoint("seeded")
+        with pool.lease() as services:
+            assert services.docker_compose.project_name == "pytest123-pool0"
+        with pool.lease():
+            pass
+        pool.close()
+
+    assert sum("data.checkpoint-seeded:/from:ro" in command for command in commands) == 3
+    assert commands[-2].endswith("volume rm --force data.checkpoint-seeded")
+
+
+def test_services_pool_reset_failure() -> None:
+    def run(args: List[str], **kwargs: Any) -> bytes:  # pylint: disable=unused-argument
+        if args[-1] == "restart":
+            raise subprocess.CalledProcessError(1, args, b"cannot restart")
+        return b""
+
+    with mock.patch("subprocess.check_output", side_effect=run):
+        pool = get_services_pool(
+            1,
+            "docker compose",
+            "docker-compose.yml",
+            "pytest123",
+            get_setup_command(),
+            get_cleanup_command(),
+            docker_reset=["restart"],
+        )
+        with pool.lease():
+            pass
+        with pytest.raises(Exception) as exc:
+            with pool.lease():
+                pass
+        pool.close()
+    assert "cannot restart" in str(exc.value)
@@ -1,8 +1,14 @@
+import logging
+import shutil
 import subprocess
+import sys
 from unittest import mock
 
 from pathlib import Path
-from pytest_docker.plugin import DockerComposeExecutor
+import pytest
+from pytest_docker.plugin import DockerComposeExecutor, execute_streaming, resolve_command
+
+DOCKER = shutil.which("docker") or "docker"
 
 
 def test_execute() -> None:
@@ -11,8 +17,7 @@ def test_execute() -> None:
         docker_compose.execute("up")
         assert check_output.call_args_list == [
             mock.call(
-                'docker compose -f "docker-compose.yml" -p "pytest123" up',
-                shell=True,
+                [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "up"],
                 stderr=subprocess.STDOUT,
             )
         ]
@@ -24,8 +29,7 @@ def test_execute_docker_compose_v2() -> None:
         docker_compose.execute("up")
         assert check_output.call_args_list == [
             mock.call(
-                'docker compose -f "docker-compose.yml" -p "pytest123" up',
-                shell=True,
+                [DOCKER, "compose", "-f", "docker-compose.yml", "-p", "pytest123", "up"],
                 stderr=subprocess.STDOUT,
             )
         ]
@@ -38,16 +42,7 @@ def test_path_compose_file() -> None:
         docker_compose.execute("up")
         assert check_output.call_args_list == [
             mock.call(
-                'docker compose -f "/tmp/docker-compose.yml"'
-                ' -p "pytest123" up',  # pylint: disable:=implicit-str-concat
-                shell=True,
-                stderr=subprocess.STDOUT,
-            )
-        ] or check_output.call_args_list == [
-            mock.call(
-                'docker compose -f "C:\\tmp\\docker-compose.yml"'
-                ' -p "pytest123" up',  # pylint: disable:=implicit-str-concat
-                shell=True,
+                [DOCKER, "compose", "-f", str(compose_file), "-p", "pytest123", "up"],
                 stderr=subprocess.STDOUT,
             )
         ]
@@ -61,9 +56,51 @@ def test_multiple_compose_files() -> None:
         docker_compose.execute("up")
         assert check_output.call_args_list == [
             mock.call(
-                'docker compose -f "docker-compose.yml" -f "other-compose.yml"'
-                ' -p "pytest123" up',
-                shell=True,
+                [DOCKER, "compose", "-f", "docker-compose.yml", "-f", "other-compose.yml", "-p", "pytest123", "up"],
                 stderr=subprocess.STDOUT,
             )
         ]
+
+
+def test_execute_structured_subcommand() -> None:
+    docker_compose = DockerComposeExecutor("docker compose", "my compose.yml", "pytest123")
+    with mock.patch("subprocess.check_output") as check_output:
+        docker_compose.execute(["exec", "db", "psql", "-c", "SELECT 'a b'"])
+        prefix = [DOCKER, "compose", "-f", "my compose.yml", "-p", "pytest123"]
+        assert check_output.call_args_list == [
+            mock.call(prefix + ["exec", "db", "psql", "-c", "SELECT 'a b'"], stderr=subprocess.STDOUT)
+        ]
+
+
+def test_compose_command_resolved_once() -> None:
+    resolve_command.cache_clear()
+    with mock.patch("shutil.which", return_value="/opt/bin/podman-compose") as which:
+        first = DockerComposeExecutor("podman-compose --podman-path /opt/bin/podman", "a.yml", "pytest1")
+        second = DockerComposeExecutor("podman-compose --podman-path /opt/bin/podman", "b.yml", "pytest2")
+        assert first.argv("up")[:3] == ["/opt/bin/podman-compose", "--podman-path", "/opt/bin/podman"]
+        assert second.argv(["down"])[-1] == "down"
+    assert which.call_count == 1
+
+
+def test_run_command_buffers_by_default() -> None:
+    docker_compose = DockerComposeExecutor("docker compose", "docker-compose.yml", "pytest123")
+    with mock.patch("subprocess.check_output") as check_output, mock.patch("subprocess.Popen") as popen:
+        docker_compose.run_command("up")
+        assert check_output.call_count == 1
+        assert not popen.called
+
+
+def test_run_command_streams_output(caplog: pytest.LogCaptureFixture) -> None:
+    docker_compose = DockerComposeExecutor("docker compose", "docker-compose.yml", "pytest123", stream_output=True)
+    args = [sys.executable, "-c", "print('one'); print('two')"]
+    with mock.patch.object(DockerComposeExecutor, "argv", return_value=args):
+        with caplog.at_level(logging.INFO, logger="pytest_docker"):
+            output = docker_compose.run_command("up")
+    assert output.splitlines() == [b"one", b"two"]
+    assert [record.getMessage() for record in caplog.records] == ["one", "two"]
+
+
+def test_execute_streaming_keeps_tail() -> None:
+    with pytest.raises(Exception) as error:
+        execute_streaming("echo one && echo two && echo three && exit 3", tail_lines=2)
+    assert str(error.value).endswith('returned 3: """two\nthree\n""".')
@@ -0,0 +1,145 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Any, Iterator, List
+from unittest import mock
+from urllib.parse import quote_plus
+
+import pytest
+from pytest_docker.engine import DockerEngineClient, DockerEngineError, UnixHTTPConnection
+from pytest_docker.plugin import DockerComposeExecutor, Services
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="requires UNIX sockets")
+
+CONTAINERS = [
+    {
+        "Id": "abc123",
+        "Labels": {"com.docker.compose.project": "pytest123", "com.docker.compose.service": "hello"},
+        "Ports": [
+            {"IP": "0.0.0.0", "PrivatePort": 80, "PublicPort": 32770, "Type": "tcp"},
+            {"IP": "::", "PrivatePort": 80, "PublicPort": 32770, "Type": "tcp"},
+            {"PrivatePort": 9000, "Type": "tcp"},
+        ],
+    }
+]
+
+
+class FakeDaemon(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests: List[str] = []
+    connections: List[Any] = []
+
+    def setup(self) -> None:
+        super().setup()
+        FakeDaemon.connections.append(self.connection)
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        FakeDaemon.requests.append(self.path)
+        body: Any
+        if self.path == "/_ping":
+            self._reply(200, b"OK", "text/plain")
+            return
+        if self.path.startswith("/containers/json"):
+            body = CONTAINERS
+        elif self.path == "/containers/abc123/json":
+            body = {"State": {"Status": "running", "Health": {"Status": "healthy"}}}
+        else:
+            self._reply(404, b'{"message": "no such container"}', "application/json")
+            return
+        self._reply(200, json.dumps(body).encode(), "application/json")
+
+    def _reply(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: Any) -> None:  # pylint: disable=unused-argument
+        pass
+
+
+@pytest.fixture
+def engine(tmp_path: Path) -> Iterator[DockerEngineClient]:
+    socket_path = str(tmp_path / "docker.sock")
+    FakeDaemon.requests = []
+    FakeDaemon.connections = []
+    server = socketserver.ThreadingUnixStreamServer(socket_path, FakeDaemon)  # type: ignore[attr-defined,unused-ignore]
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    client = DockerEngineClient("unix://" + socket_path)
+    try:
+        yield client
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+
+def test_ping(engine: DockerEngineClient) -> None:
+    assert engine.ping()
+
+
+def test_connection_is_reused(engine: DockerEngineClient) -> None:
+    assert engine.port_for("pytest123", "hello", 80) == 32770
+    assert engine.port_for("pytest123", "hello", 80) == 32770
+    assert engine.health("pytest123", "hello") == "healthy"
+
+    assert len(FakeDaemon.requests) == 4
+    assert len(FakeDaemon.connections) == 1
+
+
+def test_close_all_threads(engine: DockerEngineClient) -> None:
+    thread = threading.Thread(target=engine.ping)
+    thread.start()
+    thread.join()
+    assert engine.ping()
+    assert len(FakeDaemon.connections) == 2
+
+    with mock.patch.object(UnixHTTPConnection, "close", autospec=True, side_effect=UnixHTTPConnection.close) as close:
+        engine.close()
+    assert close.call_count == 2
+
+    # A new connection is opened once closed.
+    assert engine.ping()
+    assert len(FakeDaemon.connections) == 3
+
+
+def test_containers_are_filtered_by_labels(engine: DockerEngineClient) -> None:
+    engine.containers("pytest123", "hello")
+    filters = json.dumps(
+        {"label": ["com.docker.compose.project=pytest123", "com.docker.compose.service=hello"]}
+    )
+    assert FakeDaemon.requests == ["/containers/json?filters=" + quote_plus(filters)]
+
+
+def test_published_ports(engine: DockerEngineClient) -> None:
+    assert engine.published_ports("pytest123") == {"hello": {80: 32770}}
+
+
+def test_error(engine: DockerEngineClient) -> None:
+    with pytest.raises(DockerEngineError) as exc:
+        engine.inspect("missing")
+    assert "returned 404" in str(exc.value)
+
+
+def test_services_use_engine(engine: DockerEngineClient) -> None:
+    docker_compose = DockerComposeExecutor("docker compose", "docker-compose.yml", "pytest123", engine=engine)
+    services = Services(docker_compose)
+    with mock.patch("subprocess.check_output") as check_output:
+        assert services.port_for("hello", 80) == 32770
+        assert services.health_status("hello") == "healthy"
+        with pytest.raises(ValueError):
+            services.port_for("hello", 9000)
+    assert check_output.call_count == 0
+
+
+def test_from_env() -> None:
+    with mock.patch.dict(os.environ, {"DOCKER_HOST": "tcp://1.2.3.4:2375"}):
+        client = DockerEngineClient.from_env()
+    assert client == DockerEngineClient("tcp://1.2.3.4:2375")
+
@@ -0,0 +1,94 @@
+import json
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+from unittest import mock
+
+from pytest_docker.events import EventWatcher
+from pytest_docker.plugin import DockerComposeExecutor, Services
+
+
+def event(service: str, action: str) -> Dict[str, Any]:
+    return {
+        "Type": "container",
+        "Action": action,
+        "Actor": {"ID": "abc", "Attributes": {"com.docker.compose.service": service}},
+    }
+
+
+def emitter(events: List[Dict[str, Any]], delay: float = 0.05) -> List[str]:
+    """Command printing `events` like `docker events --format "{{json .}}"`."""
+
+    script = "import sys, time\nfor line in sys.argv[1:]:\n    time.sleep({})\n    print(line, flush=True)\n"
+    return [sys.executable, "-c", script.format(delay)] + [json.dumps(item) for item in events]
+
+
+def test_event_states() -> None:
+    watcher = EventWatcher([])
+    watcher.expect_health("db")
+
+    watcher.apply(event("db", "create"))
+    watcher.apply(event("db", "start"))
+    assert watcher.state("db") == {"state": "running", "health": "starting"}
+    assert not watcher.is_healthy("db")
+    watcher.apply(event("db", "health_status: healthy"))
+    assert watcher.is_healthy("db")
+    watcher.apply(event("db", "exec_start: pg_isready"))
+    assert watcher.is_healthy("db")
+
+    # Without a healthcheck, a running container is ready.
+    watcher.apply(event("web", "start"))
+    assert watcher.is_healthy("web")
+    watcher.apply(event("web", "die"))
+    assert watcher.state("web") == {"state": "exited", "health": None}
+
+    # Events win over a status queried earlier.
+    watcher.seed("web", "running")
+    assert not watcher.is_healthy("web")
+    watcher.seed("cache", "starting")
+    assert watcher.state("cache") == {"state": "running", "health": "starting"}
+    watcher.apply(event("cache", "restart"))
+    watcher.apply(event("cache", "start"))
+    assert watcher.state("cache") == {"state": "running", "health": "starting"}
+
+
+def test_wait_healthy_wakes_on_event() -> None:
+    watcher = EventWatcher(emitter([event("db", "start"), event("db", "health_status: healthy")], delay=0.2))
+    watcher.expect_health("db")
+    trigger = threading.Event()
+    watcher.subscribe(trigger)
+    watcher.start()
+    try:
+        assert watcher.wait_healthy("db", timeout=10)
+        assert trigger.is_set()
+        # The stream ends with the emitter; waits stop at once.
+        start = time.monotonic()
+        assert not watcher.wait_healthy("queue", timeout=10)
+        assert time.monotonic() - start < 5
+        assert not watcher.running
+    finally:
+        watcher.close()
+
+
+def test_services_wait_healthy() -> None:
+    config = b'{"services": {"db": {"healthcheck": {"test": ["CMD", "pg_isready"]}}, "web": {}}}'
+    ps_output = b'{"Service": "db", "State": "running", "Health": "starting"}'
+
+    def run(args: List[str], **kwargs: Any) -> bytes:  # pylint: disable=unused-argument
+        if "config" in args:
+            return config
+        return ps_output if args[-1] == "db" else b""
+
+    events = emitter([event("db", "health_status: healthy"), event("web", "start")], delay=0.2)
+    docker_compose = DockerComposeExecutor("docker compose", "docker-compose.yml", "pytest123")
+    with mock.patch("subprocess.check_output", side_effect=run), mock.patch(
+        "pytest_docker.plugin.events_command", return_value=events
+    ):
+        services = Services(docker_compose)
+        try:
+            services.wait_healthy("db", timeout=10)
+            services.wait_healthy("web", timeout=10)
+        finally:
+            services.close()
+        assert not services.events.running
@@ -1,9 +1,11 @@
 import os.path
-from typing import List
+from typing import Dict, List
+from unittest import mock
 
 import pytest
 from _pytest.fixtures import FixtureRequest
 from _pytest.pytester import Pytester
+from pytest_docker.plugin import PrestartedServices
 
 HERE = os.path.dirname(os.path.abspath(__file__))
 
@@ -24,6 +26,10 @@ def test_docker_setup(docker_setup: List[str]) -> None:
     assert docker_setup == ["up --build --wait"]
 
 
+def test_docker_stacks(docker_stacks: Dict[str, List[str]]) -> None:
+    assert docker_stacks == {}
+
+
 def test_docker_compose_comand(docker_compose_command: str) -> None:
     assert docker_compose_command == "docker compose"
 
@@ -64,3 +70,78 @@ def test_general_container_scope(testdir: Pytester, request: FixtureRequest, sco
 
     result = testdir.runpytest(*params)
     result.assert_outcomes(passed=1)
+
+
+def test_docker_services_pool(pytester: Pytester) -> None:
+    pytester.makepyfile(
+        """
+        import pytest
+
+        @pytest.fixture(scope="session")
+        def docker_compose_command():
+            return "echo"
+
+        @pytest.mark.parametrize("run", range(3))
+        def test_pooled(docker_services, docker_compose_project_name, run):
+            project_name = docker_services.docker_compose.project_name
+            assert project_name in (docker_compose_project_name + "-pool0", docker_compose_project_name + "-pool1")
+    """
+    )
+
+    result = pytester.runpytest("--container-scope=function", "--docker-pool-size=2")
+    result.assert_outcomes(passed=3)
+
+
+def test_docker_prestart(pytester: Pytester) -> None:
+    pytester.makepyfile(
+        """
+        def test_prestarted(docker_services):
+            pass
+
+        def test_again(docker_services):
+            pass
+    """
+    )
+
+    with mock.patch("subprocess.check_output") as check_output:
+        check_output.return_value = b""
+        result = pytester.runpytest("--docker-prestart")
+    result.assert_outcomes(passed=2)
+
+    commands = [" ".join(call[0][0][call[0][0].index("-p") + 2:]) for call in check_output.call_args_list]
+    assert commands == ["up --build --wait", "ps --format json", "down -v"]
+
+
+def test_prestarted_services_close_engine() -> None:
+    engine = mock.Mock()
+    manager = mock.MagicMock()
+    prestarted = PrestartedServices((), manager, engine=engine)
+    prestarted.start()
+    prestarted.close()
+
+    manager.__exit__.assert_called_once_with(None, None, None)
+    engine.close.assert_called_once_with()
+
+
+def test_docker_prestart_other_settings(pytester: Pytester) -> None:
+    pytester.makepyfile(
+        """
+        import pytest
+
+        @pytest.fixture(scope="session")
+        def docker_setup():
+            return ["up --wait"]
+
+        def test_not_prestarted(docker_services):
+            pass
+    """
+    )
+
+    with mock.patch("subprocess.check_output") as check_output:
+        check_output.return_value = b""
+        result = pytester.runpytest("--docker-prestart")
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(["*--docker-prestart started the default stack*"])
+
+    commands = [" ".join(call[0][0][call[0][0].index("-p") + 2:]) for call in check_output.call_args_list]
+    assert commands == ["up --build --wait", "ps --format json", "down -v", "up --wait", "ps --format json", "down -v"]
@@ -0,0 +1,62 @@
+import os
+import stat
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+from pytest_docker.locking import locked_state, pid_alive, user_state_dir
+
+
+def test_locked_state_is_persisted(tmp_path: Path) -> None:
+    path = str(tmp_path / "state.lock")
+    with locked_state(path) as state:
+        assert state == {}
+        state["users"] = [1, 2]
+    with locked_state(path) as state:
+        assert state == {"users": [1, 2]}
+
+
+def test_locked_state_is_exclusive(tmp_path: Path) -> None:
+    path = str(tmp_path / "state.lock")
+
+    def increment() -> None:
+        for _ in range(50):
+            with locked_state(path) as state:
+                state["count"] = state.get("count", 0) + 1
+
+    threads = [threading.Thread(target=increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with locked_state(path) as state:
+        assert state["count"] == 200
+
+
+def test_pid_alive() -> None:
+    assert pid_alive(os.getpid())
+
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    assert not pid_alive(process.pid)
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="POSIX permissions")
+def test_user_state_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    path = user_state_dir()
+    assert path == str(tmp_path / "pytest-docker")
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o700
+
+    with locked_state(os.path.join(path, "state.json")):
+        pass
+    assert stat.S_IMODE(os.stat(os.path.join(path, "state.json")).st_mode) == 0o600
+
+    # A directory other users can write to is refused.
+    os.chmod(path, 0o777)
+    with pytest.raises(RuntimeError):
+        user_state_dir()
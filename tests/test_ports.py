@@ -0,0 +1,115 @@
+import json
+import os
+import socket
+import stat
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, List
+from unittest import mock
+
+import pytest
+from pytest_docker.locking import user_state_dir
+from pytest_docker.plugin import get_cleanup_command, get_docker_services, get_setup_command
+from pytest_docker.ports import PortBroker, override_ports, port_is_free
+
+CONFIG = {
+    "services": {
+        "web": {
+            "ports": [
+                {"mode": "ingress", "target": 80, "published": "8000", "protocol": "tcp"},
+                {"mode": "ingress", "host_ip": "127.0.0.1", "target": 443, "protocol": "tcp"},
+            ]
+        },
+        "dns": {"ports": [{"mode": "ingress", "target": 53, "protocol": "udp"}]},
+        "worker": {},
+    }
+}
+
+
+def free_range(count: int) -> int:
+    """First port of `count` consecutive free ports."""
+
+    first = 30000
+    while not all(port_is_free(port) for port in range(first, first + count)):
+        first += count
+    return first
+
+
+def test_allocate(tmp_path: Path) -> None:
+    first = free_range(20)
+    broker = PortBroker(str(tmp_path / "ports.json"), first, first + 19)
+
+    one = broker.allocate("one", 3)
+    two = broker.allocate("two", 3)
+    assert len(one) == 3 and len(two) == 3
+    assert not set(one) & set(two)
+    assert broker.allocate("one", 3) == one
+
+    broker.release("one")
+    with socket.socket() as busy:
+        busy.bind(("", one[0]))
+        three = broker.allocate("three", 3)
+    assert one[0] not in three
+
+
+def test_allocate_reclaims_ranges_of_finished_processes(tmp_path: Path) -> None:
+    first = free_range(4)
+    broker = PortBroker(str(tmp_path / "ports.json"), first, first + 3)
+    finished = subprocess.Popen([sys.executable, "-c", "pass"])
+    finished.wait()
+
+    broker.allocate("old", 4)
+    registry = json.loads((tmp_path / "ports.json").read_text())
+    registry["allocations"]["old"]["pid"] = finished.pid
+    (tmp_path / "ports.json").write_text(json.dumps(registry))
+
+    assert broker.allocate("new", 4) == list(range(first, first + 4))
+    with pytest.raises(RuntimeError):
+        broker.allocate("other", 4)
+
+
+def test_override_ports() -> None:
+    override, assigned = override_ports(CONFIG, [20000, 20001, 20002])
+
+    assert override == (
+        "services:\n"
+        '  "web":\n'
+        "    ports: !override\n"
+        '      - "20000:80/tcp"\n'
+        '      - "127.0.0.1:20001:443/tcp"\n'
+        '  "dns":\n'
+        "    ports: !override\n"
+        '      - "20002:53/udp"\n'
+    )
+    assert assigned == {"web": {80: 20000, 443: 20001}}
+
+
+def test_docker_services_port_broker(tmp_path: Path) -> None:
+    commands: List[List[str]] = []
+
+    def run(args: List[str], **kwargs: Any) -> bytes:  # pylint: disable=unused-argument
+        commands.append(args)
+        return json.dumps(CONFIG).encode() if "config" in args else b""
+
+    first = free_range(10)
+    broker = PortBroker(str(tmp_path / "ports.json"), first, first + 9)
+    with mock.patch("subprocess.check_output", side_effect=run):
+        with get_docker_services(
+            "docker compose",
+            "docker-compose.yml",
+            docker_compose_project_name="pytest123",
+            docker_setup=get_setup_command(),
+            docker_cleanup=get_cleanup_command(),
+            port_broker=broker,
+        ) as services:
+            assert len(commands) == 2
+            assert services.port_for("web", 443) == broker.allocate("pytest123", 3)[1]
+            assert len(commands) == 2
+            override = commands[1][commands[1].index("-p") - 1]
+            assert override == os.path.join(user_state_dir(), "pytest123-ports.yml")
+            assert stat.S_IMODE(os.stat(override).st_mode) == 0o600
+
+    assert commands[-1][-2:] == ["down", "-v"] and override in commands[-1]
+    assert not os.path.exists(override)
+    assert json.loads((tmp_path / "ports.json").read_text()) == {"allocations": {}}
@@ -0,0 +1,148 @@
+import socket
+import struct
+import threading
+from typing import Callable, Iterator, List, Tuple
+from unittest import mock
+
+import pytest
+from pytest_docker.plugin import DockerComposeExecutor, Services
+from pytest_docker.probes import HTTPProbe, KafkaProbe, PostgresProbe, RedisProbe, TCPProbe, read_exactly
+
+Handler = Callable[[socket.socket, int], None]
+
+
+@pytest.fixture
+def serve() -> Iterator[Callable[[Handler], Tuple[int, List[int]]]]:
+    """Start a server running a handler for each connection, with the
+    connection and its number. Returns the port and the connections."""
+
+    servers: List[socket.socket] = []
+
+    def start(handler: Handler) -> Tuple[int, List[int]]:
+        server = socket.create_server(("127.0.0.1", 0))
+        servers.append(server)
+        connections: List[int] = []
+
+        def accept() -> None:
+            while True:
+                try:
+                    conn, _ = server.accept()
+                except OSError:
+                    return
+                connections.append(len(connections))
+                threading.Thread(target=run, args=(conn, len(connections) - 1), daemon=True).start()
+
+        def run(conn: socket.socket, number: int) -> None:
+            with conn:
+                try:
+                    handler(conn, number)
+                except OSError:
+                    pass
+
+        threading.Thread(target=accept, daemon=True).start()
+        return server.getsockname()[1], connections
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def test_tcp_probe(serve: Callable[[Handler], Tuple[int, List[int]]]) -> None:
+    def hold(conn: socket.socket, number: int) -> None:  # pylint: disable=unused-argument
+        conn.recv(1)
+
+    # Kept open until the probe closes it, or with a banner.
+    port, _ = serve(hold)
+    assert TCPProbe("127.0.0.1", port, grace=0.05)()
+    port, _ = serve(lambda conn, number: conn.sendall(b"220 ready\r\n"))
+    assert TCPProbe("127.0.0.1", port)()
+
+    # Accepted, then closed, like docker-proxy without a listener.
+    port, _ = serve(lambda conn, number: None)
+    assert not TCPProbe("127.0.0.1", port)()
+    with socket.socket() as unused:
+        unused.bind(("127.0.0.1", 0))
+        assert not TCPProbe("127.0.0.1", unused.getsockname()[1])()
+
+
+def test_http_probe_keeps_connection(serve: Callable[[Handler], Tuple[int, List[int]]]) -> None:
+    def handler(conn: socket.socket, number: int) -> None:  # pylint: disable=unused-argument
+        for status in (503, 503, 200):
+            request = b""
+            while not request.endswith(b"\r\n\r\n"):
+                request += conn.recv(1024)
+            assert request.startswith(b"GET /health HTTP/1.1\r\n")
+            conn.sendall(b"HTTP/1.1 %d Status\r\nContent-Length: 2\r\n\r\nok" % status)
+
+    port, connections = serve(handler)
+    probe = HTTPProbe("127.0.0.1", port, path="/health")
+    assert [probe(), probe(), probe()] == [False, False, True]
+    assert connections == [0]
+    probe.close()
+
+
+def test_redis_probe(serve: Callable[[Handler], Tuple[int, List[int]]]) -> None:
+    def handler(conn: socket.socket, number: int) -> None:  # pylint: disable=unused-argument
+        for reply in (b"-LOADING Redis is loading the dataset in memory\r\n", b"+PONG\r\n"):
+            assert read_exactly(conn, 6) == b"PING\r\n"
+            conn.sendall(reply)
+
+    port, connections = serve(handler)
+    probe = RedisProbe("127.0.0.1", port)
+    assert [probe(), probe()] == [False, True]
+    assert connections == [0]
+    probe.close()
+
+
+def test_postgres_probe(serve: Callable[[Handler], Tuple[int, List[int]]]) -> None:
+    def handler(conn: socket.socket, number: int) -> None:
+        (length,) = struct.unpack("!i", read_exactly(conn, 4))
+        assert b"user\0postgres\0" in read_exactly(conn, length - 4)
+        if number == 0:
+            fields = b"SFATAL\0C57P03\0Mthe database system is starting up\0\0"
+            conn.sendall(b"E" + struct.pack("!i", 4 + len(fields)) + fields)
+        else:
+            conn.sendall(b"R" + struct.pack("!ii", 8, 5) + b"salt")
+
+    port, connections = serve(handler)
+    probe = PostgresProbe("127.0.0.1", port)
+    assert [probe(), probe()] == [False, True]
+    assert connections == [0, 1]
+
+
+def test_kafka_probe(serve: Callable[[Handler], Tuple[int, List[int]]]) -> None:
+    def handler(conn: socket.socket, number: int) -> None:  # pylint: disable=unused-argument
+        for error_code in (35, 0):
+            (size,) = struct.unpack("!i", read_exactly(conn, 4))
+            api_key, _, correlation_id = struct.unpack("!hhi", read_exactly(conn, size)[:8])
+            assert api_key == 18
+            response = struct.pack("!ihi", correlation_id, error_code, 0)
+            conn.sendall(struct.pack("!i", len(response)) + response)
+
+    port, connections = serve(handler)
+    probe = KafkaProbe("127.0.0.1", port)
+    assert [probe(), probe()] == [False, True]
+    assert connections == [0]
+    probe.close()
+
+
+def test_services_wait_for_probes(serve: Callable[[Handler], Tuple[int, List[int]]]) -> None:
+    def handler(conn: socket.socket, number: int) -> None:  # pylint: disable=unused-argument
+        while read_exactly(conn, 6) == b"PING\r\n":
+            conn.sendall(b"+PONG\r\n")
+
+    port, _ = serve(handler)
+    services = Services(DockerComposeExecutor("docker compose", "docker-compose.yml", "pytest123"))
+    with mock.patch.object(Services, "port_for", return_value=port) as port_for:
+        cache = services.probe("127.0.0.1", "cache", 6379, RedisProbe, timeout=0.5)
+        db = services.probe("127.0.0.1", "db", 5432)
+    assert isinstance(cache, RedisProbe) and cache.timeout == 0.5
+    assert port_for.call_args_list == [mock.call("cache", 6379), mock.call("db", 5432)]
+
+    services.wait_for_probes({"cache": cache, "db": db}, timeout=5)
+
+    with socket.socket() as unused:
+        unused.bind(("127.0.0.1", 0))
+        missing = TCPProbe("127.0.0.1", unused.getsockname()[1])
+        with pytest.raises(Exception, match="services: queue!"):
+            services.wait_for_probes({"cache": cache, "queue": missing}, timeout=0.3, pause=0.05)
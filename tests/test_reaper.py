@@ -0,0 +1,138 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from pytest_docker.admission import AdmissionController
+from pytest_docker.plugin import (
+    BACKGROUND_CLEANUPS,
+    DockerComposeExecutor,
+    find_failed_cleanups,
+    spawn_cleanup,
+    stop_stack,
+)
+from pytest_docker.ports import PortBroker
+from pytest_docker.reaper import main
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="uses POSIX shell commands")
+
+
+def _wait_for(log: str) -> str:
+    pidfile = log[: -len(".log")] + ".pid"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if os.path.exists(log) and not os.path.exists(pidfile):
+            with open(log, encoding="utf-8") as content:
+                return content.read()
+        time.sleep(0.05)
+    raise AssertionError("background clean-up did not finish")
+
+
+def test_background_cleanup() -> None:
+    project_name = "pytest{}".format(uuid.uuid4().hex[:8])
+    docker_compose = DockerComposeExecutor("echo", "docker-compose.yml", project_name)
+
+    pid, log = spawn_cleanup(docker_compose, ["down -v", "ps"])
+    assert pid != os.getpid()
+
+    output = _wait_for(log)
+    assert '-f docker-compose.yml -p {} down -v\n'.format(project_name) in output
+    assert output.endswith("DONE\n")
+
+    assert log not in find_failed_cleanups()
+    assert not os.path.exists(log)
+
+
+def test_background_cleanup_failure() -> None:
+    project_name = "pytest{}".format(uuid.uuid4().hex[:8])
+    docker_compose = DockerComposeExecutor("false", "docker-compose.yml", project_name)
+
+    _, log = spawn_cleanup(docker_compose, ["down -v"])
+    assert "FAILED" in _wait_for(log)
+
+    assert log in find_failed_cleanups()
+    os.remove(log)
+
+
+def test_reaper_rewrites_log(tmp_path: Path) -> None:
+    log = str(tmp_path / "pytest123-cleanup.log")
+    args = ["--pidfile", str(tmp_path / "pytest123-cleanup.pid"), "--log", log, "--"]
+
+    assert main(args + [json.dumps(["false"])]) == 1
+    with mock.patch("pytest_docker.plugin.user_state_dir", return_value=str(tmp_path)):
+        assert find_failed_cleanups() == [log]
+
+        # The previous run does not count, nor does the output of a command
+        # mentioning a failure.
+        assert main(args + [json.dumps(["echo", "FAILED"])]) == 0
+        with open(log, encoding="utf-8") as content:
+            assert content.read() == "$ echo FAILED\nFAILED\nDONE\n"
+        assert find_failed_cleanups() == []
+    assert not os.path.exists(log)
+
+
+def test_find_failed_cleanups_tolerates_races(tmp_path: Path) -> None:
+    (tmp_path / "pytest123-cleanup.log").write_text("FAILED: docker compose down returned 1\n")
+    with mock.patch("pytest_docker.plugin.user_state_dir", return_value=str(tmp_path)):
+        with mock.patch("builtins.open", side_effect=FileNotFoundError):
+            assert find_failed_cleanups() == []
+        with mock.patch("os.remove", side_effect=PermissionError):
+            (tmp_path / "pytest456-cleanup.log").write_text("DONE\n")
+            assert find_failed_cleanups() == [str(tmp_path / "pytest123-cleanup.log")]
+
+
+def test_killed_reaper(tmp_path: Path) -> None:
+    finished = subprocess.Popen([sys.executable, "-c", "pass"])
+    finished.wait()
+    (tmp_path / "pytest123-cleanup.pid").write_text(str(finished.pid))
+    (tmp_path / "pytest123-cleanup.log").write_text("$ docker compose down\n")
+    (tmp_path / "pytest456-cleanup.pid").write_text(str(os.getpid()))
+    (tmp_path / "pytest456-cleanup.log").write_text("$ docker compose down\n")
+
+    with mock.patch("pytest_docker.plugin.user_state_dir", return_value=str(tmp_path)):
+        assert find_failed_cleanups() == [str(tmp_path / "pytest123-cleanup.log")]
+    assert not (tmp_path / "pytest123-cleanup.pid").exists()
+    assert (tmp_path / "pytest456-cleanup.pid").exists()
+
+
+def test_reaper_releases_project(tmp_path: Path) -> None:
+    port_broker = PortBroker(str(tmp_path / "ports.json"))
+    admission = AdmissionController(str(tmp_path / "admission.json"))
+    port_broker.allocate("pytest123", 2)
+    admission.try_acquire("pytest123", (1024, 1))
+
+    args = ["--pidfile", str(tmp_path / "pytest123-cleanup.pid"), "--log", str(tmp_path / "pytest123-cleanup.log")]
+    args += ["--project", "pytest123", "--port-registry", port_broker.registry]
+    (tmp_path / "pytest123-ports.yml").write_text("services: {}\n")
+    args += ["--admission-registry", admission.registry, "--remove", str(tmp_path / "pytest123-ports.yml")]
+    assert main(args + ["--", json.dumps(["false"])]) == 1
+    assert not (tmp_path / "pytest123-ports.yml").exists()
+
+    assert json.loads((tmp_path / "ports.json").read_text()) == {"allocations": {}}
+    assert json.loads((tmp_path / "admission.json").read_text()) == {"admissions": {}}
+
+
+def test_background_cleanup_holds_project(tmp_path: Path) -> None:
+    project_name = "pytest{}".format(uuid.uuid4().hex[:8])
+    sleep = "{} -c 'import time; time.sleep(0.5)'".format(sys.executable)
+    docker_compose = DockerComposeExecutor(sleep, "docker-compose.yml", project_name)
+    port_broker = PortBroker(str(tmp_path / "ports.json"))
+    admission = AdmissionController(str(tmp_path / "admission.json"))
+    port_broker.allocate(project_name, 1)
+    admission.try_acquire(project_name, (1024, 1))
+
+    stop_stack(docker_compose, "down -v", cleanup_in_background=True, port_broker=port_broker, admission=admission)
+    _, pid, log = BACKGROUND_CLEANUPS.pop()
+    allocations = json.loads((tmp_path / "ports.json").read_text())["allocations"]
+    admissions = json.loads((tmp_path / "admission.json").read_text())["admissions"]
+    assert [entry["pid"] for entry in list(allocations.values()) + list(admissions.values())] in ([pid, pid], [])
+
+    assert _wait_for(log).endswith("DONE\n")
+    assert json.loads((tmp_path / "ports.json").read_text()) == {"allocations": {}}
+    assert json.loads((tmp_path / "admission.json").read_text()) == {"admissions": {}}
+    os.remove(log)
@@ -0,0 +1,103 @@
+import json
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+import pytest
+import pytest_docker
+from _pytest.pytester import Pytester
+from pytest_docker.plugin import DockerComposeExecutor, Services
+from pytest_docker.timing import TimingRecorder
+
+
+def test_measure() -> None:
+    recorder = TimingRecorder()
+    with recorder.measure("command", "up --wait", "pytest123"):
+        pass
+    with pytest.raises(ValueError):
+        with recorder.measure("port", "hello:80", "pytest123", "hello"):
+            raise ValueError()
+
+    command, port = recorder.timings()
+    assert command.describe() == "command up --wait [pytest123]"
+    assert port.describe() == "port hello:80 [pytest123, hello] (failed)"
+    assert port.duration >= 0
+    assert len(recorder.slowest(1)) == 1
+
+    recorder.clear()
+    assert recorder.timings() == []
+
+
+def test_export(tmp_path: Path) -> None:
+    recorder = TimingRecorder()
+    with recorder.measure("wait", "hello", "pytest123", "hello"):
+        pass
+
+    trace = tmp_path / "trace" / "docker.json"
+    recorder.export(str(trace))
+    (span,) = json.loads(trace.read_text())["spans"]
+    assert span["name"] == "wait hello"
+    assert span["end_time_unix_nano"] >= span["start_time_unix_nano"]
+    assert span["attributes"] == {
+        "docker.kind": "wait",
+        "docker.compose.project": "pytest123",
+        "docker.compose.service": "hello",
+    }
+
+
+def test_services_are_timed() -> None:
+    docker_compose = DockerComposeExecutor("docker compose", "docker-compose.yml", "pytest123")
+    services = Services(docker_compose)
+    with mock.patch("pytest_docker.plugin.RECORDER", TimingRecorder()) as recorder:
+        with mock.patch("subprocess.check_output", return_value=b"0.0.0.0:32770"):
+            services.port_for("hello", 80)
+            services.port_for("hello", 80)
+        services.wait_until_responsive(check=lambda: True, timeout=1.0, pause=0.1, service="hello")
+
+    assert [timing.describe() for timing in recorder.timings()] == [
+        "command port hello 80 [pytest123]",
+        "port hello:80 [pytest123, hello]",
+        "wait hello [pytest123, hello]",
+    ]
+
+
+def test_durations_report(pytester: Pytester, tmp_path: Path) -> None:
+    pytester.makepyfile(
+        """
+        def test_timed(docker_services):
+            pass
+    """
+    )
+
+    trace = tmp_path / "trace.json"
+    with mock.patch("subprocess.check_output", return_value=b""):
+        result = pytester.runpytest("--docker-durations=0", "--docker-trace={}".format(trace))
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(["*slowest docker durations*", "*s command up --build --wait *"])
+    assert len(json.loads(trace.read_text())["spans"]) == 3
+
+
+def test_xdist_workers_hand_over_timings(tmp_path: Path) -> None:
+    trace = tmp_path / "trace.json"
+    worker_recorder = TimingRecorder()
+    with worker_recorder.measure("command", "up --wait", "pytest123"):
+        pass
+
+    def getoption(name: str, default: Any = None) -> Any:
+        return str(trace) if name == "--docker-trace" else default
+
+    worker = mock.Mock(workerinput={}, workeroutput={})
+    worker.getoption.side_effect = getoption
+    with mock.patch("pytest_docker.RECORDER", worker_recorder):
+        pytest_docker.pytest_sessionfinish(mock.Mock(config=worker))
+    assert not trace.exists()
+
+    controller_recorder = TimingRecorder()
+    controller = mock.Mock(spec=["getoption"])
+    controller.getoption.side_effect = getoption
+    with mock.patch("pytest_docker.RECORDER", controller_recorder):
+        pytest_docker.pytest_testnodedown(mock.Mock(workeroutput=worker.workeroutput), None)
+        pytest_docker.pytest_sessionfinish(mock.Mock(config=controller))
+
+    assert controller_recorder.timings() == worker_recorder.timings()
+    assert json.loads(trace.read_text())["spans"][0]["name"] == "command up --wait"
@@ -0,0 +1,110 @@
+import json
+import os
+from typing import Any, List
+from unittest import mock
+
+import pytest
+from pytest_docker.locking import user_state_dir
+from pytest_docker.plugin import (
+    DockerComposeExecutor,
+    Services,
+    get_cleanup_command,
+    get_docker_services,
+    get_setup_command,
+)
+from pytest_docker.volumes import named_volumes, override_tmpfs, project_volumes
+
+CONFIG = {
+    "services": {
+        "db": {
+            "volumes": [
+                {"type": "volume", "source": "pgdata", "target": "/var/lib/postgresql/data", "volume": {}},
+                {"type": "bind", "source": "/src/init.sql", "target": "/docker-entrypoint-initdb.d/init.sql"},
+            ]
+        },
+        "queue": {"volumes": [{"type": "volume", "source": "kafka", "target": "/var/lib/kafka/data"}]},
+        "web": {"volumes": [{"type": "volume", "target": "/tmp/cache"}]},
+    },
+    "volumes": {"pgdata": {"name": "pytest123_pgdata"}, "kafka": {"name": "shared", "external": True}},
+}
+
+
+def test_override_tmpfs() -> None:
+    assert named_volumes(CONFIG) == ["pgdata", "kafka"]
+
+    assert override_tmpfs(CONFIG, ["pgdata"], "256m") == (
+        "services:\n"
+        '  "db":\n'
+        "    volumes: !override\n"
+        '      - {"type": "tmpfs", "target": "/var/lib/postgresql/data", "tmpfs": {"size": "256m"}}\n'
+        '      - {"type": "bind", "source": "/src/init.sql", "target": "/docker-entrypoint-initdb.d/init.sql"}\n'
+    )
+    override = override_tmpfs(CONFIG, None, "1g")
+    assert override is not None and '"queue"' in override and '"web"' not in override
+    assert override_tmpfs(CONFIG, ["other"], "1g") is None
+
+
+def test_docker_services_tmpfs() -> None:
+    commands: List[List[str]] = []
+
+    def run(args: List[str], **kwargs: Any) -> bytes:  # pylint: disable=unused-argument
+        commands.append(args)
+        return json.dumps(CONFIG).encode() if "config" in args else b""
+
+    with mock.patch("subprocess.check_output", side_effect=run):
+        with get_docker_services(
+            "docker compose",
+            "docker-compose.yml",
+            docker_compose_project_name="pytest123",
+            docker_setup=get_setup_command(),
+            docker_cleanup=get_cleanup_command(),
+            tmpfs_volumes=True,
+        ):
+            override = commands[1][commands[1].index("-p") - 1]
+            assert override == os.path.join(user_state_dir(), "pytest123-tmpfs.yml")
+            with open(override, encoding="utf-8") as override_file:
+                assert '"size": "512m"' in override_file.read()
+
+    assert all(override in command for command in commands[1:])
+    assert not os.path.exists(override)
+
+
+def tail(command: List[str]) -> List[str]:
+    """Last arguments of a command, without the script of `docker run`."""
+
+    return command[-4:-1] if "run" in command else command[-3:]
+
+
+def test_checkpoint_and_restore() -> None:
+    commands: List[List[str]] = []
+
+    def run(args: List[str], **kwargs: Any) -> bytes:  # pylint: disable=unused-argument
+        commands.append(args)
+        return json.dumps(CONFIG).encode() if "config" in args else b""
+
+    assert project_volumes(CONFIG) == {"pgdata": "pytest123_pgdata"}
+    services = Services(DockerComposeExecutor("docker compose", "docker-compose.yml", "pytest123"))
+    with mock.patch("subprocess.check_output", side_effect=run):
+        with pytest.raises(ValueError):
+            services.restore("seeded")
+
+        services.checkpoint("seeded")
+        assert [tail(command) for command in commands[1:]] == [
+            ["pytest123", "stop", "db"],
+            ["volume", "create", "pytest123_pgdata.checkpoint-seeded"],
+            ["busybox", "sh", "-c"],
+            ["pytest123", "start", "db"],
+        ]
+        assert "pytest123_pgdata:/from:ro" in commands[3] and "pytest123_pgdata.checkpoint-seeded:/to" in commands[3]
+
+        del commands[:]
+        services.restore("seeded")
+        assert [tail(command) for command in commands] == [
+            ["pytest123", "stop", "db"],
+            ["busybox", "sh", "-c"],
+            ["pytest123", "start", "db"],
+        ]
+        assert "pytest123_pgdata.checkpoint-seeded:/from:ro" in commands[1]
+
+        services.close()
+        assert commands[-1][-3:] == ["rm", "--force", "pytest123_pgdata.checkpoint-seeded"]
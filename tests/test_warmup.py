@@ -0,0 +1,68 @@
+import json
+import subprocess
+import threading
+from pathlib import Path
+from typing import Any, List
+from unittest import mock
+
+from pytest_docker.compose import ComposeModel
+from pytest_docker.plugin import WARMUP_RESULTS, DockerComposeExecutor, warmup
+from pytest_docker.warmup import base_images, warmup_images
+
+
+def test_base_images(tmp_path: Path) -> None:
+    dockerfile = tmp_path / "Dockerfile"
+    dockerfile.write_text(
+        "ARG VERSION=3.12\n"
+        "FROM --platform=linux/amd64 python:3.12 AS builder\n"
+        "FROM builder AS test\n"
+        "from python:${VERSION}-slim\n"
+        "FROM scratch\n"
+        "FROM python:3.12 # again\n"
+        "COPY --from=builder /app /app\n"
+    )
+
+    assert base_images(str(dockerfile)) == ["python:3.12"]
+    assert base_images(str(tmp_path / "missing")) == []
+
+
+def test_warmup_images(tmp_path: Path) -> None:
+    (tmp_path / "Dockerfile").write_text("FROM postgres:16\n")
+    model = ComposeModel.from_config(
+        {
+            "services": {
+                "db": {"image": "postgres:16"},
+                "app": {"build": {"context": str(tmp_path), "dockerfile": "Dockerfile"}, "image": "app:dev"},
+                "cache": {"image": "redis:7"},
+            }
+        }
+    )
+
+    assert warmup_images(model) == ["postgres:16", "redis:7"]
+
+
+def test_warmup() -> None:
+    config = json.dumps({"services": {"db": {"image": "postgres"}, "cache": {"image": "redis"}}}).encode()
+    barrier = threading.Barrier(2, timeout=5)
+
+    def run(args: List[str], **kwargs: Any) -> bytes:  # pylint: disable=unused-argument
+        if "config" in args:
+            return config
+        if args[1] == "pull":
+            # Only returns if both images are pulled at the same time.
+            barrier.wait()
+            if args[-1] == "redis":
+                raise subprocess.CalledProcessError(1, args, b"pull access denied for redis")
+            return b""
+        return b"1500000\n"
+
+    docker_compose = DockerComposeExecutor("docker compose", "docker-compose.yml", "pytest123")
+    with mock.patch("subprocess.check_output", side_effect=run):
+        results = warmup(docker_compose, max_workers=2)
+
+    assert [(result.image, result.size) for result in results] == [("postgres", 1500000), ("redis", None)]
+    assert results[0].error is None
+    assert "pull access denied for redis" in str(results[1].error)
+    assert results[0].describe().endswith("postgres (1.5 MB)")
+    assert WARMUP_RESULTS[-2:] == results
+    del WARMUP_RESULTS[:]